@@ -0,0 +1,485 @@
+#
+# Stand-in for gdb's `gdb` Python module, so gdb_commands.py can be driven
+# outside a debugger. Nothing is emulated: a Recording lists the code that
+# can be disassembled, the pcs the inferior executes in order, its memory
+# image and registers, and stepi/continue just move along the pc stream.
+# Put this directory first on sys.path, then `import gdb_commands`.
+#
+# Only what gdb_commands.py uses is provided. Calls into the fake are
+# counted and timed in STATS, so a benchmark can take them out of its
+# numbers.
+
+import bisect
+import functools
+import json
+import re
+import shlex
+import time
+from pathlib import Path
+
+COMMAND_DATA = 1
+COMMAND_RUNNING = 2
+COMMAND_STATUS = 3
+TYPE_CODE_PTR = 1
+TYPE_CODE_INT = 8
+TYPE_CODE_STRUCT = 3
+
+PID = 4242
+STATS = {"calls": {}, "time": 0.0}
+
+
+class error(RuntimeError):
+    pass
+
+
+_depth = 0
+
+
+def _timed(function):
+    """Count calls of function into STATS and add its time, outside of
+    other fake calls, to STATS["time"]."""
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        global _depth
+        if _depth:
+            return function(*args, **kwargs)
+        STATS["calls"][name] = STATS["calls"].get(name, 0) + 1
+        _depth += 1
+        begin = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            STATS["time"] += time.perf_counter() - begin
+            _depth -= 1
+    return wrapper
+
+
+class Recording:
+    """What the fake inferior runs and holds.
+
+    arch: gdb architecture name, e.g. "i386:x86-64" or "aarch64".
+    instructions: [address, length, asm] of all code that can be disassembled.
+    stream: the pcs executed, in order; the inferior exits after the last.
+    memory: [address, bytes] segments that can be read and written.
+    registers: register name -> value for the selected frame.
+    symbols: name -> address of the objects parse_and_eval() can see.
+    text: [start, end) ranges reported as .text by `info files`.
+    """
+
+    def __init__(self, arch="i386:x86-64", instructions=(), stream=(), memory=(),
+                 registers=None, symbols=None, text=()):
+        self.arch = arch
+        self.instructions = [tuple(insn) for insn in instructions]
+        self.stream = list(stream)
+        self.memory = [(address, bytes(data)) for address, data in memory]
+        self.registers = dict(registers or {})
+        self.symbols = dict(symbols or {})
+        self.text = [tuple(section) for section in text]
+
+    @classmethod
+    def load(cls, path):
+        """Read a recording saved by save(): JSON, memory as hex strings."""
+        raw = json.loads(Path(path).read_text())
+        raw["memory"] = [(address, bytes.fromhex(data)) for address, data in raw.get("memory", ())]
+        return cls(**raw)
+
+    def save(self, path):
+        raw = dict(vars(self), memory=[(address, data.hex()) for address, data in self.memory])
+        Path(path).write_text(json.dumps(raw) + "\n")
+
+
+class _Inferior:
+    num = 1
+
+    def __init__(self, recording):
+        self.recording = recording
+        self.code = {address: (length, asm) for address, length, asm in recording.instructions}
+        self.code_order = sorted(self.code)
+        self.memory = sorted((address, bytearray(data)) for address, data in recording.memory)
+        self.memory_starts = [address for address, _ in self.memory]
+        # pc -> positions in the stream, for continue to jump ahead
+        self.positions = {}
+        for position, pc in enumerate(recording.stream):
+            self.positions.setdefault(pc, []).append(position)
+        self.registers = dict(recording.registers)
+        self.position = 0
+        self.breakpoints = {}
+        self.parameters = {"scheduler-locking": "replay", "non-stop": False}
+        self.thread = InferiorThread()
+
+    @property
+    def pid(self):
+        return PID if self.position < len(self.recording.stream) else 0
+
+    @property
+    def pc(self):
+        if not self.pid:
+            raise error("No registers.")
+        return self.recording.stream[self.position]
+
+    def threads(self):
+        return (self.thread,) if self.pid else ()
+
+    def _segment(self, address, size):
+        index = bisect.bisect_right(self.memory_starts, address) - 1
+        if index >= 0:
+            start, data = self.memory[index]
+            if address + size <= start + len(data):
+                return start, data
+        raise error(f"Cannot access memory at address {address:#x}")
+
+    @_timed
+    def read_memory(self, address, size):
+        start, data = self._segment(address, size)
+        return memoryview(bytes(data[address - start:address - start + size]))
+
+    def write_memory(self, address, buffer):
+        start, data = self._segment(address, len(buffer))
+        data[address - start:address - start + len(buffer)] = bytes(buffer)
+        for handler in events.memory_changed.handlers:
+            handler(_MemoryChangedEvent(address, len(buffer)))
+
+
+class InferiorThread:
+    num = 1
+    global_num = 1
+
+    def is_valid(self):
+        return _inferior is not None and bool(_inferior.pid)
+
+    def switch(self):
+        pass
+
+
+class _Event:
+    def __init__(self):
+        self.handlers = []
+
+    def connect(self, handler):
+        self.handlers.append(handler)
+
+    def disconnect(self, handler):
+        self.handlers.remove(handler)
+
+
+class _MemoryChangedEvent:
+    def __init__(self, address, length):
+        self.address = address
+        self.length = length
+
+
+class events:
+    memory_changed = _Event()
+    new_objfile = _Event()
+    clear_objfiles = _Event()
+    exited = _Event()
+
+
+_inferior = None
+_breakpoint_number = 0
+
+
+def replay(recording):
+    """Start recording's inferior from its first pc, as if a new program
+    was loaded: listeners see clear_objfiles."""
+    global _inferior
+    _inferior = _Inferior(recording)
+    for handler in events.clear_objfiles.handlers:
+        handler(None)
+
+
+def restart():
+    """Rewind the current inferior to its first pc, keeping what the
+    commands have cached about it."""
+    _inferior.position = 0
+    _inferior.breakpoints.clear()
+    _inferior.registers = dict(_inferior.recording.registers)
+
+
+def position():
+    """Number of stream entries executed so far."""
+    return _inferior.position
+
+
+def reset_stats():
+    STATS["calls"] = {}
+    STATS["time"] = 0.0
+
+
+class Command:
+    def __init__(self, name, command_class, *args):
+        self.name = name
+
+    def dont_repeat(self):
+        pass
+
+
+def string_to_argv(argument):
+    return shlex.split(argument)
+
+
+def parameter(name):
+    return _inferior.parameters[name]
+
+
+class Type:
+    def __init__(self, code, sizeof, name):
+        self.code = code
+        self.sizeof = sizeof
+        self.name = name
+
+    def strip_typedefs(self):
+        return self
+
+    def pointer(self):
+        return Type(TYPE_CODE_PTR, 8, f"{self.name} *")
+
+    def __str__(self):
+        return self.name
+
+
+class Value:
+    def __init__(self, value, type, address=None):
+        self._value = value
+        self.type = type
+        self.address = address
+
+    def __int__(self):
+        return self._value
+
+    __index__ = __int__
+
+
+def lookup_type(name):
+    return Type(TYPE_CODE_INT, 1 if name == "void" else 8, name)
+
+
+_DEREFERENCE = re.compile(r"^\*\(unsigned (short|int|long) \*\)\s*(\S+)$")
+_WIDTHS = {"short": 2, "int": 4, "long": 8}
+
+
+@_timed
+def parse_and_eval(expression):
+    expression = expression.strip()
+    dereference = _DEREFERENCE.match(expression)
+    if dereference:
+        width = _WIDTHS[dereference.group(1)]
+        address = int(parse_and_eval(dereference.group(2)))
+        data = bytes(_inferior.read_memory(address, width))
+        return Value(int.from_bytes(data, "little"), lookup_type(dereference.group(1)))
+    if expression.startswith("&") and expression[1:] in _inferior.recording.symbols:
+        return Value(_inferior.recording.symbols[expression[1:]], Type(TYPE_CODE_PTR, 8, "void *"))
+    if expression in _inferior.recording.symbols:
+        address = _inferior.recording.symbols[expression]
+        return Value(0, Type(TYPE_CODE_STRUCT, 0, expression), Value(address, Type(TYPE_CODE_PTR, 8, "void *")))
+    if expression.startswith("$"):
+        try:
+            return Frame().read_register(expression[1:])
+        except ValueError:
+            pass
+    try:
+        return Value(int(expression, 0), lookup_type("long"))
+    except ValueError:
+        raise error(f'No symbol "{expression}" in current context.') from None
+
+
+class Architecture:
+    def __init__(self, name):
+        self._name = name
+
+    def name(self):
+        return self._name
+
+    @_timed
+    def disassemble(self, start_pc, end_pc=None, count=None):
+        code = _inferior.code
+        if start_pc not in code:
+            raise error(f"Cannot access memory at address {start_pc:#x}")
+        if end_pc is None and count is None:
+            count = 1
+        result = []
+        index = bisect.bisect_left(_inferior.code_order, start_pc)
+        address = start_pc
+        while (count is None or len(result) < count) and (end_pc is None or address <= end_pc):
+            if index == len(_inferior.code_order) or _inferior.code_order[index] != address:
+                break
+            length, asm = code[address]
+            result.append({"addr": address, "asm": asm, "length": length})
+            address += length
+            index += 1
+        return result
+
+
+class Frame:
+    @_timed
+    def pc(self):
+        return _inferior.pc
+
+    def architecture(self):
+        return Architecture(_inferior.recording.arch)
+
+    @_timed
+    def read_register(self, name):
+        if name == "pc":
+            return Value(_inferior.pc, lookup_type("long"))
+        if name not in _inferior.registers:
+            raise ValueError(f"Bad register {name}")
+        return Value(_inferior.registers[name], lookup_type("long"))
+
+
+@_timed
+def selected_frame():
+    if _inferior is None or not _inferior.pid:
+        raise error("No frame is currently selected.")
+    return Frame()
+
+
+def selected_inferior():
+    return _inferior
+
+
+def selected_thread():
+    return _inferior.thread if _inferior.pid else None
+
+
+class Objfile:
+    build_id = None
+
+    def __init__(self, filename):
+        self.filename = filename
+
+
+class Progspace:
+    filename = "/fake/program"
+
+
+def objfiles():
+    return [Objfile(Progspace.filename)]
+
+
+def current_progspace():
+    return Progspace()
+
+
+class Breakpoint:
+    @_timed
+    def __init__(self, spec, type=None, wp_class=None, internal=False, temporary=False):
+        global _breakpoint_number
+        if not spec.startswith("*"):
+            raise error(f'Function "{spec}" not defined.')
+        self.location = int(spec[1:], 0)
+        self.internal = internal
+        self.temporary = temporary
+        self.thread = None
+        _breakpoint_number += 1
+        self.number = -_breakpoint_number if internal else _breakpoint_number
+        _inferior.breakpoints[self.number] = self
+
+    def is_valid(self):
+        return self.number in _inferior.breakpoints
+
+    @_timed
+    def delete(self):
+        del _inferior.breakpoints[self.number]
+
+
+def _continue():
+    """Move to the next stream entry that has a breakpoint, or to the end."""
+    inferior = _inferior
+    stream = inferior.recording.stream
+    stop = len(stream)
+    for bp in inferior.breakpoints.values():
+        positions = inferior.positions.get(bp.location, ())
+        index = bisect.bisect_right(positions, inferior.position)
+        if index < len(positions):
+            stop = min(stop, positions[index])
+    inferior.position = stop
+    if stop == len(stream):
+        for handler in events.exited.handlers:
+            handler(None)
+        return f"[Inferior 1 (process {PID}) exited normally]\n"
+    hit = [bp for bp in inferior.breakpoints.values() if bp.location == stream[stop]]
+    report = ""
+    for bp in hit:
+        if bp.temporary:
+            bp.delete()
+        if not bp.internal:
+            kind = "Temporary breakpoint" if bp.temporary else "Breakpoint"
+            report = f"\n{kind} {bp.number}, {stream[stop]:#x} in ?? ()\n"
+    return report
+
+
+def _stepi():
+    _inferior.position += 1
+    if not _inferior.pid:
+        for handler in events.exited.handlers:
+            handler(None)
+        return f"[Inferior 1 (process {PID}) exited normally]\n"
+    return f"{_inferior.pc:#x} in ?? ()\n"
+
+
+def _examine(expression):
+    address = int(parse_and_eval(expression))
+    _, asm = _inferior.code.get(address, (0, "(bad)"))
+    marker = "=> " if _inferior.pid and address == _inferior.pc else "   "
+    return f"{marker}{address:#x}:\t{asm}\n"
+
+
+def _info_files():
+    lines = [f'Symbols from "{Progspace.filename}".', "Local exec file:"]
+    for start, end in _inferior.recording.text:
+        lines.append(f"\t{start:#018x} - {end:#018x} is .text")
+    return "\n".join(lines) + "\n"
+
+
+def _info_proc_mappings():
+    lines = [f"process {PID}", "Mapped address spaces:", "",
+             "          Start Addr           End Addr       Size     Offset  Perms  objfile"]
+    for start, data in _inferior.memory:
+        lines.append(f"{start:#20x} {start + len(data):#18x} {len(data):#10x} {0:#10x}  rw-p   ")
+    return "\n".join(lines) + "\n"
+
+
+@_timed
+def execute(command, from_tty=False, to_string=False):
+    command = command.strip()
+    if command in ("stepi", "si"):
+        output = _stepi()
+    elif command in ("continue", "continue -a", "c"):
+        output = _continue()
+    elif command.startswith("x/i "):
+        output = _examine(command[4:])
+    elif command == "info files":
+        output = _info_files()
+    elif command == "info proc mappings":
+        output = _info_proc_mappings()
+    elif command.startswith("info symbol "):
+        output = f"No symbol matches {command[12:]}.\n"
+    elif command == "show endian":
+        output = "The target endianness is set automatically (currently little endian).\n"
+    elif command.startswith("set scheduler-locking "):
+        _inferior.parameters["scheduler-locking"] = command.split()[-1]
+        output = ""
+    elif command.startswith("set "):
+        target, value = command[4:].split("=", 1)
+        dereference = _DEREFERENCE.match(target.strip())
+        if not dereference:
+            raise error(f"fake gdb: cannot assign to {target.strip()}")
+        width = _WIDTHS[dereference.group(1)]
+        address = int(parse_and_eval(dereference.group(2)))
+        _inferior.write_memory(address, int(parse_and_eval(value)).to_bytes(width, "little"))
+        output = ""
+    elif command.startswith("catch syscall"):
+        raise error("The feature 'catch syscall' is not supported on this architecture yet.")
+    elif command.startswith("delete "):
+        for number in command.split()[1:]:
+            _inferior.breakpoints.pop(int(number), None)
+        output = ""
+    else:
+        raise error(f'fake gdb: unsupported command "{command}"')
+    if to_string:
+        return output
+    print(output, end="")
+    return None
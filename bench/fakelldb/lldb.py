@@ -0,0 +1,578 @@
+#
+# Stand-in for lldb's `lldb` Python module, so the memory decoding in
+# lldb_funcs.py can be exercised outside a debugger. Nothing is emulated: a
+# Target is a triple, a memory image, its modules and their sections, the
+# handle lists class_copy*List returns, the values of a few expressions and
+# the code that can be disassembled. A Thread is a stop reason and a
+# stack of frames that a test sets up before calling into a thread plan.
+# Put this directory first on sys.path, then `import lldb_funcs`.
+#
+# Only what lldb_funcs.py's Objective-C introspection, scripted steps and
+# std::string summaries use is provided; breakpoints are only recorded,
+# never hit. Memory reads, disassembly and expressions are counted in
+# STATS.
+
+import re
+
+ePermissionsReadable = 2
+ePermissionsWritable = 4
+eBasicTypeObjCID = 33
+eSectionTypeCode = 1
+eSectionTypeContainer = 2
+eSectionTypeData = 3
+eStopReasonTrace = 2
+eStopReasonBreakpoint = 3
+eStopReasonSignal = 5
+LLDB_INVALID_ADDRESS = 0xFFFFFFFFFFFFFFFF
+
+STATS = {"reads": 0, "cstring_reads": 0, "instructions": 0, "expressions": []}
+# where AllocateMemory and the class_copy*List results are placed
+_SCRATCH = 0x7F0000000000
+
+
+def reset_stats():
+    STATS.update(reads=0, cstring_reads=0, instructions=0, expressions=[])
+
+
+class SBError:
+    def __init__(self, message=None):
+        self._message = message
+
+    def Success(self):
+        return self._message is None
+
+    def Fail(self):
+        return self._message is not None
+
+    def GetCString(self):
+        return self._message
+
+    def SetErrorString(self, message):
+        self._message = message
+
+
+class SBType:
+    def __init__(self, name=None, size=0, pointee=None, arguments=()):
+        """A type named name; pointee makes it a pointer to that SBType,
+        and arguments are its template arguments' SBTypes."""
+        self._name = name
+        self._size = size
+        self._pointee = pointee
+        self._arguments = list(arguments)
+
+    def IsValid(self):
+        return self._name is not None
+
+    def GetName(self):
+        return self._name
+
+    def GetByteSize(self):
+        return self._size
+
+    def GetCanonicalType(self):
+        return self
+
+    def IsPointerType(self):
+        return self._pointee is not None
+
+    def IsReferenceType(self):
+        return False
+
+    def GetPointeeType(self):
+        return self._pointee or SBType()
+
+    def GetTemplateArgumentType(self, index):
+        return self._arguments[index] if index < len(self._arguments) else SBType()
+
+
+class SBData:
+    def __init__(self, data):
+        self._data = data
+
+    def ReadRawData(self, error, offset, size):
+        if self._data is None or offset + size > len(self._data):
+            error.SetErrorString("unable to read data")
+            return None
+        return self._data[offset:offset + size]
+
+
+class SBValue:
+    def __init__(self, value=None, summary=None, description=None, type=None, address=None, target=None):
+        """An expression result, or with type a variable of that SBType at
+        address in target's memory; value is a pointer variable's value."""
+        self._value = value
+        self._summary = summary
+        self._description = description
+        self._type = type
+        self._address = address
+        self._target = target
+
+    def IsValid(self):
+        return self._value is not None or self._summary is not None or self._type is not None
+
+    def GetError(self):
+        return SBError() if self.IsValid() else SBError("expression failed")
+
+    def GetValueAsUnsigned(self, fail_value=0):
+        return fail_value if self._value is None else self._value
+
+    def GetSummary(self):
+        return self._summary
+
+    def GetObjectDescription(self):
+        return self._description
+
+    def GetType(self):
+        return self._type
+
+    def GetByteSize(self):
+        return self._type.GetByteSize()
+
+    def GetLoadAddress(self):
+        return self._address
+
+    def GetProcess(self):
+        return self._target.GetProcess()
+
+    def GetData(self):
+        return SBData(self._target.read(self._address, self.GetByteSize()))
+
+    def Dereference(self):
+        return SBValue(type=self._type.GetPointeeType(), address=self._value, target=self._target)
+
+
+class SBSection:
+    def __init__(self, name=None, start=LLDB_INVALID_ADDRESS, size=0, section_type=eSectionTypeCode,
+                 subsections=()):
+        """A section loaded at start (LLDB_INVALID_ADDRESS: not loaded)."""
+        self._name = name
+        self.start = start
+        self.size = size
+        self._type = section_type
+        self.subsections = list(subsections)
+        self.module = None
+
+    def IsValid(self):
+        return self._name is not None
+
+    def GetName(self):
+        return self._name
+
+    def GetLoadAddress(self, target):
+        return self.start
+
+    def GetByteSize(self):
+        return self.size
+
+    def GetSectionType(self):
+        return self._type
+
+    def GetNumSubSections(self):
+        return len(self.subsections)
+
+    def GetSubSectionAtIndex(self, index):
+        return self.subsections[index]
+
+
+class SBFileSpec:
+    def __init__(self, filename=None):
+        self._filename = filename
+
+    def GetFilename(self):
+        return self._filename
+
+
+class SBModule:
+    def __init__(self, filename, sections=(), uuid=""):
+        self._filespec = SBFileSpec(filename)
+        self.sections = list(sections)
+        self._uuid = uuid
+        stack = list(self.sections)
+        while stack:
+            section = stack.pop()
+            section.module = self
+            stack.extend(section.subsections)
+
+    def GetFileSpec(self):
+        return self._filespec
+
+    def GetUUIDString(self):
+        return self._uuid
+
+    def section_iter(self):
+        return iter(self.sections)
+
+
+class SBAddress:
+    def __init__(self, load_address, target):
+        self._address = load_address
+        self._target = target
+
+    def GetLoadAddress(self, target):
+        return self._address
+
+    def GetSection(self):
+        """The innermost loaded section holding the address."""
+        found = SBSection()
+        stack = [section for module in self._target.modules for section in module.sections]
+        while stack:
+            section = stack.pop()
+            if section.start != LLDB_INVALID_ADDRESS and section.start <= self._address < section.start + section.size:
+                found = section
+                stack = list(section.subsections)
+        return found
+
+    def GetModule(self):
+        return self.GetSection().module
+
+
+class SBFileSpecList:
+    def __init__(self):
+        self.specs = []
+
+    def Append(self, spec):
+        self.specs.append(spec)
+
+    def GetSize(self):
+        return len(self.specs)
+
+
+class SBBreakpoint:
+    def __init__(self, number, regex, modules):
+        self._id = number
+        self.regex = regex
+        self.modules = [spec.GetFilename() for spec in modules.specs]
+        self.names = []
+        self.one_shot = False
+        self.thread_id = None
+
+    def GetID(self):
+        return self._id
+
+    def AddName(self, name):
+        self.names.append(name)
+        return True
+
+    def SetOneShot(self, one_shot):
+        self.one_shot = one_shot
+
+    def SetThreadID(self, thread_id):
+        self.thread_id = thread_id
+
+
+class SBBreakpointList:
+    def __init__(self, target):
+        self._breakpoints = []
+
+    def Append(self, breakpoint):
+        self._breakpoints.append(breakpoint)
+
+    def GetSize(self):
+        return len(self._breakpoints)
+
+    def GetBreakpointAtIndex(self, index):
+        return self._breakpoints[index]
+
+
+class SBStructuredData:
+    def __init__(self, value=None):
+        """value: a dict of string values, or one string value."""
+        self._value = value
+
+    def IsValid(self):
+        return self._value is not None
+
+    def GetValueForKey(self, key):
+        return SBStructuredData(self._value.get(key) if isinstance(self._value, dict) else None)
+
+    def GetStringValue(self, max_length):
+        return self._value[:max_length] if isinstance(self._value, str) else ""
+
+
+class SBInstruction:
+    def __init__(self, length, asm):
+        self._length = length
+        mnemonic, _, operands = asm.partition(" ")
+        self._mnemonic = mnemonic
+        self._operands = operands.strip()
+
+    def GetMnemonic(self, target):
+        return self._mnemonic
+
+    def GetOperands(self, target):
+        return self._operands
+
+    def GetByteSize(self):
+        return self._length
+
+
+class SBEvent:
+    pass
+
+
+class SBListener:
+    def __init__(self, name):
+        self.events = []
+
+    def GetNextEvent(self, event):
+        if self.events:
+            self.events.pop(0)
+            return True
+        return False
+
+
+class _Broadcaster:
+    def __init__(self):
+        self.listeners = []
+
+    def AddListener(self, listener, mask):
+        self.listeners.append(listener)
+        return mask
+
+
+class SBProcess:
+    def __init__(self, target):
+        self._target = target
+
+    def GetUniqueID(self):
+        return 1
+
+    def GetTarget(self):
+        return self._target
+
+    def ReadMemory(self, address, size, error):
+        STATS["reads"] += 1
+        data = self._target.read(address, size)
+        if data is None:
+            error.SetErrorString(f"memory read failed for {address:#x}")
+        return data
+
+    def ReadCStringFromMemory(self, address, size, error):
+        STATS["cstring_reads"] += 1
+        for start, data in self._target.memory:
+            if start <= address < start + len(data):
+                text = data[address - start:].split(b"\0", 1)[0][:size]
+                return text.decode("utf-8", "replace")
+        error.SetErrorString(f"memory read failed for {address:#x}")
+        return None
+
+    def ReadUnsignedFromMemory(self, address, size, error):
+        data = self.ReadMemory(address, size, error)
+        return int.from_bytes(data, "little") if data is not None else 0
+
+    def WriteMemory(self, address, data, error):
+        if not self._target._write(address, data):
+            error.SetErrorString(f"memory write failed for {address:#x}")
+            return 0
+        return len(data)
+
+    def AllocateMemory(self, size, permissions, error):
+        return self._target.allocate(bytes(size))
+
+    def DeallocateMemory(self, address, error):
+        return error
+
+
+class SBTarget:
+    eBroadcastBitModulesLoaded = 1 << 1
+    eBroadcastBitModulesUnloaded = 1 << 2
+
+    def __init__(self, triple="x86_64-unknown-linux-gnu", memory=(), sections=None, lists=None,
+                 expressions=None, modules=None, instructions=None):
+        """memory: [address, bytes] segments. sections: name -> [start, end)
+        of data sections in a main executable "a.out", unless modules gives
+        the SBModules, main executable first. lists: "Method"/"Property"/
+        "Ivar" -> the handles class_copy*List returns. expressions:
+        expression text -> SBValue. instructions: address -> (length, asm)
+        of the code that can be disassembled."""
+        self.triple = triple
+        self.memory = [(address, bytearray(data)) for address, data in memory]
+        if modules is None:
+            modules = [SBModule("a.out", [
+                SBSection(name, start, end - start, eSectionTypeData) for name, (start, end) in (sections or {}).items()
+            ])]
+        self.modules = list(modules)
+        self.instructions = dict(instructions or {})
+        # breakpoint ID -> SBBreakpoint; IDs aren't reused
+        self.breakpoints = {}
+        self._breakpoint_ids = 0
+        self.lists = dict(lists or {})
+        self.expressions = dict(expressions or {})
+        self._process = SBProcess(self)
+        self._broadcaster = _Broadcaster()
+        self._scratch = _SCRATCH
+
+    def read(self, address, size):
+        for start, data in self.memory:
+            if start <= address and address + size <= start + len(data):
+                return bytes(data[address - start:address - start + size])
+        return None
+
+    def allocate(self, data):
+        address = self._scratch
+        self.memory.append((address, bytearray(data)))
+        self._scratch += (len(data) + 15) & ~15
+        return address
+
+    def _write(self, address, data):
+        for start, segment in self.memory:
+            if start <= address and address + len(data) <= start + len(segment):
+                segment[address - start:address - start + len(data)] = data
+                return True
+        return False
+
+    def GetTriple(self):
+        return self.triple
+
+    def GetProcess(self):
+        return self._process
+
+    def GetBroadcaster(self):
+        return self._broadcaster
+
+    def ResolveLoadAddress(self, address):
+        return SBAddress(address, self)
+
+    def GetModuleAtIndex(self, index):
+        return self.modules[index]
+
+    def module_iter(self):
+        return iter(self.modules)
+
+    def BreakpointCreateByRegex(self, regex, modules, comp_units):
+        self._breakpoint_ids += 1
+        breakpoint = self.breakpoints[self._breakpoint_ids] = SBBreakpoint(self._breakpoint_ids, regex, modules)
+        return breakpoint
+
+    def BreakpointDelete(self, number):
+        return self.breakpoints.pop(number, None) is not None
+
+    def FindBreakpointsByName(self, name, breakpoints):
+        for breakpoint in self.breakpoints.values():
+            if name in breakpoint.names:
+                breakpoints.Append(breakpoint)
+        return True
+
+    def ReadInstructions(self, address, count):
+        STATS["instructions"] += 1
+        found = []
+        pc = address.GetLoadAddress(self)
+        while len(found) < count and pc in self.instructions:
+            length, asm = self.instructions[pc]
+            found.append(SBInstruction(length, asm))
+            pc += length
+        return found
+
+    def GetInstructions(self, address, code):
+        STATS["instructions"] += 1
+        found = []
+        pc = start = address.GetLoadAddress(self)
+        while pc < start + len(code) and pc in self.instructions:
+            length, asm = self.instructions[pc]
+            found.append(SBInstruction(length, asm))
+            pc += length
+        return found
+
+    def GetBasicType(self, basic_type):
+        return basic_type
+
+    def CreateValueFromAddress(self, name, address, value_type):
+        return self.expressions.get(f"*(id *){address.GetLoadAddress(self):#x}", SBValue())
+
+    def EvaluateExpression(self, expression):
+        STATS["expressions"].append(expression)
+        match = re.match(r"\(id\*\) class_copy(\w+)List\(\(Class\)\((.*)\), \(unsigned int\*\)(\d+)\)$", expression)
+        if match:
+            handles = self.lists.get(match.group(1), [])
+            self._write(int(match.group(3)), len(handles).to_bytes(4, "little"))
+            if not handles:
+                return SBValue(0)
+            return SBValue(self.allocate(b"".join(handle.to_bytes(8, "little") for handle in handles)))
+        return self.expressions.get(expression, SBValue())
+
+    def __eq__(self, other):
+        return self is other
+
+    __hash__ = object.__hash__
+
+
+class SBFrame:
+    def __init__(self, target, pc, sp=0):
+        self._target = target
+        self._pc = pc
+        self._sp = sp
+
+    def GetPC(self):
+        return self._pc
+
+    def GetSP(self):
+        return self._sp
+
+    def GetPCAddress(self):
+        return SBAddress(self._pc, self._target)
+
+
+class SBThread:
+    def __init__(self, process):
+        """Stopped by a trace at a frame-less pc 0 until a test sets
+        stop_reason, stop_data and frames ([(pc, sp)], youngest first)."""
+        self._process = process
+        self.stop_reason = eStopReasonTrace
+        self.stop_data = []
+        self.frames = [(0, 0)]
+
+    def GetProcess(self):
+        return self._process
+
+    def GetThreadID(self):
+        return 1
+
+    def GetStopReason(self):
+        return self.stop_reason
+
+    def GetStopReasonDataAtIndex(self, index):
+        return self.stop_data[index] if index < len(self.stop_data) else 0
+
+    def GetNumFrames(self):
+        return len(self.frames)
+
+    def GetFrameAtIndex(self, index):
+        pc, sp = self.frames[index]
+        return SBFrame(self._process.GetTarget(), pc, sp)
+
+
+class SBThreadPlan:
+    """The plan of a scripted step, recording what the script asks of it:
+    whether it completed, and the plans queued, whose run_to is their
+    destination."""
+
+    def __init__(self, thread, run_to=None):
+        self._thread = thread
+        self.run_to = run_to
+        self.complete = None
+        self.queued = []
+
+    def IsValid(self):
+        return True
+
+    def GetThread(self):
+        return self._thread
+
+    def SetPlanComplete(self, success):
+        self.complete = success
+
+    def IsPlanComplete(self):
+        return self.complete is not None
+
+    def QueueThreadPlanForRunToAddress(self, address):
+        plan = SBThreadPlan(self._thread, address.GetLoadAddress(None))
+        self.queued.append(plan)
+        return plan
+
+
+class SBDebugger:
+    def __init__(self, target):
+        self._target = target
+
+    def GetSelectedTarget(self):
+        return self._target
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+#
+# Benchmark for the gdb commands in gdb_commands.py, run against the fake
+# gdb module in bench/fakegdb instead of a live inferior. Synthetic x86-64
+# programs are replayed under every step-to-* predicate and mode, and
+# std::string images of every layout under printstdstring(s); the report
+# gives microseconds per executed instruction, per string and per flags
+# call, both in total and with the time spent inside the fake taken out.
+# Every run also checks where the command ended up and what it printed,
+# and exits non-zero on a mismatch.
+#
+# Compare two revisions of gdb_commands.py with e.g.
+#   git stash; bench/gdb_commands_bench.py -o old.json; git stash pop
+#   bench/gdb_commands_bench.py -o new.json
+#   bench/gdb_commands_bench.py --compare old.json new.json
+
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import struct
+import sys
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(REPO_DIR / "bench" / "fakegdb"), str(REPO_DIR)]
+
+import gdb  # the fake
+
+import gdb_commands
+import insn_sites
+
+BASE = 0x401000
+PLAIN = (
+    "mov    rax,QWORD PTR [rbp-0x8]",
+    "add    rax,0x1",
+    "lea    rdx,[rax+rax*2]",
+    "mov    QWORD PTR [rbp-0x8],rax",
+    "cmp    rax,rdx",
+)
+# predicate -> (command class, instruction it stops at, filler may call,
+# filler may branch)
+PREDICATES = {
+    "step-to-call": (gdb_commands.StepToCall, "call", False, True),
+    "step-to-branch": (gdb_commands.StepToBranch, "jmp", False, False),
+    "step-to-syscall": (gdb_commands.StepToSyscall, "syscall", True, True),
+    "step-to-antidebug": (gdb_commands.StepToAntiDebug, "rdtsc", True, True),
+}
+# mode -> (command arguments, whether .text is reported, so the site index is used)
+MODES = {
+    "stepi": ("--stepi", True),
+    "fast": ("", True),
+    "fast-noindex": ("", False),
+}
+LAYOUTS = ("libstdc++-sso", "libstdc++-heap", "libc++-short", "libc++-long")
+METRICS = ("us_per_step", "commands_us_per_step", "us_per_string", "commands_us_per_string",
+           "us_per_call", "commands_us_per_call", "cold_us_per_step")
+
+
+class Program:
+    """Lays out x86-64 code by label, then records the pcs it executes."""
+
+    def __init__(self):
+        self.items = []
+        self.labels = {}
+
+    def label(self, name):
+        self.labels[name] = len(self.items)
+
+    def emit(self, length, mnemonic, target=None):
+        self.items.append((length, mnemonic, target))
+
+    def assemble(self):
+        addresses = []
+        address = BASE
+        for length, _, _ in self.items:
+            addresses.append(address)
+            address += length
+        self.addresses = addresses
+        self.at = {name: addresses[index] for name, index in self.labels.items()}
+        code = []
+        for address, (length, mnemonic, target) in zip(addresses, self.items):
+            if target is not None:
+                mnemonic = f"{mnemonic:<6} {self.at[target]:#x} <{target}>"
+            code.append((address, length, mnemonic))
+        return code
+
+
+def make_program(match, blocks, block_length, iterations, calls, branches):
+    """Return (Recording, pc of the match) for a loop of blocks ending, after
+    iterations, at one match instruction.
+
+    Blocks are block_length plain instructions, ended (when branches) by a
+    jmp, a jne or (when calls) a call to a small function, in turn."""
+    program = Program()
+    program.label("f")
+    for index in range(block_length):
+        program.emit(4, PLAIN[index % len(PLAIN)])
+    program.emit(1, "ret")
+
+    program.label("main")
+    for block in range(blocks):
+        for index in range(block_length):
+            program.emit(4, PLAIN[index % len(PLAIN)])
+        following = f"block{block + 1}"
+        if branches:
+            kind = block % 3
+            if kind == 0:
+                program.emit(5, "jmp", following)
+            elif kind == 1 or not calls:
+                program.emit(6, "jne", following)
+            else:
+                program.emit(5, "call", "f")
+        program.label(following)
+    # the loop's jne would be the first branch
+    if iterations > 1 and branches:
+        program.emit(3, "dec    rcx")
+        program.emit(6, "jne", "main")
+    program.label("match")
+    if match in ("call", "jmp"):
+        program.emit(5, match, "f")
+    else:
+        program.emit(2, match)
+    program.emit(1, "hlt")
+    code = program.assemble()
+
+    # execute it: calls go through f and back, the loop jne is taken
+    # iterations - 1 times
+    by_address = {address: (length, asm) for address, length, asm in code}
+    function = [address for address in program.addresses if program.at["f"] <= address < program.at["main"]]
+    stream = []
+    for iteration in range(iterations):
+        address = program.at["main"]
+        while address != program.at["match"]:
+            length, asm = by_address[address]
+            stream.append(address)
+            if asm.startswith("call"):
+                stream.extend(function)
+            address += length
+            if asm.startswith("jne") and asm.endswith("<main>"):
+                break
+    stream.append(program.at["match"])
+
+    end = program.addresses[-1] + 1
+    recording = gdb.Recording(
+        instructions=code,
+        stream=stream,
+        memory=[(BASE, bytes(end - BASE))],
+        registers={"rflags": 0x246, "sp": 0x7ffe0000},
+        text=[(BASE, end)],
+    )
+    return recording, program.at["match"]
+
+
+def without_text(recording):
+    return gdb.Recording(**dict(vars(recording), text=()))
+
+
+@contextlib.contextmanager
+def captured():
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        yield output
+
+
+def timed(function):
+    """(wall seconds, seconds inside the fake, output) of one call."""
+    gdb.reset_stats()
+    with captured() as output:
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+    return elapsed, gdb.STATS["time"], output.getvalue()
+
+
+def fail(message):
+    sys.exit(f"gdb_commands_bench: {message}")
+
+
+def bench_step(command_class, arguments, recording, match, repeats):
+    command = command_class()
+    for start, end in recording.text:
+        insn_sites.forget(start, end - start)
+    gdb.replay(recording)
+
+    walls, fakes = [], []
+    for repeat in range(repeats + 1):
+        gdb.restart()
+        wall, fake, output = timed(lambda: command.invoke(arguments, False))
+        steps = gdb.position()
+        if match is not None and (steps != len(recording.stream) - 1 or int(gdb.selected_frame().pc()) != match):
+            fail(f"{command.name} {arguments} stopped after {steps} of {len(recording.stream) - 1} "
+                 f"instructions:\n{output}")
+        if repeat == 0:
+            cold = wall
+            calls = dict(gdb.STATS["calls"])
+        else:
+            walls.append(wall)
+            fakes.append(fake)
+    steps = max(gdb.position(), 1)
+    wall, fake = statistics.median(walls), statistics.median(fakes)
+    return {
+        "steps": steps,
+        "cold_us_per_step": round(cold / steps * 1e6, 3),
+        "us_per_step": round(wall / steps * 1e6, 3),
+        "commands_us_per_step": round((wall - fake) / steps * 1e6, 3),
+        "fake_calls": calls,
+    }
+
+
+def run_steps(args):
+    report = {}
+    for name, (command_class, match_asm, calls, branches) in PREDICATES.items():
+        recording, match = make_program(match_asm, args.blocks, args.block_length, args.iterations, calls, branches)
+        if args.save_recordings:
+            args.save_recordings.mkdir(parents=True, exist_ok=True)
+            recording.save(args.save_recordings / f"{name}.json")
+        for mode, (arguments, indexed) in MODES.items():
+            if mode != "stepi" and not command_class.FAST:
+                continue
+            if command_class is gdb_commands.StepToSyscall and mode != "stepi":
+                arguments = "--scan"
+            replayed = recording if indexed else without_text(recording)
+            report.setdefault(name, {})[mode] = bench_step(command_class, arguments, replayed, match, args.repeats)
+    return report
+
+
+def run_recording(path, repeats):
+    """Every predicate and mode against a recorded stream, without checks."""
+    recording = gdb.Recording.load(path)
+    report = {}
+    for name, (command_class, _, _, _) in PREDICATES.items():
+        for mode, (arguments, indexed) in MODES.items():
+            if mode != "stepi" and not command_class.FAST:
+                continue
+            if command_class is gdb_commands.StepToSyscall and mode != "stepi":
+                arguments = "--scan"
+            replayed = recording if indexed else without_text(recording)
+            report.setdefault(name, {})[mode] = bench_step(command_class, arguments, replayed, None, repeats)
+    return report
+
+
+def string_image(layout, count, base, heap):
+    """Return (memory segments, std::string size, expected texts) for count
+    std::strings of layout at base, long ones' data from heap on."""
+    size = 32 if layout.startswith("libstdc++") else 24
+    objects = bytearray()
+    data = bytearray()
+    texts = []
+    for index in range(count):
+        address = base + index * size
+        if layout == "libstdc++-sso":
+            text = f"sso{index:06d}".encode()
+            objects += struct.pack("<QQ", address + 16, len(text)) + text.ljust(16, b"\0")
+        elif layout == "libc++-short":
+            text = f"short{index:06d}".encode()
+            objects += bytes([len(text) << 1]) + text.ljust(size - 1, b"\0")
+        else:
+            text = f"a heap allocated string, number {index:06d}".encode()
+            pointer = heap + len(data)
+            data += text + b"\0" * 8
+            if layout == "libstdc++-heap":
+                objects += struct.pack("<QQQQ", pointer, len(text), len(text), 0)
+            else:
+                objects += struct.pack("<QQQ", (len(text) + 1) | 1, len(text), pointer)
+        texts.append(text.decode())
+    # printstdstring reads a libstdc++-sized header whatever the layout
+    objects += bytes(32)
+    return [(base, bytes(objects)), (heap, bytes(data) or b"\0")], size, texts
+
+
+def bench_strings(count, repeats):
+    base, heap, vector = 0x600000, 0x7f0000000000, 0x500000
+    report = {"printstdstring": {}, "printstdstrings": {}}
+    single = gdb_commands.PrintStdString()
+    many = gdb_commands.PrintStdStrings()
+    for layout in LAYOUTS:
+        memory, size, texts = string_image(layout, count, base, heap)
+        header = struct.pack("<QQQ", base, base + count * size, base + count * size)
+        gdb.replay(gdb.Recording(stream=[BASE], memory=memory + [(vector, header)], symbols={"strings": vector}))
+
+        def print_each(size=size):
+            for index in range(count):
+                single.invoke(f"{base + index * size:#x}", False)
+
+        expected = "\n".join(texts) + "\n"
+        report["printstdstring"][layout] = bench_strings_call(print_each, expected, count, repeats)
+        expected = f"{count} strings\n" + "".join(f"[{index}] {text}\n" for index, text in enumerate(texts))
+        report["printstdstrings"][layout] = bench_strings_call(
+            lambda: many.invoke("strings", False), expected, count, repeats)
+    return report
+
+
+def bench_strings_call(function, expected, count, repeats):
+    walls, fakes = [], []
+    for _ in range(repeats):
+        wall, fake, output = timed(function)
+        if output != expected:
+            fail(f"unexpected output:\n{output[:500]}")
+        walls.append(wall)
+        fakes.append(fake)
+    calls = dict(gdb.STATS["calls"])
+    wall, fake = statistics.median(walls), statistics.median(fakes)
+    return {
+        "strings": count,
+        "us_per_string": round(wall / count * 1e6, 3),
+        "commands_us_per_string": round((wall - fake) / count * 1e6, 3),
+        "fake_calls": calls,
+    }
+
+
+def bench_flags(calls, repeats):
+    command = gdb_commands.PrintFlags()
+    report = {}
+    for arch, registers, flag in (("i386:x86-64", {"rflags": 0x246}, "ZF"),
+                                  ("aarch64", {"cpsr": 0x60000000}, "Z")):
+        gdb.replay(gdb.Recording(arch=arch, stream=[BASE], registers=registers))
+
+        def print_flags():
+            for _ in range(calls):
+                command.invoke("", False)
+
+        walls, fakes = [], []
+        for _ in range(repeats):
+            wall, fake, output = timed(print_flags)
+            if flag not in output.split("\n", 1)[0].split():
+                fail(f"flags on {arch} printed {output.splitlines()[0]!r}")
+            walls.append(wall)
+            fakes.append(fake)
+        wall, fake = statistics.median(walls), statistics.median(fakes)
+        report[arch] = {
+            "calls": calls,
+            "us_per_call": round(wall / calls * 1e6, 3),
+            "commands_us_per_call": round((wall - fake) / calls * 1e6, 3),
+        }
+    return report
+
+
+def compare(old_path, new_path):
+    """Print the relative change of every metric between two reports."""
+    old = json.loads(Path(old_path).read_text())
+    new = json.loads(Path(new_path).read_text())
+    comparison = {}
+
+    def walk(before, after, path):
+        for key, value in after.items():
+            if key == "fake_calls" or key not in before:
+                continue
+            if isinstance(value, dict):
+                walk(before[key], value, path + (key,))
+            elif key in METRICS and before[key] is not None:
+                change = {"old": before[key], "new": value}
+                if before[key]:
+                    change["ratio"] = round(value / before[key], 3)
+                comparison[".".join(path + (key,))] = change
+
+    walk(old, new, ())
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--blocks", help="basic blocks in each loop body", default=30, type=int)
+    parser.add_argument("--block-length", help="plain instructions per block", default=8, type=int)
+    parser.add_argument("--iterations", help="times the loop runs", default=50, type=int)
+    parser.add_argument("--strings", help="std::strings per layout", default=2000, type=int)
+    parser.add_argument("--flags-calls", help="flags invocations per measurement", default=2000, type=int)
+    parser.add_argument("--repeats", help="measured runs of each case (median is reported)", default=5, type=int)
+    parser.add_argument("--recording", help="also replay a recording saved by Recording.save", type=Path)
+    parser.add_argument("--save-recordings", help="write the synthetic step recordings here", type=Path)
+    parser.add_argument("-o", "--output", help="write the JSON report here instead of stdout", type=Path)
+    parser.add_argument("--compare", help="compare two JSON reports", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        report = compare(*args.compare)
+    else:
+        report = {
+            "repeats": args.repeats,
+            "capstone": insn_sites.capstone is not None,
+            "steps": run_steps(args),
+            "strings": bench_strings(args.strings, args.repeats),
+            "flags": bench_flags(args.flags_calls, args.repeats),
+        }
+        if args.recording:
+            report["recording"] = run_recording(args.recording, args.repeats)
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+#
+# Startup benchmark for gdb_funcs.py. Lays out .gdbinit and the gdb helper
+# modules from the working tree or a git revision in a temp HOME, times
+# `gdb -batch -nx -x .gdbinit` over a number of runs, and reports wall time
+# (minus a bare `gdb -batch -nx`) and lines printed as JSON.
+#
+# Compare two revisions with e.g.
+#   bench/gdb_startup_bench.py --rev HEAD~1 -o old.json
+#   bench/gdb_startup_bench.py -o new.json
+#   bench/gdb_startup_bench.py --compare old.json new.json
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+# whatever of these exists in the revision is installed into the temp HOME
+FILES = (".gdbinit", "gdb_funcs.py", "gdb_commands.py", "insn_sites.py")
+METRICS = ("median", "mean", "min")
+
+
+def materialize(rev, home):
+    """Copy FILES from the working tree (rev None) or a git revision to home."""
+    for name in FILES:
+        if rev is None:
+            source = REPO_DIR / name
+            if source.exists():
+                shutil.copyfile(source, home / name)
+            continue
+        shown = subprocess.run(["git", "show", f"{rev}:{name}"], cwd=REPO_DIR, capture_output=True, check=False)
+        if shown.returncode == 0:
+            (home / name).write_bytes(shown.stdout)
+
+
+def time_runs(command, env, runs):
+    """Wall times in seconds of `runs` runs of command, and its output line count."""
+    times = []
+    lines = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+        times.append(time.perf_counter() - start)
+        lines = len((result.stdout + result.stderr).splitlines())
+    return times, lines
+
+
+def summarize(times, baseline=0.0):
+    return {
+        "median": round(statistics.median(times) - baseline, 5),
+        "mean": round(statistics.mean(times) - baseline, 5),
+        "min": round(min(times) - baseline, 5),
+        "stdev": round(statistics.stdev(times), 5) if len(times) > 1 else 0.0,
+    }
+
+
+def run(gdb, rev, runs, quiet):
+    with tempfile.TemporaryDirectory() as tmp:
+        home = Path(tmp)
+        materialize(rev, home)
+        env = dict(os.environ, HOME=str(home))
+        env.pop("GDB_FUNCS_QUIET", None)
+        if quiet:
+            env["GDB_FUNCS_QUIET"] = "1"
+
+        # gdb's own startup, subtracted from the .gdbinit times
+        bare, _ = time_runs([gdb, "-batch", "-nx"], env, runs)
+        baseline = statistics.median(bare)
+        times, lines = time_runs([gdb, "-batch", "-nx", "-x", str(home / ".gdbinit")], env, runs)
+
+    return {
+        "rev": rev or "working tree",
+        "runs": runs,
+        "quiet": quiet,
+        "gdb_startup": summarize(bare),
+        "gdbinit": summarize(times, baseline),
+        "output_lines": lines,
+    }
+
+
+def compare(old_path, new_path):
+    """Print the relative change of the .gdbinit times between two reports."""
+    old = json.loads(Path(old_path).read_text())
+    new = json.loads(Path(new_path).read_text())
+    comparison = {}
+    for metric in METRICS:
+        change = {"old": old["gdbinit"][metric], "new": new["gdbinit"][metric]}
+        if old["gdbinit"][metric] > 0:
+            change["ratio"] = round(new["gdbinit"][metric] / old["gdbinit"][metric], 3)
+        comparison[metric] = change
+    comparison["output_lines"] = {"old": old["output_lines"], "new": new["output_lines"]}
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--gdb", help="gdb binary to run", default="gdb")
+    parser.add_argument("--rev", help="git revision to take the files from (default: working tree)")
+    parser.add_argument("--runs", help="gdb runs per measurement", default=20, type=int)
+    parser.add_argument("--quiet", help="run with GDB_FUNCS_QUIET=1", action="store_true")
+    parser.add_argument("-o", "--output", help="write the JSON report here instead of stdout", type=Path)
+    parser.add_argument("--compare", help="compare two JSON reports", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        report = compare(*args.compare)
+    else:
+        gdb = shutil.which(args.gdb)
+        if gdb is None:
+            parser.error(f"{args.gdb} not found")
+        report = run(gdb, args.rev, args.runs, args.quiet)
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
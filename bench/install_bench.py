@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+#
+# Benchmark suite for install.py. Builds synthetic dotfiles repos (plain
+# `git init`, no network) in a temp dir, runs do_install against them cold,
+# warm (already installed) and as a dry run, and reports wall time,
+# subprocess count and, when strace is available, syscall count as JSON.
+#
+# Compare two revisions of install.py with e.g.
+#   git show HEAD~1:install.py > /tmp/install_old.py
+#   bench/install_bench.py --script /tmp/install_old.py -o old.json
+#   bench/install_bench.py -o new.json
+#   bench/install_bench.py --compare old.json new.json
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+SCENARIOS = ("flat", "deep", "ignored", "conflicts")
+MODES = ("cold", "warm", "dryrun")
+METRICS = ("wall_time", "subprocesses", "syscalls")
+
+
+def write_files(directory, count, suffix=".txt"):
+    directory.mkdir(parents=True, exist_ok=True)
+    for index in range(count):
+        (directory / f"file{index:04d}{suffix}").write_text("x\n")
+
+
+def make_repo(root, scenario, size):
+    """Create a git repo of roughly `size` installable files laid out per scenario.
+
+    flat: every file at the top level.
+    deep: a .config tree nested five levels deep.
+    ignored: the deep tree, plus as many gitignored files and __pycache__ dirs.
+    conflicts: the deep tree; make_conflicts pre-populates the install dir.
+    """
+    root.mkdir(parents=True)
+    subprocess.run(["git", "init", "-q"], cwd=root, check=True)
+    (root / ".gitignore").write_text("*.pyc\n__pycache__/\n")
+    for name in (".bashrc", ".zshrc", ".vimrc"):
+        (root / name).write_text(f"# {name}\n")
+
+    if scenario == "flat":
+        for index in range(size):
+            (root / f".rc{index:05d}").write_text("x\n")
+        return
+
+    files_per_dir = 10
+    for index in range(max(1, size // files_per_dir)):
+        # spread directories over a 4-way fan-out, five levels under .config
+        parts = [f"d{(index >> (2 * level)) & 3}" for level in range(4)]
+        leaf = root / ".config" / "vendor" / Path(*parts) / f"plugin{index:05d}"
+        write_files(leaf, files_per_dir)
+        if scenario == "ignored":
+            write_files(leaf, files_per_dir, suffix=".pyc")
+            write_files(leaf / "__pycache__", files_per_dir, suffix=".pyc")
+
+
+def make_conflicts(repo, install_dir):
+    """Put a regular file at every other destination under .config."""
+    for index, source in enumerate(sorted((repo / ".config").rglob("*.txt"))):
+        if index % 2:
+            continue
+        destination = install_dir / source.relative_to(repo)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        destination.write_text("local\n")
+
+
+def load_install(script, repo):
+    """Import a copy of install.py living in repo, so its SCRIPT_DIR is the repo."""
+    target = repo / "install.py"
+    if not target.exists():
+        shutil.copyfile(script, target)
+    spec = importlib.util.spec_from_file_location("install_under_bench", target)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class SubprocessCounter:
+    """Counts subprocess.Popen instantiations while active."""
+
+    def __init__(self):
+        self.count = 0
+        self._original = subprocess.Popen
+
+    def __enter__(self):
+        counter = self
+
+        class CountingPopen(self._original):
+            def __init__(self, *args, **kwargs):
+                counter.count += 1
+                super().__init__(*args, **kwargs)
+
+        subprocess.Popen = CountingPopen
+        return self
+
+    def __exit__(self, *exc_info):
+        subprocess.Popen = self._original
+
+
+def run_child(repo, install_dir, dryrun, call):
+    """Body of one measured run, executed in a fresh interpreter."""
+    module = load_install(None, repo)
+    if not call:
+        return {}
+    with SubprocessCounter() as counter, contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        results = module.do_install(installdir=install_dir, dryrun=dryrun)
+        elapsed = time.perf_counter() - start
+    return {
+        "wall_time": round(elapsed, 4),
+        "subprocesses": counter.count,
+        "installs": len(results["installs"]),
+        "installed": len(results["installed"]),
+        "conflicts": len(results["conflicts"]),
+    }
+
+
+def strace_calls(output):
+    """Total syscall count from an `strace -c` summary."""
+    for line in Path(output).read_text().splitlines():
+        fields = line.split()
+        if fields and fields[-1] == "total":
+            return int(fields[3])
+    return None
+
+
+def measure(repo, install_dir, dryrun=False, call=True):
+    """Run do_install in a child process, under strace -c -f when available."""
+    command = [
+        sys.executable, __file__, "--child",
+        "--repo", str(repo), "--install-dir", str(install_dir),
+    ]
+    if dryrun:
+        command.append("--dryrun")
+    if not call:
+        command.append("--no-call")
+
+    strace = shutil.which("strace")
+    with tempfile.NamedTemporaryFile(suffix=".strace") as summary:
+        if strace:
+            command = [strace, "-f", "-c", "-o", summary.name] + command
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output)
+        result["syscalls"] = strace_calls(summary.name) if strace else None
+    return result
+
+
+def settle(module):
+    """Wait out the manifest's racy-mtime window so a re-run can trust it."""
+    state = getattr(module, "InstallState", None)
+    if state is not None:
+        time.sleep(state.RACY_WINDOW_NS / 1e9 + 0.1)
+
+
+def run_scenario(script, scenario, size, workdir):
+    repo = workdir / "repo"
+    make_repo(repo, scenario, size)
+    module = load_install(script, repo)
+
+    # interpreter startup and import, subtracted from every run's syscalls
+    baseline = measure(repo, workdir, call=False)["syscalls"]
+
+    report = {}
+    for mode in MODES:
+        install_dir = workdir / f"home-{mode}"
+        install_dir.mkdir()
+        if scenario == "conflicts":
+            make_conflicts(repo, install_dir)
+        if mode == "warm":
+            # install, then let the manifest settle with one re-run, as a
+            # login hook on an unchanged host would see it
+            measure(repo, install_dir)
+            settle(module)
+            measure(repo, install_dir)
+        report[mode] = measure(repo, install_dir, dryrun=mode == "dryrun")
+        if baseline is not None and report[mode]["syscalls"] is not None:
+            report[mode]["syscalls"] -= baseline
+    return report
+
+
+def compare(old_path, new_path):
+    """Print the relative change of every metric between two reports."""
+    old = json.loads(Path(old_path).read_text())
+    new = json.loads(Path(new_path).read_text())
+    comparison = {}
+    for scenario, modes in new["scenarios"].items():
+        for mode, metrics in modes.items():
+            before = old["scenarios"].get(scenario, {}).get(mode, {})
+            for metric in METRICS:
+                if before.get(metric) is None or metrics.get(metric) is None:
+                    continue
+                change = {"old": before[metric], "new": metrics[metric]}
+                if before[metric]:
+                    change["ratio"] = round(metrics[metric] / before[metric], 3)
+                comparison.setdefault(scenario, {}).setdefault(mode, {})[metric] = change
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--script", help="install.py to benchmark", default=REPO_DIR / "install.py", type=Path)
+    parser.add_argument("--size", help="installable files per scenario", default=2000, type=int)
+    parser.add_argument("--scenario", help="scenario to run (repeatable)", choices=SCENARIOS, action="append")
+    parser.add_argument("-o", "--output", help="write the JSON report here instead of stdout", type=Path)
+    parser.add_argument("--compare", help="compare two JSON reports", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--child", help=argparse.SUPPRESS, action="store_true")
+    parser.add_argument("--repo", help=argparse.SUPPRESS, type=Path)
+    parser.add_argument("--install-dir", help=argparse.SUPPRESS, type=Path)
+    parser.add_argument("--dryrun", help=argparse.SUPPRESS, action="store_true")
+    parser.add_argument("--no-call", help=argparse.SUPPRESS, action="store_true")
+    args = parser.parse_args()
+
+    if args.child:
+        report = run_child(args.repo, args.install_dir, args.dryrun, not args.no_call)
+    elif args.compare:
+        report = compare(*args.compare)
+    else:
+        report = {
+            "script": str(args.script),
+            "size": args.size,
+            "strace": shutil.which("strace") is not None,
+            "scenarios": {},
+        }
+        for scenario in args.scenario or SCENARIOS:
+            with tempfile.TemporaryDirectory() as tmp:
+                report["scenarios"][scenario] = run_scenario(args.script, scenario, args.size, Path(tmp))
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# Runs the result checks of gdb_commands_bench.py as a pytest suite, on
+# small inputs and without timing repeats:
+#   python -m pytest -q bench
+# A check that fails exits the benchmark, which fails the test.
+
+import argparse
+import struct
+
+import gdb_commands_bench as bench
+import pytest
+
+
+@pytest.mark.parametrize("predicate", bench.PREDICATES)
+@pytest.mark.parametrize("mode", bench.MODES)
+def test_step(predicate, mode):
+    command_class, match_asm, calls, branches = bench.PREDICATES[predicate]
+    arguments, indexed = bench.MODES[mode]
+    if mode != "stepi" and not command_class.FAST:
+        pytest.skip(f"{predicate} always steps")
+    if command_class is bench.gdb_commands.StepToSyscall and mode != "stepi":
+        arguments = "--scan"
+    recording, match = bench.make_program(match_asm, 6, 4, 5, calls, branches)
+    replayed = recording if indexed else bench.without_text(recording)
+    report = bench.bench_step(command_class, arguments, replayed, match, 1)
+    assert report["steps"] == len(recording.stream) - 1
+
+
+def test_steps_report():
+    args = argparse.Namespace(blocks=3, block_length=2, iterations=2, repeats=1, save_recordings=None)
+    report = bench.run_steps(args)
+    assert set(report) == set(bench.PREDICATES)
+
+
+@pytest.mark.parametrize("count", [1, 50])
+def test_strings(count):
+    report = bench.bench_strings(count, 1)
+    for command in ("printstdstring", "printstdstrings"):
+        assert set(report[command]) == set(bench.LAYOUTS)
+
+
+def test_flags():
+    report = bench.bench_flags(5, 1)
+    assert set(report) == {"i386:x86-64", "aarch64"}
+
+
+def test_compare(tmp_path):
+    old = {"steps": {"step-to-call": {"fast": {"us_per_step": 2.0, "fake_calls": {}}}}}
+    new = {"steps": {"step-to-call": {"fast": {"us_per_step": 1.0, "fake_calls": {}}}}}
+    (tmp_path / "old.json").write_text(bench.json.dumps(old))
+    (tmp_path / "new.json").write_text(bench.json.dumps(new))
+    comparison = bench.compare(tmp_path / "old.json", tmp_path / "new.json")
+    assert comparison == {"steps.step-to-call.fast.us_per_step": {"old": 2.0, "new": 1.0, "ratio": 0.5}}
+
+
+def test_step_past_xbegin_falls_through():
+    base = bench.BASE
+    instructions = [(base, 6, "xbegin 0x401100"), (base + 6, 3, bench.PLAIN[0]),
+                    (base + 9, 5, "call   0x402000"), (0x401100, 1, "ret")]
+    # the transaction starts, so the abort handler is never run
+    recording = bench.gdb.Recording(instructions=instructions, stream=[base, base + 6, base + 9])
+    report = bench.bench_step(bench.gdb_commands.StepToCall, "", recording, base + 9, 1)
+    assert report["steps"] == 2
+
+
+def test_patched_code_is_not_served_from_the_disk_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.setattr(bench.gdb.Objfile, "build_id", "0123abcd")
+    base = bench.BASE
+    instructions = [(base + offset, 3, bench.PLAIN[0]) for offset in range(0, 12, 3)]
+    instructions.append((base + 12, 5, "call   0x402000"))
+    recording = bench.gdb.Recording(instructions=instructions, stream=[base], memory=[(base, bytes(17))],
+                                    text=[(base, base + 17)])
+    arch = bench.gdb.Architecture(recording.arch)
+    cache = bench.gdb_commands._decode_cache
+
+    bench.gdb.replay(recording)
+    assert cache.site_index(arch, base).next_site(base, bench.insn_sites.CALL) == base + 12
+    assert (tmp_path / "insn_sites" / "0123abcd.sites").exists()
+
+    # patch a call in over the first instruction
+    inferior = bench.gdb.selected_inferior()
+    inferior.code[base] = (3, "call   rax")
+    inferior.write_memory(base, b"\xff\xd0\x90")
+    assert cache.site_index(arch, base).next_site(base, bench.insn_sites.CALL) == base
+
+    # reloading the program drops the patch, and the saved index still holds
+    bench.gdb.replay(recording)
+    assert cache.site_index(arch, base).next_site(base, bench.insn_sites.CALL) == base + 12
+
+
+def memsearch(argument, capsys):
+    bench.gdb_commands.MemSearch().invoke(argument, False)
+    return capsys.readouterr().out.splitlines()
+
+
+def test_memsearch_joins_unquoted_hex_bytes(capsys):
+    data = bytes(16) + b"\xde\xad\xbe\xef" + b"\xef" * 4
+    bench.gdb.replay(bench.gdb.Recording(stream=[bench.BASE], memory=[(0x600000, data)]))
+    assert memsearch("--hex de ad be ef", capsys)[:-1] == ["0x600010  [anon]+0x10"]
+    assert memsearch("foo bar", capsys) == ["memsearch: expected one PATTERN, got 2; quote text with spaces"]
+
+
+def trace_program():
+    base = bench.BASE
+    instructions = [(base + offset, 3, bench.PLAIN[0]) for offset in range(0, 9, 3)]
+    instructions.append((base + 9, 5, "call   0x402000"))
+    return bench.gdb.Recording(instructions=instructions, stream=[base, base + 3, base + 6, base + 9],
+                               registers={"eflags": 0x246})
+
+
+def recorded(path):
+    with bench.gdb_commands._TraceFile.mapped(path) as records:
+        return [tuple(records[index:index + 2]) for index in range(0, len(records), 2)]
+
+
+def test_trace_record_until_leaves_out_the_match(tmp_path, capsys):
+    bench.gdb.replay(trace_program())
+    bench.gdb_commands.TraceRecord().invoke(f"{tmp_path / 'trace'} --until call", False)
+    assert "3 records appended" in capsys.readouterr().out
+    assert recorded(tmp_path / "trace") == [(bench.BASE + offset, 3) for offset in range(0, 9, 3)]
+
+
+def test_trace_round_trip(tmp_path, capsys):
+    path = tmp_path / "trace"
+    bench.gdb.replay(trace_program())
+    bench.gdb_commands.TraceRecord().invoke(f"{path} --flags --count 2", False)
+    bench.gdb.restart()
+    bench.gdb_commands.TraceRecord().invoke(f"{path} --flags --count 2", False)
+    capsys.readouterr()
+    first, second = bench.BASE, bench.BASE + 3
+    assert recorded(path) == [(first, 3 | 0x246 << 8), (second, 3 | 0x246 << 8)] * 2
+
+    bench.gdb_commands.TraceStats().invoke(str(path), False)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "4 instructions, 2 distinct pcs, 1 distinct basic blocks (2 block entries)"
+    assert lines[lines.index("hot blocks:") + 1].split()[:3] == ["2", "100.00%", hex(first)]
+
+
+def test_trace_record_rejects_other_flags_setting(tmp_path, capsys):
+    path = tmp_path / "trace"
+    bench.gdb.replay(trace_program())
+    bench.gdb_commands.TraceRecord().invoke(f"{path} --count 1", False)
+    size = path.stat().st_size
+    capsys.readouterr()
+    bench.gdb_commands.TraceRecord().invoke(f"{path} --flags --count 1", False)
+    assert capsys.readouterr().out == f"trace-record: {path} was recorded without --flags\n"
+    assert path.stat().st_size == size
+
+
+def test_memsearch_finds_needles_straddling_chunks(capsys, monkeypatch):
+    monkeypatch.setattr(bench.gdb_commands.MemSearch, "CHUNK", 8)
+    data = bytearray(32)
+    data[6:10] = data[16:20] = b"\xde\xad\xbe\xef"
+    bench.gdb.replay(bench.gdb.Recording(stream=[bench.BASE], memory=[(0x600000, data)]))
+    assert memsearch("--hex deadbeef", capsys)[:-1] == ["0x600006  [anon]+0x6", "0x600010  [anon]+0x10"]
+
+
+def elf_core(segments):
+    """A 64-bit little-endian ELF core: a PT_NOTE, then a PT_LOAD per
+    (vaddr, dumped bytes, memsz), the data after the program headers."""
+    phnum = len(segments) + 1
+    offset = 64 + 56 * phnum
+    headers = [struct.pack("<IIQQQQQQ", 4, 0, offset, 0, 0, 0, 0, 4)]
+    body = b""
+    for vaddr, data, memsz in segments:
+        headers.append(struct.pack("<IIQQQQQQ", 1, 6, offset + len(body), vaddr, 0, len(data), memsz, 4096))
+        body += data
+    header = b"\x7fELF" + bytes([2, 1, 1]) + bytes(9)
+    header += struct.pack("<HHIQQQIHHHHHH", 4, 62, 1, 0, 64, 0, 0, 64, 56, phnum, 0, 0, 0)
+    return header + b"".join(headers) + body
+
+
+def test_memsearch_core_with_a_partly_dumped_segment(tmp_path):
+    needle = b"\xde\xad\xbe\xef"
+    # the first segment's file part ends inside its second needle; gdb reads
+    # the rest (e.g. from the mapped file)
+    partial = bytearray(64)
+    partial[8:12] = partial[30:34] = partial[40:44] = needle
+    dumped = bytes(16) + needle
+    core = tmp_path / "core"
+    core.write_bytes(elf_core([(0x600000, partial[:32], 64), (0x700000, dumped, 20)]))
+    bench.gdb.replay(bench.gdb.Recording(stream=[bench.BASE], memory=[(0x600000, partial)]))
+
+    assert bench.gdb_commands._core_segments(core)[0] == ("load1", 0x600000, 32, 64, 64 + 56 * 3)
+    hits, scanned = bench.gdb_commands.MemSearch()._search_core(core, needle, 100, 2)
+    assert hits == [(0x600008, "load1", 0x600000), (0x60001E, "load1", 0x600000),
+                    (0x600028, "load1", 0x600000), (0x700010, "load2", 0x700000)]
+    assert scanned == 32 + 20 + (64 - 29)
+
+
+def test_core_segments_rejects_other_files(tmp_path):
+    (tmp_path / "core").write_bytes(b"not an ELF file" * 8)
+    assert bench.gdb_commands._core_segments(tmp_path / "core") is None
@@ -0,0 +1,313 @@
+# Runs install.py against a throwaway dotfiles checkout and install dir:
+#   python -m pytest -q bench
+# Each test gets its own copy of install.py inside a fresh git repo, since
+# the script installs from the directory it lives in.
+
+import importlib.util
+import itertools
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+_modules = itertools.count()
+
+
+class Checkout:
+    """A dotfiles repo holding a copy of install.py, and an install dir."""
+
+    def __init__(self, root):
+        self.repo = root / "dotfiles"
+        self.home = root / "home"
+        self.repo.mkdir()
+        self.home.mkdir()
+        subprocess.run(["git", "init", "-q"], cwd=self.repo, check=True)
+        shutil.copyfile(REPO_DIR / "install.py", self.repo / "install.py")
+        spec = importlib.util.spec_from_file_location(f"install_{next(_modules)}", self.repo / "install.py")
+        self.install_py = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.install_py)
+
+    def write(self, label, text="text\n"):
+        path = self.repo / label
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+        return path
+
+    def remove(self, label):
+        (self.repo / label).unlink()
+
+    def install(self, **options):
+        return self.install_py.do_install(installdir=self.home, **options)
+
+    def prune(self, **options):
+        return self.install_py.do_prune(installdir=self.home, **options)
+
+    def counters(self, **options):
+        """Install with profiling, returning the InstallStats counters."""
+        return self.install(profile=True, **options)["profile"]["counters"]
+
+    def is_link(self, label):
+        return self.install_py.is_source_link(self.home, label)
+
+    def symlinks(self):
+        return sorted(
+            str(path.relative_to(self.home)) for path in self.home.rglob("*") if path.is_symlink()
+        )
+
+
+@pytest.fixture
+def checkout(tmp_path):
+    return Checkout(tmp_path)
+
+
+def test_ignored_files_are_not_linked(checkout):
+    checkout.write(".gitignore", "*.swp\n!keep.swp\nsecret/\n")
+    checkout.write(".config/x/.gitignore", "local\n")
+    for label in ("zshrc", "a.swp", "keep.swp", "secret/key", ".config/x/c", ".config/x/local", ".config/x/b.swp"):
+        checkout.write(label)
+
+    counters = checkout.counters()
+    assert checkout.symlinks() == [".config/x/.gitignore", ".config/x/c", "keep.swp", "zshrc"]
+    # the whole tree is classified by one git process
+    assert counters["git_processes"] == 1
+
+
+def test_files_below_a_symlinked_directory(checkout):
+    checkout.write(".gitignore", "*.swp\n")
+    checkout.write("shared/rc")
+    checkout.write("shared/rc.swp")
+    (checkout.repo / ".zsh").symlink_to("shared")
+
+    counters = checkout.counters()
+    # git refuses paths beyond the link, so those go by the link's own path
+    assert checkout.symlinks() == [".zsh/rc", ".zsh/rc.swp", "shared/rc"]
+    assert counters["git_processes"] == 1
+
+
+def test_manifest_is_not_trusted_within_the_racy_window(checkout):
+    checkout.write("zshrc")
+    checkout.install()
+    counters = checkout.counters()
+    # everything was recorded just now, in the same timestamp tick as far
+    # as the manifest can tell
+    assert counters["directories_reused"] == counters["links_reused"] == 0
+    assert counters["directories_listed"] == 1
+
+
+def test_manifest_is_reused_after_the_racy_window(checkout, monkeypatch):
+    monkeypatch.setattr(checkout.install_py.InstallState, "RACY_WINDOW_NS", 0)
+    checkout.write("zshrc")
+    checkout.write(".config/x/c")
+    checkout.install()
+    # creating the manifest changed the install dir after the first run's
+    # snapshot, so only the second run's record of it can be trusted
+    checkout.install()
+
+    counters = checkout.counters()
+    assert counters["directories_reused"] == 3
+    assert counters["directories_listed"] == counters["git_processes"] == 0
+    assert counters["links_reused"] == 2
+    assert counters["links_created"] == 0
+
+    # a change in one directory has only that one listed again
+    checkout.write(".config/x/d")
+    counters = checkout.counters()
+    assert counters["directories_listed"] == 1
+    assert counters["links_created"] == 1
+    assert checkout.symlinks() == [".config/x/c", ".config/x/d", "zshrc"]
+
+    # a link removed behind the manifest's back is noticed by its directory
+    (checkout.home / "zshrc").unlink()
+    assert checkout.counters()["links_created"] == 1
+    assert checkout.is_link("zshrc")
+
+
+def test_fold_and_unfold(checkout, capsys):
+    checkout.write(".config/x/a")
+    checkout.write(".config/x/b")
+    checkout.write(".config/y/c")
+    (checkout.home / ".config").mkdir()
+    (checkout.home / ".config" / "mine").write_text("mine\n")
+
+    # an absent destination directory is linked whole; an existing one isn't
+    checkout.install(fold=True)
+    assert checkout.symlinks() == [".config/x", ".config/y"]
+    # without --fold a folded directory is still recognised
+    results = checkout.install()
+    assert results["installs"] == []
+    assert sorted(results["installed"]) == [".config/x", ".config/y"]
+
+    # a gitignored file must not show through the folded link
+    checkout.write(".gitignore", "*.swp\n")
+    checkout.write(".config/x/a.swp")
+    capsys.readouterr()
+    checkout.install(dryrun=True, fold=True)
+    assert ".config/x would be unfolded" in capsys.readouterr().out
+    assert checkout.symlinks() == [".config/x", ".config/y"]
+    checkout.install(fold=True)
+    assert checkout.symlinks() == [".config/x/a", ".config/x/b", ".config/y"]
+    assert not (checkout.home / ".config/x/a.swp").exists()
+
+
+def test_check_drift_and_replace_identical(checkout, capsys):
+    for label, source, destination in (
+        ("same", "text\n", "text\n"),
+        ("edited", "text\n", "edited\n"),
+        ("blob", "text\n", "\0binary\n"),
+    ):
+        checkout.write(label, source)
+        (checkout.home / label).write_text(destination)
+    (checkout.home / ".config").mkdir()
+    checkout.write(".config/dir")
+    (checkout.home / ".config" / "dir").mkdir()
+
+    results = checkout.install(check_drift=True)
+    drift = {".config/dir": "differing", "blob": "binary", "edited": "differing", "same": "identical"}
+    assert results["drift"] == drift
+    assert "same conflict is identical" in capsys.readouterr().out
+    assert checkout.symlinks() == []
+
+    checkout.install(replace_identical=True, dryrun=True)
+    assert "same would be replaced by a link" in capsys.readouterr().out
+    assert checkout.symlinks() == []
+
+    results = checkout.install(replace_identical=True)
+    assert results["drift"] == drift
+    assert sorted(results["conflicts"]) == [".config/dir", "blob", "edited"]
+    assert checkout.symlinks() == ["same"]
+    assert (checkout.home / "edited").read_text() == "edited\n"
+
+
+def test_check_drift_reuses_hashes(checkout, monkeypatch):
+    monkeypatch.setattr(checkout.install_py.InstallState, "RACY_WINDOW_NS", 0)
+    checkout.write("zshrc", "text\n")
+    (checkout.home / "zshrc").write_text("edited\n")
+    assert checkout.counters(check_drift=True)["files_hashed"] == 2
+    assert checkout.counters(check_drift=True)["files_hashed"] == 0
+    (checkout.home / "zshrc").write_text("edited again\n")
+    assert checkout.counters(check_drift=True)["files_hashed"] == 1
+
+
+@pytest.fixture
+def watcher(checkout):
+    """A Watcher on checkout after an initial install, as watch() sets it up."""
+    install_py = checkout.install_py
+    stats = install_py.InstallStats()
+    previous = install_py.InstallState.load(checkout.home)
+    state = install_py.InstallState(checkout.home / install_py.STATE_FILE)
+    with install_py.GitIgnoreChecker(stats=stats) as checker, install_py.Inotify() as inotify:
+        sources = install_py.collect_sources(checker, previous, state, stats)
+        install_py.install_sources(checkout.home, sources, previous, state, False, False, stats)
+        yield install_py.Watcher(checkout.home, False, checker, inotify, state, stats)
+
+
+def settle(watcher):
+    """Apply the events of what the test just did, like one Watcher.run batch."""
+    events = watcher.inotify.read(1.0)
+    while True:
+        more = watcher.inotify.read(0.1)
+        if not more:
+            break
+        events.extend(more)
+    watcher.handle(events)
+
+
+def test_watch_file_created_and_deleted(checkout, watcher):
+    checkout.write("zshrc")
+    settle(watcher)
+    assert checkout.symlinks() == ["zshrc"]
+    checkout.remove("zshrc")
+    settle(watcher)
+    assert checkout.symlinks() == []
+
+
+def test_watch_file_renamed(checkout, watcher):
+    checkout.write(".config/x/c")
+    settle(watcher)
+    (checkout.repo / ".config/x/c").rename(checkout.repo / ".config/x/d")
+    settle(watcher)
+    assert checkout.symlinks() == [".config/x/d"]
+
+
+def test_watch_directory_created_and_removed(checkout, watcher):
+    checkout.write(".config/x/c")
+    settle(watcher)
+    assert checkout.symlinks() == [".config/x/c"]
+    # the new directory is watched from then on
+    checkout.write(".config/x/d")
+    settle(watcher)
+    assert checkout.symlinks() == [".config/x/c", ".config/x/d"]
+    shutil.rmtree(checkout.repo / ".config")
+    settle(watcher)
+    assert checkout.symlinks() == []
+
+
+def test_watch_gitignore_edited(checkout, watcher):
+    checkout.write(".config/x/c")
+    checkout.write(".config/x/c.swp")
+    settle(watcher)
+    assert checkout.symlinks() == [".config/x/c", ".config/x/c.swp"]
+    checkout.write(".gitignore", "*.swp\n")
+    settle(watcher)
+    assert checkout.symlinks() == [".config/x/c"]
+
+
+def test_watch_exclude_edited(checkout, watcher):
+    checkout.write("zshrc")
+    checkout.write("local")
+    settle(watcher)
+    (checkout.repo / ".git" / "info" / "exclude").write_text("local\n")
+    settle(watcher)
+    assert checkout.symlinks() == ["zshrc"]
+
+
+def test_watch_ignores_the_checkout_machinery(checkout, watcher):
+    checkout.write(".gitmodules")
+    checkout.write("bench/x")
+    settle(watcher)
+    assert checkout.symlinks() == []
+
+
+def test_prune_after_an_intervening_install(checkout):
+    checkout.write("zshrc")
+    checkout.write(".config/x/c")
+    checkout.write(".config/x/d")
+    checkout.install()
+    checkout.remove("zshrc")
+    checkout.remove(".config/x/c")
+    # e.g. a login hook running before the prune
+    checkout.install()
+
+    assert checkout.prune() == {"removed": [".config/x/c", "zshrc"]}
+    assert checkout.symlinks() == [".config/x/d"]
+
+
+def test_uninstall_after_an_intervening_install(checkout):
+    checkout.write("zshrc")
+    checkout.write(".config/x/c")
+    checkout.install()
+    checkout.remove(".config/x/c")
+    checkout.install()
+
+    assert checkout.prune(uninstall=True) == {"removed": [".config/x/c", "zshrc"]}
+    assert checkout.symlinks() == []
+    assert not (checkout.home / checkout.install_py.STATE_FILE).exists()
+
+
+def test_install_many_names_the_target_in_messages(checkout, tmp_path, capsys, caplog):
+    checkout.write("zshrc")
+    checkout.write("vimrc")
+    other = tmp_path / "other"
+    other.mkdir()
+    (other / "zshrc").write_text("mine\n")
+
+    results = checkout.install_py.do_install_many([checkout.home, other], jobs=2)
+    assert results[str(other)]["conflicts"] == ["zshrc"]
+    assert sorted(capsys.readouterr().out.splitlines()) == sorted(
+        [f"{checkout.home}: vimrc installed", f"{checkout.home}: zshrc installed", f"{other}: vimrc installed"]
+    )
+    assert [record.getMessage() for record in caplog.records if record.levelname == "WARNING"] == [
+        f"{other}: Conflicting file zshrc"
+    ]
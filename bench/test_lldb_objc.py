@@ -0,0 +1,158 @@
+# Checks the Objective-C runtime struct decoding in lldb_funcs.py against
+# the fake lldb module in bench/fakelldb, for objc4 (Apple) and GNUstep
+# libobjc2 layouts:
+#   python -m pytest -q bench
+
+import struct
+import sys
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(REPO_DIR / "bench" / "fakelldb"), str(REPO_DIR)]
+
+import lldb  # the fake
+
+import lldb_funcs
+
+APPLE = "arm64-apple-macosx14.0.0"
+GNUSTEP = "x86_64-unknown-linux-gnu"
+
+
+class Image:
+    """A memory segment built up field by field."""
+
+    def __init__(self, base):
+        self.base = base
+        self.data = bytearray()
+
+    def add(self, data, align=8):
+        self.data += bytes(-len(self.data) % align)
+        address = self.base + len(self.data)
+        self.data += data
+        return address
+
+    def string(self, text):
+        return self.add(text.encode() + b"\0", 1)
+
+    @property
+    def end(self):
+        return self.base + len(self.data)
+
+
+def debugger(triple, images, sections=None, **lists):
+    target = lldb.SBTarget(triple, [(image.base, image.data) for image in images], sections, lists)
+    lldb.reset_stats()
+    return lldb.SBDebugger(target)
+
+
+def helper_expressions():
+    """Expressions other than the class_copy*List call and its free."""
+    return [
+        expression for expression in lldb.STATS["expressions"]
+        if "class_copy" not in expression and not expression.startswith("(void) free")
+    ]
+
+
+def test_read_cstrings_coalesces_nearby_strings():
+    names = Image(0x10000)
+    first, second, third = (names.string(text) for text in ("init", "description", "length"))
+    far = Image(0x900000)
+    other = far.string("dealloc")
+    process = debugger(GNUSTEP, [names, far]).GetSelectedTarget().GetProcess()
+
+    found = lldb_funcs._read_cstrings(process, [third, first, 0, second, other, first])
+    assert found == {first: "init", second: "description", third: "length", other: "dealloc"}
+    # one block read for the run of three, C-string reads for the last of each run
+    assert lldb.STATS["reads"] == 1
+    assert lldb.STATS["cstring_reads"] == 2
+
+
+def test_read_cstrings_unreadable():
+    process = debugger(GNUSTEP, []).GetSelectedTarget().GetProcess()
+    assert lldb_funcs._read_cstrings(process, [0x1234]) == {0x1234: None}
+
+
+def test_apple_methods():
+    names = Image(0x10000)
+    init, length = names.string("init"), names.string("length")
+    types = names.string("@16@0:8")
+    selrefs = Image(0x20000)
+    length_ref = selrefs.add(struct.pack("<Q", length))
+    methods = Image(0x30000)
+    big = methods.add(struct.pack("<QQQ", init, types, 0x100001000))
+    # small methods: int32 offsets from each field to the selref, types and imp
+    small = methods.add(b"", 4)
+    methods.add(struct.pack("<iii", length_ref - small, types - (small + 4), 0x2000 - (small + 8)), 4)
+    sections = {"__objc_selrefs": (selrefs.base, selrefs.end)}
+
+    lldb_debugger = debugger(APPLE, [names, selrefs, methods], sections, Method=[big, small | 1])
+    assert lldb_funcs._objc_method_list(lldb_debugger, "cls") == [("init", 0x100001000), ("length", 0x2000)]
+    assert helper_expressions() == []
+
+
+def test_apple_small_method_outside_selrefs():
+    # shared-cache small methods count their selector from a base the
+    # decoder doesn't know, so the name comes from the runtime
+    methods = Image(0x30000)
+    small = methods.add(struct.pack("<iii", 0x40, 0, 0x100), 4)
+    target = debugger(APPLE, [methods]).GetSelectedTarget()
+    assert lldb_funcs._decode_objc_methods(target, [small | 1]) == [(None, small + 8 + 0x100)]
+
+
+def test_apple_properties_and_ivars():
+    names = Image(0x10000)
+    title, title_attributes = names.string("title"), names.string("T@\"NSString\",C,N,V_title")
+    count_name, count_type = names.string("_count"), names.string("i")
+    title_name, title_type = names.string("_title"), names.string("@\"NSString\"")
+    data = Image(0x30000)
+    prop = data.add(struct.pack("<QQ", title, title_attributes))
+    count_offset, title_offset = data.add(struct.pack("<i", 8), 4), data.add(struct.pack("<i", 16), 4)
+    count_ivar = data.add(struct.pack("<QQQII", count_offset, count_name, count_type, 2, 4))
+    title_ivar = data.add(struct.pack("<QQQII", title_offset, title_name, title_type, 3, 8))
+    obj = Image(0x50000)
+    instance = obj.add(struct.pack("<QiiQ", 0x60000, 42, 0, 0))
+
+    lldb_debugger = debugger(APPLE, [names, data, obj], Property=[prop], Ivar=[count_ivar, title_ivar])
+    assert lldb_funcs._objc_property_list(lldb_debugger, "cls") == [("title", 'T@"NSString",C,N,V_title')]
+    ivars = lldb_funcs._objc_ivar_list(lldb_debugger, "cls")
+    assert ivars == [("_count", 8, "i", 4, count_ivar), ("_title", 16, '@"NSString"', 8, title_ivar)]
+    assert lldb_funcs._objc_ivar_value(lldb_debugger, instance, ivars[0]) == "42"
+    assert lldb_funcs._objc_ivar_value(lldb_debugger, instance, ivars[1]) == "nil"
+    assert helper_expressions() == []
+
+
+def test_gnustep_methods_and_ivars():
+    names = Image(0x10000)
+    init, types = names.string("init"), names.string("@16@0:8")
+    flag_name, flag_type = names.string("flag"), names.string("^v")
+    data = Image(0x30000)
+    # a SEL points at a struct objc_selector whose first word is the name
+    selector = data.add(struct.pack("<QQ", init, types))
+    method = data.add(struct.pack("<QQQ", 0x401000, selector, types))
+    flag_offset = data.add(struct.pack("<i", 8), 4)
+    ivar = data.add(struct.pack("<QQQII", flag_name, flag_type, flag_offset, 8, 0))
+    obj = Image(0x50000)
+    instance = obj.add(struct.pack("<QQ", 0x60000, 0xDEADBEEF))
+
+    lldb_debugger = debugger(GNUSTEP, [names, data, obj], Method=[method], Ivar=[ivar])
+    assert lldb_funcs._objc_method_list(lldb_debugger, "cls") == [("init", 0x401000)]
+    ivars = lldb_funcs._objc_ivar_list(lldb_debugger, "cls")
+    assert ivars == [("flag", 8, "^v", 8, ivar)]
+    assert lldb_funcs._objc_ivar_value(lldb_debugger, instance, ivars[0]) == "0xdeadbeef"
+    assert helper_expressions() == []
+
+
+def test_gnustep_registered_selector_falls_back_to_runtime():
+    data = Image(0x30000)
+    # once registered, the selector's first word is a table index
+    selector = data.add(struct.pack("<QQ", 17, 0))
+    method = data.add(struct.pack("<QQQ", 0x401000, selector, 0))
+    lldb_debugger = debugger(GNUSTEP, [data], Method=[method])
+    assert lldb_funcs._objc_method_list(lldb_debugger, "cls") == [("", 0x401000)]
+    assert [expression for expression in helper_expressions() if "method_getName" in expression]
+
+
+def test_unreadable_handles_fall_back_to_runtime():
+    lldb_debugger = debugger(GNUSTEP, [], Ivar=[0xBAD0])
+    assert lldb_funcs._objc_ivar_list(lldb_debugger, "cls") == [("", None, None, None, 0xBAD0)]
+    assert [expression for expression in helper_expressions() if "ivar_getName" in expression]
@@ -0,0 +1,109 @@
+# Checks the expression-free std::string summary provider in lldb_funcs.py
+# against the fake lldb module in bench/fakelldb, on the libstdc++ and
+# libc++ layouts of every character width:
+#   python -m pytest -q bench
+
+import io
+import struct
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(REPO_DIR / "bench" / "fakelldb"), str(REPO_DIR)]
+
+import lldb  # the fake
+
+import lldb_funcs
+
+OBJECT = 0x10000
+HEAP = 0x20000
+CHARS = {1: "char", 2: "char16_t", 4: "wchar_t"}
+ENCODINGS = {1: "utf-8", 2: "utf-16-le", 4: "utf-32-le"}
+
+
+def libstdcxx(text, width=1):
+    """(object bytes, heap bytes) of a libstdc++ basic_string: _M_p, the
+    length and a 16-byte SSO buffer, which the capacity shares."""
+    data = text.encode(ENCODINGS[width])
+    length = len(text)
+    if len(data) < 16:
+        return struct.pack("<QQ", OBJECT + 16, length) + data.ljust(16, b"\0"), b""
+    return struct.pack("<QQQQ", HEAP, length, length, 0), data + bytes(width)
+
+
+def libcxx(text, width=1):
+    """(object bytes, heap bytes) of a libc++ basic_string: a short one
+    keeps length << 1 in its first byte and the characters inline from the
+    next character on; a long one has capacity | 1, the length and the
+    data pointer."""
+    data = text.encode(ENCODINGS[width])
+    length = len(text)
+    if len(data) < 24 - width:
+        return (bytes([length << 1]) + bytes(width - 1) + data).ljust(24, b"\0"), b""
+    return struct.pack("<QQQ", (length + 1) | 1, length, HEAP), data + bytes(width)
+
+
+def string_value(type_name, size, layout, width=1, pointer=False):
+    obj, heap = layout
+    target = lldb.SBTarget(memory=[(OBJECT, obj), (HEAP, heap or b"\0"), (0x30000, struct.pack("<Q", OBJECT))])
+    sbtype = lldb.SBType(type_name, size, arguments=[lldb.SBType(CHARS[width], width)])
+    if pointer:
+        return lldb.SBValue(OBJECT, type=lldb.SBType(f"{type_name} *", 8, sbtype), address=0x30000, target=target)
+    return lldb.SBValue(type=sbtype, address=OBJECT, target=target)
+
+
+LIBSTDCXX = "std::__cxx11::basic_string<{0}, std::char_traits<{0}>, std::allocator<{0}> >"
+LIBCXX = "std::__1::basic_string<{0}, std::__1::char_traits<{0}>, std::__1::allocator<{0}> >"
+SHORT, LONG = "hello", "a string too long for any SSO buffer"
+
+
+@pytest.mark.parametrize("type_name, size, make, text", [
+    (LIBSTDCXX, 32, libstdcxx, SHORT),
+    (LIBSTDCXX, 32, libstdcxx, LONG),
+    (LIBCXX, 24, libcxx, SHORT),
+    (LIBCXX, 24, libcxx, LONG),
+    # a typedef that doesn't give the library away
+    ("std::string", 32, libstdcxx, SHORT),
+    ("std::string", 32, libstdcxx, LONG),
+    ("std::string", 24, libcxx, SHORT),
+    ("std::string", 24, libcxx, LONG),
+], ids=["libstdc++-sso", "libstdc++-heap", "libc++-short", "libc++-long",
+        "string-sso", "string-heap", "string-short", "string-long"])
+def test_summary_layouts(type_name, size, make, text):
+    value = string_value(type_name.format("char"), size, make(text))
+    assert lldb_funcs.stdstring_summary(value, {}) == f'"{text}"'
+
+
+@pytest.mark.parametrize("width, prefix", [(2, "u"), (4, "L")])
+@pytest.mark.parametrize("type_name, size, make", [(LIBSTDCXX, 32, libstdcxx), (LIBCXX, 24, libcxx)])
+def test_summary_wide_characters(type_name, size, make, width, prefix):
+    for text in ("hé", LONG):
+        value = string_value(type_name.format(CHARS[width]), size, make(text, width), width)
+        assert lldb_funcs.stdstring_summary(value, {}) == f'{prefix}"{text}"'
+
+
+def test_summary_through_a_pointer_and_escaped():
+    value = string_value(LIBCXX.format("char"), 24, libcxx('say "hi"\n'), pointer=True)
+    assert lldb_funcs.stdstring_summary(value, {}) == '"say \\"hi\\"\\n"'
+
+
+def test_summary_of_unreadable_memory():
+    value = lldb.SBValue(type=lldb.SBType(LIBCXX.format("char"), 24), address=0xBAD0, target=lldb.SBTarget())
+    assert lldb_funcs.stdstring_summary(value, {}) is None
+
+
+@pytest.mark.parametrize("type_name, size, make", [(LIBSTDCXX, 32, libstdcxx), (LIBCXX, 24, libcxx)])
+def test_summary_cap(type_name, size, make, monkeypatch):
+    monkeypatch.setattr(lldb_funcs, "stdstring_summary_cap", lldb_funcs.stdstring_summary_cap)
+    result = io.StringIO()
+    lldb_funcs.stdstringsummary(None, "--cap 4", result, {})
+    assert result.getvalue() == "std::string summaries show up to 4 characters\n"
+
+    value = string_value(type_name.format("char"), size, make(LONG))
+    assert lldb_funcs.stdstring_summary(value, {}) == f'"{LONG[:4]}"...'
+    # a string that fits isn't cut
+    assert lldb_funcs.stdstring_summary(string_value(type_name.format("char"), size, make("abcd")), {}) == '"abcd"'
+    lldb_funcs.stdstringsummary(None, "--cap 0", result, {})
+    assert lldb_funcs.stdstring_summary(value, {}) == '""...'
@@ -0,0 +1,262 @@
+# Drives the scripted thread plans in lldb_funcs.py (the step-to-* and ct
+# commands) against the fake lldb module in bench/fakelldb. Each test puts
+# the thread somewhere and checks what the plan makes of the stop:
+#   python -m pytest -q bench
+
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(REPO_DIR / "bench" / "fakelldb"), str(REPO_DIR)]
+
+import lldb  # the fake
+
+import insn_sites
+import lldb_funcs
+
+BASE = 0x401000
+STACK = 0x7FF000
+PLAIN = (3, "mov rax, qword ptr [rbp - 0x8]")
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches(monkeypatch):
+    # the fake's processes all share one unique ID
+    monkeypatch.setattr(lldb_funcs, "_insn_cache", lldb_funcs._InsnCache())
+    insn_sites.forget_writes()
+
+
+def code_target(asms, section=".text"):
+    """A target whose main executable's section holds asms, [length, asm]
+    laid out from BASE, with a small stack at STACK. The code bytes differ
+    from one instruction to the next."""
+    instructions = {}
+    data = bytearray()
+    for number, (length, asm) in enumerate(asms, 1):
+        instructions[BASE + len(data)] = (length, asm)
+        data += bytes([number]) * length
+    module = lldb.SBModule("a.out", [lldb.SBSection(section, BASE, len(data))])
+    return lldb.SBTarget(memory=[(BASE, data), (STACK, bytes(16))], modules=[module], instructions=instructions)
+
+
+def step_plan(plan_class, target, pc, *args):
+    thread = lldb.SBThread(target.GetProcess())
+    thread.frames = [(pc, STACK)]
+    return plan_class(lldb.SBThreadPlan(thread), *args, {})
+
+
+def stop_at(plan, pc, reason=lldb.eStopReasonTrace):
+    """Move plan's thread to pc, and return whether the plan explains and
+    ends that stop."""
+    plan.thread.frames[0] = (pc, STACK)
+    plan.thread.stop_reason = reason
+    return plan.explains_stop(None), plan.should_stop(None)
+
+
+@pytest.mark.parametrize("plan_class, asm", [
+    (lldb_funcs.ScriptedStepToCall, "call 0x402000"),
+    (lldb_funcs.ScriptedStepToBranch, "jne 0x401000"),
+    (lldb_funcs.ScriptedStepToSyscall, "syscall"),
+    (lldb_funcs.ScriptedStepToAntiDebug, "rdtsc"),
+])
+def test_step_plans_stop_at_their_match(plan_class, asm):
+    target = code_target([PLAIN, PLAIN, (2, asm)])
+    plan = step_plan(plan_class, target, BASE)
+
+    # runs straight to the match, indexed from the .text section
+    assert stop_at(plan, BASE) == (True, False)
+    assert [queued.run_to for queued in plan.thread_plan.queued] == [BASE + 6]
+    assert not plan.should_step()
+
+    assert stop_at(plan, BASE + 6) == (True, True)
+    assert plan.thread_plan.complete is True
+
+
+def test_step_plans_only_explain_their_own_steps():
+    plan = step_plan(lldb_funcs.ScriptedStepToCall, code_target([PLAIN]), BASE)
+    plan.thread.stop_reason = lldb.eStopReasonSignal
+    assert not plan.explains_stop(None)
+    plan.thread.stop_reason = lldb.eStopReasonBreakpoint
+    assert not plan.explains_stop(None)
+    plan.thread.stop_reason = lldb.eStopReasonTrace
+    assert plan.explains_stop(None)
+
+
+def test_step_plans_step_over_other_control_flow():
+    target = code_target([PLAIN, (2, "jmp rax"), (5, "call 0x402000")])
+    plan = step_plan(lldb_funcs.ScriptedStepToCall, target, BASE)
+    assert stop_at(plan, BASE) == (True, False)
+    assert [queued.run_to for queued in plan.thread_plan.queued] == [BASE + 3]
+    # an indirect jump's destination is only known by stepping it
+    assert stop_at(plan, BASE + 3) == (True, False)
+    assert plan.should_step()
+
+
+def test_step_plans_step_outside_indexed_code():
+    target = code_target([PLAIN, PLAIN, (5, "call 0x402000")], section=".init")
+    plan = step_plan(lldb_funcs.ScriptedStepToCall, target, BASE)
+    assert stop_at(plan, BASE) == (True, False)
+    assert plan.thread_plan.queued == []
+    assert plan.should_step()
+    assert stop_at(plan, BASE + 3) == (True, False)
+    assert stop_at(plan, BASE + 6) == (True, True)
+
+
+def test_decoded_instructions_are_reused_until_rewritten():
+    target = code_target([PLAIN, (5, "call 0x402000")], section=".init")
+    plan = step_plan(lldb_funcs.ScriptedStepToCall, target, BASE)
+    lldb.reset_stats()
+    stop_at(plan, BASE)
+    stop_at(plan, BASE)
+    assert lldb.STATS["instructions"] == 1
+
+    # a breakpoint or patch changes the bytes, so the pc is decoded again
+    target.instructions[BASE] = (3, "call rax")
+    target.GetProcess().WriteMemory(BASE, b"\xff\xd0\x90", lldb.SBError())
+    assert stop_at(plan, BASE) == (True, True)
+    assert lldb.STATS["instructions"] == 2
+
+
+def test_step_to_antidebug_clears_the_pushed_trap_flag():
+    target = code_target([(1, "pushfq"), PLAIN])
+    process = target.GetProcess()
+    plan = step_plan(lldb_funcs.ScriptedStepToAntiDebug, target, BASE)
+    assert stop_at(plan, BASE) == (True, True)
+
+    # after the pushf the flags, trap flag set by the stepping, are on the stack
+    process.WriteMemory(STACK, (0x346).to_bytes(2, "little"), lldb.SBError())
+    assert stop_at(plan, BASE + 1) == (True, True)
+    assert process.ReadUnsignedFromMemory(STACK, 2, lldb.SBError()) == 0x246
+
+
+def test_range_index():
+    ranges = lldb_funcs._RangeIndex([(0x3000, 0x3800), (0x1000, 0x2000), (0x1800, 0x2800), (0x2800, 0x2900),
+                                     (0x5000, 0x5000)])
+    # overlapping and touching ranges merge, empty ones are dropped
+    assert len(ranges) == 2
+    inside = [0x1000, 0x1FFF, 0x2000, 0x28FF, 0x3000, 0x37FF]
+    outside = [0, 0xFFF, 0x2900, 0x2FFF, 0x3800, 0x5000, 1 << 63]
+    assert [address in ranges for address in inside + outside] == [True] * len(inside) + [False] * len(outside)
+    assert 0x1000 not in lldb_funcs._RangeIndex([])
+
+
+def modules_target():
+    """a.out with .text, .data and a Mach-O style __TEXT/__text, plus
+    libfoo.so and the not yet loaded libbar.so."""
+    text = lldb.SBSection(".text", BASE, 0x100)
+    data = lldb.SBSection(".data", 0x600000, 0x100, lldb.eSectionTypeData)
+    segment = lldb.SBSection("__TEXT", 0x500000, 0x1000, lldb.eSectionTypeContainer,
+                             [lldb.SBSection("__text", 0x500100, 0x200)])
+    main = lldb.SBModule("a.out", [text, data, segment])
+    foo = lldb.SBModule("libfoo.so", [lldb.SBSection(".text", 0x7F0000, 0x1000)])
+    bar = lldb.SBModule("libbar.so", [lldb.SBSection(".text", size=0x1000)])
+    return lldb.SBTarget(memory=[(STACK, bytes(16))], modules=[main, foo, bar])
+
+
+@pytest.mark.parametrize("specs, expected", [
+    ([], [(0x401000, 0x401100), (0x500100, 0x500300)]),
+    (["libfoo.so"], [(0x7F0000, 0x7F1000)]),
+    ([".data"], [(0x600000, 0x600100)]),
+    (["a.out:__text", "libfoo.so:.text"], [(0x500100, 0x500300), (0x7F0000, 0x7F1000)]),
+    (["libbar.so"], []),
+])
+def test_code_ranges(specs, expected):
+    ranges, _ = lldb_funcs._code_ranges(modules_target(), specs)
+    assert sorted(ranges) == expected
+
+
+def test_code_ranges_unknown_module():
+    with pytest.raises(ValueError, match="no module named libbaz.so"):
+        lldb_funcs._code_ranges(modules_target(), ["libbaz.so:.text"])
+
+
+def target_plan(target, ranges=None):
+    args = lldb.SBStructuredData({"ranges": ranges} if ranges else None)
+    return step_plan(lldb_funcs.ScriptedStepToTarget, target, 0x7F0010, args)
+
+
+def entry_breakpoints(target):
+    return [bp for bp in target.breakpoints.values() if lldb_funcs.ScriptedStepToTarget.ENTRY_BP_NAME in bp.names]
+
+
+def test_step_to_target_stops_in_its_ranges():
+    target = modules_target()
+    plan = target_plan(target, "libfoo.so")
+    assert stop_at(plan, 0x7F0010) == (True, True)
+    assert plan.thread_plan.complete is True
+    assert target.breakpoints == {}
+
+
+def test_step_to_target_runs_to_an_entry_breakpoint():
+    target = modules_target()
+    plan = target_plan(target)
+    assert stop_at(plan, 0x7F0010) == (True, False)
+    assert plan.thread_plan.queued == []
+    assert not plan.should_step()
+    bp, = entry_breakpoints(target)
+    assert (bp.modules, bp.one_shot, bp.thread_id) == (["a.out"], True, 1)
+
+    plan.thread.stop_data = [bp.GetID()]
+    assert stop_at(plan, BASE, lldb.eStopReasonBreakpoint) == (True, True)
+    assert target.breakpoints == {}
+
+
+def test_step_to_target_runs_out_to_a_caller_or_a_callback():
+    target = modules_target()
+    plan = target_plan(target)
+    plan.thread.frames = [(0x7F0010, STACK), (0x7F0100, STACK), (BASE + 0x20, STACK)]
+    assert stop_at(plan, 0x7F0010) == (True, False)
+    run_to, = plan.thread_plan.queued
+    assert run_to.run_to == BASE + 0x20
+    # the entry breakpoint catches a callback into the ranges on the way
+    bp, = entry_breakpoints(target)
+
+    plan.thread.stop_data = [bp.GetID()]
+    assert stop_at(plan, BASE + 0x40, lldb.eStopReasonBreakpoint) == (True, True)
+    assert run_to.complete is False
+    assert target.breakpoints == {}
+
+
+def test_step_to_target_reaches_the_return_address_first():
+    target = modules_target()
+    plan = target_plan(target)
+    plan.thread.frames = [(0x7F0010, STACK), (BASE + 0x20, STACK)]
+    stop_at(plan, 0x7F0010)
+    run_to, = plan.thread_plan.queued
+    run_to.SetPlanComplete(True)
+    plan.thread.frames = [(BASE + 0x20, STACK)]
+    assert plan.should_stop(None)
+    assert target.breakpoints == {}
+
+
+def test_step_to_target_keeps_going_past_foreign_code_entries():
+    target = modules_target()
+    plan = target_plan(target, "a.out:.text")
+    stop_at(plan, 0x7F0010)
+    bp, = entry_breakpoints(target)
+    # an entry of a.out outside the ranges: armed again
+    plan.thread.stop_data = [bp.GetID()]
+    assert stop_at(plan, 0x500100, lldb.eStopReasonBreakpoint) == (True, False)
+    armed, = entry_breakpoints(target)
+    assert armed.GetID() != bp.GetID()
+
+
+def test_step_to_target_drops_its_breakpoint_on_other_stops():
+    target = modules_target()
+    plan = target_plan(target)
+    stop_at(plan, 0x7F0010)
+    plan.thread.stop_reason = lldb.eStopReasonBreakpoint
+    plan.thread.stop_data = [999]
+    assert not plan.explains_stop(None)
+    assert target.breakpoints == {}
+
+
+def test_step_to_target_deletes_leftover_entry_breakpoints():
+    target = modules_target()
+    leftover = target.BreakpointCreateByRegex(".", lldb.SBFileSpecList(), lldb.SBFileSpecList())
+    leftover.AddName(lldb_funcs.ScriptedStepToTarget.ENTRY_BP_NAME)
+    user = target.BreakpointCreateByRegex("main", lldb.SBFileSpecList(), lldb.SBFileSpecList())
+    target_plan(target)
+    assert list(target.breakpoints) == [user.GetID()]
@@ -0,0 +1,1193 @@
+import array
+import collections
+import concurrent.futures
+import contextlib
+import mmap
+import os
+import re
+import struct
+import time
+
+import gdb
+
+# imported on first use by the stubs gdb_funcs.py registers, which has put
+# this directory (and so insn_sites.py) on sys.path
+import insn_sites
+
+
+class Command:
+    '''Base of the commands below. They are not gdb.Commands themselves:
+    gdb_funcs.py registers a stub under each name and hands invoke() on.'''
+
+    def __init__(self, name, command_class):
+        self.name = name
+        self.command_class = command_class
+
+
+class PrintFlags(Command):
+    '''Print x86-64 EFLAGS/RFLAGS or AArch64 CPSR/PSTATE flags in a readable format'''
+
+    DIM = '\x1b[90m'
+    RESET = '\x1b[39m'
+    X86_FLAGBITS = (
+        ('CF', 0), ('PF', 2), ('AF', 4), ('ZF', 6), ('SF', 7),
+        ('TF', 8), ('IF', 9), ('DF', 10), ('OF', 11), ('NT', 14),
+        ('RF', 16), ('VM', 17), ('AC', 18), ('VIF', 19), ('VIP', 20),
+        ('ID', 21),
+    )
+    AARCH64_FLAGBITS = (
+        ('F', 6), ('I', 7), ('A', 8), ('D', 9), ('IL', 20), ('SS', 21),
+        ('V', 28), ('C', 29), ('Z', 30), ('N', 31),
+    )
+
+    def __init__(self):
+        super().__init__('flags', gdb.COMMAND_STATUS)
+
+    def _read_register(self, name):
+        frame = gdb.selected_frame()
+        try:
+            value = frame.read_register(name)
+        except (ValueError, gdb.error):
+            return None
+        return int(value) & 0xffffffff
+
+    def invoke(self, argument, from_tty):
+        # gdb exposes the full flags register as either $eflags or $rflags
+        # depending on the arch/build; try both before falling back to cpsr.
+        flags = self._read_register('eflags')
+        if flags is None:
+            flags = self._read_register('rflags')
+
+        if flags is not None:
+            flagbits = self.X86_FLAGBITS
+            extra_fields = [(7, f"IOPL={(flags >> 12) & 0x3}")]
+        else:
+            flags = self._read_register('cpsr')
+            if flags is None:
+                print('flags: no eflags/rflags or cpsr register in the selected frame')
+                return
+            flagbits = self.AARCH64_FLAGBITS
+            extra_fields = []
+
+        rendered_flags = [
+            name if flags & (1 << bit) else f"{self.DIM}{name}{self.RESET}"
+            for name, bit in reversed(flagbits)
+        ]
+        for index, field in extra_fields:
+            rendered_flags.insert(index, field)
+        print(' '.join(rendered_flags))
+
+
+class PrintStdString(Command):
+    '''Prints out a string from a std::string object
+
+    Usage: printstdstring OBJECT [--impl libc++|libstdc++]
+    OBJECT is the std::string, its address or a pointer to it.'''
+
+    def __init__(self):
+        super().__init__('printstdstring', gdb.COMMAND_DATA)
+
+    def invoke(self, argument, from_tty):
+        args = gdb.string_to_argv(argument)
+        impl = None
+        obj = None
+        i = 0
+        while i < len(args):
+            if args[i] == '--impl':
+                i += 1
+                impl = args[i] if i < len(args) else None
+            else:
+                obj = args[i]
+            i += 1
+        if obj is None:
+            print('printstdstring: expected a std::string object/address')
+            return
+
+        try:
+            address = _address_of(obj)
+            header = _read_memory(address, _STDSTRING_SIZE['libstdc++'])
+            impl = impl or _stdstring_impl(address, header)
+            print(_read_stdstrings([_stdstring_extent(address, header, impl)])[0])
+        except gdb.error as error:
+            print(f'printstdstring: {error}')
+
+
+class PrintStdStrings(Command):
+    '''Prints the strings of a std::vector<std::string> or std::string array
+
+    Usage: printstdstrings OBJECT [COUNT] [--impl libc++|libstdc++] [--limit N]
+    With COUNT, OBJECT is the first of COUNT consecutive std::strings (or its
+    address); without, it is a std::vector<std::string> (or its address).
+    --limit prints only the first N strings.'''
+
+    # strings whose headers are read, and printed, at a time
+    BLOCK = 4096
+
+    def __init__(self):
+        super().__init__('printstdstrings', gdb.COMMAND_DATA)
+
+    def invoke(self, argument, from_tty):
+        args = gdb.string_to_argv(argument)
+        impl = None
+        limit = None
+        positional = []
+        i = 0
+        while i < len(args):
+            if args[i] == '--impl':
+                i += 1
+                impl = args[i] if i < len(args) else None
+            elif args[i] == '--limit' and i + 1 < len(args):
+                i += 1
+                limit = int(args[i], 0)
+            else:
+                positional.append(args[i])
+            i += 1
+        if not 1 <= len(positional) <= 2:
+            print('printstdstrings: expected a vector/array object and optional count')
+            return
+
+        try:
+            base = _address_of(positional[0])
+            if len(positional) == 2:
+                end = None
+                count = int(gdb.parse_and_eval(positional[1]))
+            else:
+                # libstdc++ and libc++ vectors both start with begin, end
+                base, end = struct.unpack('<QQ', _read_memory(base, 16))
+                count = None
+            if base == end or count == 0:
+                print('0 strings')
+                return
+            impl = impl or _stdstring_impl(base, _read_memory(base, _STDSTRING_SIZE['libstdc++']))
+            size = _STDSTRING_SIZE[impl]
+            if count is None:
+                if end < base or (end - base) % size:
+                    print(f'printstdstrings: {positional[0]} does not look like a {impl} vector of strings')
+                    return
+                count = (end - base) // size
+        except gdb.error as error:
+            print(f'printstdstrings: {error}')
+            return
+
+        print(f'{count} strings')
+        shown = count if limit is None else min(limit, count)
+        for first in range(0, shown, self.BLOCK):
+            number = min(self.BLOCK, shown - first)
+            address = base + first * size
+            try:
+                headers = _read_memory(address, number * size)
+            except gdb.error as error:
+                print(f'printstdstrings: {error}')
+                return
+            extents = [
+                _stdstring_extent(address + offset, headers[offset:offset + size], impl)
+                for offset in range(0, number * size, size)
+            ]
+            for index, text in enumerate(_read_stdstrings(extents), first):
+                print(f'[{index}] {text}')
+        if shown < count:
+            print(f'... {count - shown} more')
+
+
+_STDSTRING_SIZE = {'libstdc++': 32, 'libc++': 24}
+# a longer length means a garbage header rather than a string
+_STDSTRING_MAX = 1 << 30
+# heap buffers closer together than this are fetched with one read, as long
+# as that read stays under _COALESCE_SPAN
+_COALESCE_GAP = 4096
+_COALESCE_SPAN = 1 << 20
+
+
+def _address_of(expr):
+    '''Evaluate expr to an address: a pointer or integer as is, anything
+    else (a std::string, a vector, an array) by its own address.'''
+    value = gdb.parse_and_eval(expr)
+    if value.type.strip_typedefs().code in (gdb.TYPE_CODE_PTR, gdb.TYPE_CODE_INT):
+        return int(value) & 0xffffffffffffffff
+    if value.address is None:
+        raise gdb.error(f'{expr} has no address')
+    return int(value.address)
+
+
+def _read_memory(address, size):
+    return bytes(gdb.selected_inferior().read_memory(address, size))
+
+
+def _stdstring_impl(address, header):
+    '''Guess the std::string layout by checking whether the first word is a
+    plausible data pointer (libstdc++) or an inline SSO byte (libc++).'''
+    pointer, length, capacity = struct.unpack_from('<QQQ', header)
+    # libstdc++'s _M_p either points into the object's own SSO buffer
+    # (obj+16) or to a separate heap allocation of more than 15 characters.
+    # libc++'s first word is a length/flags byte plus inline characters, or
+    # an odd capacity for a long string.
+    if pointer == address + 16:
+        return 'libstdc++'
+    if pointer > 0x1000 and not pointer & 1 and 15 < length <= capacity < _STDSTRING_MAX:
+        return 'libstdc++'
+    return 'libc++'
+
+
+def _stdstring_extent(address, header, impl):
+    '''Return (data address, length, inline data or None) of the std::string
+    at address, whose first bytes are header.'''
+    if impl == 'libstdc++':
+        # first word points directly at the character data (SSO or heap)
+        pointer, length = struct.unpack_from('<QQ', header)
+        if pointer == address + 16 and length < 16:
+            return pointer, length, header[16:16 + length]
+        return pointer, length, None
+    # libc++: low bit of the first byte flags a long (heap) string
+    if header[0] & 1:
+        length, pointer = struct.unpack_from('<QQ', header, 8)
+        return pointer, length, None
+    length = header[0] >> 1
+    return address + 1, length, header[1:1 + length]
+
+
+def _read_stdstrings(extents):
+    '''Return the text of every (data address, length, inline data) extent,
+    reading heap data that lies close together in one go.'''
+    data = [inline for _, _, inline in extents]
+    pending = sorted(
+        (pointer, length, index)
+        for index, (pointer, length, inline) in enumerate(extents)
+        if inline is None and length <= _STDSTRING_MAX
+    )
+    runs = []
+    for pointer, length, index in pending:
+        if runs and pointer - runs[-1][1] <= _COALESCE_GAP and pointer + length - runs[-1][0] <= _COALESCE_SPAN:
+            runs[-1][1] = max(runs[-1][1], pointer + length)
+            runs[-1][2].append((pointer, length, index))
+        else:
+            runs.append([pointer, pointer + length, [(pointer, length, index)]])
+
+    for start, end, members in runs:
+        try:
+            block = _read_memory(start, end - start) if end > start else b''
+        except gdb.error:
+            block = None
+        for pointer, length, index in members:
+            if block is not None:
+                data[index] = block[pointer - start:pointer - start + length]
+                continue
+            try:
+                data[index] = _read_memory(pointer, length)
+            except gdb.error:
+                pass
+
+    return [
+        chunk.decode('utf-8', 'backslashreplace') if chunk is not None else '<unreadable>'
+        for chunk in data
+    ]
+
+
+_Insn = collections.namedtuple('_Insn', 'addr length asm flags target')
+
+
+class _DecodeCache:
+    '''Decoded, pre-classified instructions per inferior, keyed by pc, and
+    the insn_sites.SiteIndex of each loaded .text section.
+
+    Shared by the step-to-* commands so that their predicates are a flag
+    test on a cached _Insn. Entries are dropped per inferior when it exits,
+    wholesale when objfiles are loaded or cleared, and per instruction when
+    gdb writes over them; a written-to section loses its index.'''
+
+    def __init__(self):
+        self._inferiors = {}
+        # (start, end, objfile) of every loaded .text, read from `info files`
+        self._sections = None
+        gdb.events.memory_changed.connect(self._memory_changed)
+        gdb.events.new_objfile.connect(self._objfiles_changed)
+        gdb.events.clear_objfiles.connect(self._objfiles_cleared)
+        gdb.events.exited.connect(self._exited)
+
+    def get(self, arch, pc):
+        return next(self.walk(arch, pc, chunk=1))
+
+    def walk(self, arch, start, chunk=64):
+        '''Yield the instructions from start onwards in address order,
+        disassembling chunk at a time on a miss.'''
+        table = self._inferiors.setdefault(gdb.selected_inferior().num, {})
+        aarch64 = insn_sites.is_aarch64(arch.name())
+        address = start
+        while True:
+            insn = table.get(address)
+            if insn is None:
+                for raw in arch.disassemble(address, count=chunk):
+                    flags, target = insn_sites.classify_asm(raw['asm'], aarch64)
+                    table[raw['addr']] = _Insn(raw['addr'], raw['length'], raw['asm'], flags, target)
+                insn = table[address]
+            yield insn
+            address = insn.addr + insn.length
+
+    def site_index(self, arch, pc):
+        '''Return the SiteIndex of the .text section holding pc, or None.'''
+        if self._sections is None:
+            self._sections = self._text_sections()
+        for start, end, objfile in self._sections:
+            if start <= pc < end:
+                break
+        else:
+            return None
+
+        inferior = gdb.selected_inferior()
+
+        def read(address, size):
+            return bytes(inferior.read_memory(address, size))
+
+        def disassemble(address, code):
+            for raw in arch.disassemble(address, address + len(code) - 1):
+                yield raw['addr'], raw['length'], raw['asm']
+
+        build_id = getattr(objfile, 'build_id', None)
+        try:
+            return insn_sites.load_or_build(build_id, start, end - start, arch.name(), read, disassemble)
+        except gdb.error:
+            return None
+
+    def _text_sections(self):
+        objfiles = {objfile.filename: objfile for objfile in gdb.objfiles()}
+        main = objfiles.get(gdb.current_progspace().filename)
+        output = gdb.execute('info files', to_string=True)
+        return [
+            (int(start, 16), int(end, 16), objfiles.get(name) if name else main)
+            for start, end, name in re.findall(
+                r'^\s*(0x[0-9a-f]+) - (0x[0-9a-f]+) is \.text(?: in (.+))?$', output, re.MULTILINE,
+            )
+        ]
+
+    def _memory_changed(self, event):
+        start = int(event.address)
+        end = start + event.length
+        for table in self._inferiors.values():
+            for pc in range(start - insn_sites.MAX_LENGTH, end):
+                insn = table.get(pc)
+                if insn is not None and pc + insn.length > start:
+                    del table[pc]
+        insn_sites.forget(start, event.length)
+
+    def _objfiles_changed(self, event):
+        self._inferiors.clear()
+        self._sections = None
+
+    def _objfiles_cleared(self, event):
+        self._objfiles_changed(event)
+        # the code is read from its files again, without earlier patches
+        insn_sites.forget_writes()
+
+    def _exited(self, event):
+        inferior = getattr(event, 'inferior', None)
+        if inferior is None:
+            self._inferiors.clear()
+        else:
+            self._inferiors.pop(inferior.num, None)
+
+_decode_cache = _DecodeCache()
+
+
+class _StepUntil(Command):
+    '''Base for commands that run until a predicate matches the current
+    instruction. GDB has no thread-plan API, so the plain way is a stepi loop.
+
+    With FAST (the default unless --stepi is given) the code ahead of the pc
+    is disassembled up to the next control-flow or matching instruction, a
+    temporary breakpoint goes there and the inferior continues, so only block
+    ends cost a stop. Direct branches get a breakpoint at the end of each
+    successor block; indirect ones are stepped over with stepi. Inside a
+    .text section the next site comes from its insn_sites.SiteIndex rather
+    than from disassembling ahead.
+
+    Subclasses set MATCH to the insn_sites flags they stop on.'''
+
+    MAX_STEPS = 100000
+    FAST = True
+    MATCH = 0
+    # instructions per disassemble() call when scanning ahead, and how far a
+    # scan goes before settling for a breakpoint in the middle of a block
+    SCAN_CHUNK = 64
+    SCAN_LIMIT = 4096
+
+    def _current_instruction(self):
+        frame = gdb.selected_frame()
+        arch = frame.architecture()
+        return _decode_cache.get(arch, int(frame.pc())), arch
+
+    def _matches(self, insn):
+        return bool(insn.flags & self.MATCH)
+
+    def invoke(self, argument, from_tty):
+        args = gdb.string_to_argv(argument)
+        fast = self.FAST and '--stepi' not in args
+        all_threads = '--all-threads' in args
+        if all_threads and not fast:
+            print(f'{self.name}: --all-threads needs the breakpoint mode, not stepi')
+            return
+        self.executed = self.stops = self.stepis = 0
+        self.per_thread = collections.Counter()
+        start = time.perf_counter()
+        if all_threads:
+            status = self._run_all_threads()
+        else:
+            status = self._run_fast() if fast else self._run_stepi()
+        elapsed = time.perf_counter() - start
+        if status == 'no-program':
+            print(f'{self.name}: no running program')
+            return
+        if status == 'match':
+            if all_threads:
+                print(f'{self.name}: matched in thread {gdb.selected_thread().num}')
+            gdb.execute('x/i $pc')
+        elif status == 'gave-up':
+            print(f'{self.name}: gave up after {self.MAX_STEPS} instructions')
+        else:
+            print(f'{self.name}: {status} before reaching a match')
+
+        rate = self.executed / elapsed if elapsed else 0
+        detail = f'{self.stops} breakpoint stops, {self.stepis} stepi' if fast else 'stepi'
+        print(f'{self.name}: {self.executed} instructions in {elapsed:.3f}s '
+              f'({rate:,.0f}/s, {detail})')
+        if all_threads:
+            for thread in sorted(self.per_thread):
+                print(f'  thread {thread}: {self.per_thread[thread]} instructions')
+
+    def _run_stepi(self):
+        for _ in range(self.MAX_STEPS):
+            try:
+                insn, _ = self._current_instruction()
+            except gdb.error:
+                return 'no-program'
+            if self._matches(insn):
+                return 'match'
+            gdb.execute('stepi', to_string=True)
+            self.executed += 1
+        return 'gave-up'
+
+    def _run_fast(self):
+        while True:
+            try:
+                insn, arch = self._current_instruction()
+            except gdb.error:
+                return 'no-program'
+            if self._matches(insn):
+                return 'match'
+
+            legs = self._legs(insn, arch)
+            if not legs:
+                self._stepi()
+                continue
+
+            breakpoints = self._break_at(legs, gdb.selected_thread())
+            try:
+                output = gdb.execute('continue', to_string=True)
+            finally:
+                self._delete(breakpoints)
+            if not gdb.selected_inferior().pid:
+                print(output, end='')
+                return 'exited'
+            pc = int(gdb.selected_frame().pc())
+            if pc not in legs:
+                # a user breakpoint, a signal, ...: show gdb's report of it
+                print(output, end='')
+                return 'stopped'
+            self.stops += 1
+            self.executed += legs[pc]
+
+    def _run_all_threads(self):
+        '''Like _run_fast, for every thread of the inferior at once.
+
+        Each thread gets its own thread-specific breakpoints; all threads run
+        together and only the one that stopped is advanced. A thread can't
+        leave its block without reaching its breakpoint, so the others'
+        breakpoints stay valid. stepi over an indirect branch moves just that
+        thread, under scheduler-locking step.'''
+        inferior = gdb.selected_inferior()
+        if not inferior.pid:
+            return 'no-program'
+        # thread number -> (legs, breakpoints)
+        armed = {}
+        locking = gdb.parameter('scheduler-locking')
+        resume = 'continue -a' if gdb.parameter('non-stop') else 'continue'
+        gdb.execute('set scheduler-locking step', to_string=True)
+        try:
+            while True:
+                for thread in inferior.threads():
+                    if thread.global_num in armed or not thread.is_valid():
+                        continue
+                    thread.switch()
+                    if self._arm(thread, armed):
+                        return 'match'
+
+                output = gdb.execute(resume, to_string=True)
+                if not inferior.pid:
+                    print(output, end='')
+                    return 'exited'
+                thread = gdb.selected_thread()
+                legs, breakpoints = armed.pop(thread.global_num, ({}, []))
+                self._delete(breakpoints)
+                pc = int(gdb.selected_frame().pc())
+                if pc not in legs:
+                    print(output, end='')
+                    return 'stopped'
+                self.stops += 1
+                self.executed += legs[pc]
+                self.per_thread[thread.num] += legs[pc]
+        finally:
+            for _, breakpoints in armed.values():
+                self._delete(breakpoints)
+            gdb.execute(f'set scheduler-locking {locking}', to_string=True)
+
+    def _arm(self, thread, armed):
+        '''Advance the selected thread to a block end and put breakpoints
+        for it into armed; returns True if it is at a match instead.'''
+        while True:
+            insn, arch = self._current_instruction()
+            if self._matches(insn):
+                return True
+            legs = self._legs(insn, arch)
+            if legs:
+                armed[thread.global_num] = (legs, self._break_at(legs, thread))
+                return False
+            self._stepi()
+            self.per_thread[thread.num] += 1
+
+    def _legs(self, insn, arch):
+        '''Return {stop address: instructions executed getting there} for
+        running on from insn, or {} if it has to be stepped over.'''
+        legs = {}
+        try:
+            if not insn.flags & insn_sites.CONTROL:
+                address, count = self._scan(arch, insn.addr)
+                legs[address] = count
+            elif insn.target is not None:
+                successors = [insn.target]
+                if insn.flags & insn_sites.CONDITIONAL:
+                    successors.append(insn.addr + insn.length)
+                for successor in successors:
+                    address, count = self._scan(arch, successor)
+                    legs.setdefault(address, count + 1)
+        except gdb.error:
+            # unreadable code ahead; let stepi deal with it
+            return {}
+        return legs
+
+    def _stepi(self):
+        gdb.execute('stepi', to_string=True)
+        self.stepis += 1
+        self.executed += 1
+
+    def _scan(self, arch, start):
+        '''Return (address, count): the first instruction from start that
+        matches or transfers control, and how many instructions precede it.'''
+        index = _decode_cache.site_index(arch, start)
+        if index is not None:
+            stop = index.next_site(start, insn_sites.CONTROL | self.MATCH)
+            # only trust the index from an instruction its decode agrees on
+            count = index.distance(start, stop) if stop is not None else None
+            if count is not None:
+                return stop, count
+
+        for count, insn in enumerate(_decode_cache.walk(arch, start, self.SCAN_CHUNK)):
+            if count == self.SCAN_LIMIT or insn.flags & (insn_sites.CONTROL | self.MATCH):
+                return insn.addr, count
+
+    def _break_at(self, addresses, thread):
+        '''Put internal temporary breakpoints for thread at addresses.'''
+        breakpoints = []
+        for address in addresses:
+            bp = gdb.Breakpoint(f'*{address:#x}', internal=True, temporary=True)
+            bp.thread = thread.global_num
+            breakpoints.append(bp)
+        return breakpoints
+
+    def _delete(self, breakpoints):
+        for bp in breakpoints:
+            if bp.is_valid():
+                bp.delete()
+
+
+class StepToCall(_StepUntil):
+    '''Run until reaching a call instruction
+
+    Usage: step-to-call [--stepi | --all-threads]
+    --stepi single-steps every instruction instead of breaking at block ends.
+    --all-threads runs every thread and stops in whichever gets there first.'''
+    name = 'step-to-call'
+    MATCH = insn_sites.CALL
+
+    def __init__(self):
+        super().__init__('step-to-call', gdb.COMMAND_RUNNING)
+
+
+class StepToBranch(_StepUntil):
+    '''Run until reaching a branch instruction
+
+    Usage: step-to-branch [--stepi | --all-threads]
+    --stepi single-steps every instruction instead of breaking at block ends.
+    --all-threads runs every thread and stops in whichever gets there first.'''
+    name = 'step-to-branch'
+    MATCH = insn_sites.BRANCH
+
+    def __init__(self):
+        super().__init__('step-to-branch', gdb.COMMAND_RUNNING)
+
+
+class StepToSyscall(_StepUntil):
+    '''Run until reaching a system-call instruction
+
+    Usage: step-to-syscall [--scan | --stepi] [--all-threads] [SYSCALL...]
+    By default a temporary `catch syscall` catchpoint lets the inferior run
+    at full speed to the kernel entry of the next system call, optionally
+    only of the SYSCALL names or numbers given, and the instruction that
+    trapped is shown. Where catch syscall isn't supported this falls back to
+    --scan, breaking at block ends like step-to-call; --stepi single-steps
+    every instruction. --all-threads stops at whichever thread's system call
+    (or, with --scan, instruction) comes first.'''
+    name = 'step-to-syscall'
+    MATCH = insn_sites.SYSCALL
+
+    def __init__(self):
+        super().__init__('step-to-syscall', gdb.COMMAND_RUNNING)
+
+    def invoke(self, argument, from_tty):
+        args = gdb.string_to_argv(argument)
+        if '--scan' in args or '--stepi' in args:
+            super().invoke(argument, from_tty)
+            return
+        all_threads = '--all-threads' in args
+        args = [arg for arg in args if arg != '--all-threads']
+        if not gdb.selected_inferior().pid:
+            print(f'{self.name}: no running program')
+            return
+        try:
+            created = gdb.execute(' '.join(['catch', 'syscall'] + args), to_string=True)
+        except gdb.error as error:
+            if args:
+                print(f'{self.name}: {error}')
+                return
+            print(f'{self.name}: catch syscall unavailable ({error}), scanning instead')
+            super().invoke(argument, from_tty)
+            return
+        number = re.search(r'Catchpoint (\d+)', created).group(1)
+
+        thread = gdb.selected_thread()
+        start = time.perf_counter()
+        try:
+            while True:
+                output = gdb.execute('continue', to_string=True)
+                if not gdb.selected_inferior().pid:
+                    print(output, end='')
+                    print(f'{self.name}: exited before reaching a match')
+                    return
+                if f'Catchpoint {number} (returned from syscall' in output:
+                    # the selected thread was sitting on a syscall entry
+                    continue
+                entry = re.search(rf'Catchpoint {number} \((call to syscall [^)]*)\)', output)
+                if entry is None:
+                    print(output, end='')
+                    print(f'{self.name}: stopped before reaching a match')
+                    return
+                if not all_threads and gdb.selected_thread().global_num != thread.global_num:
+                    # another thread's syscall; this command follows one thread
+                    thread.switch()
+                    continue
+                break
+        finally:
+            gdb.execute(f'delete {number}', to_string=True)
+        elapsed = time.perf_counter() - start
+
+        if all_threads:
+            print(f'{self.name}: matched in thread {gdb.selected_thread().num}')
+        self._show_trapping_instruction()
+        print(f'{self.name}: {entry.group(1)} after {elapsed:.3f}s (catch syscall)')
+
+    def _show_trapping_instruction(self):
+        '''At syscall entry the pc is past the instruction that trapped; show
+        that instruction, as the stepping modes would, when it can be found.'''
+        frame = gdb.selected_frame()
+        arch = frame.architecture()
+        pc = int(frame.pc())
+        # syscall, sysenter and int 0x80 are two bytes; svc is four
+        size = 4 if insn_sites.is_aarch64(arch.name()) else 2
+        try:
+            insn = _decode_cache.get(arch, pc - size)
+        except gdb.error:
+            insn = None
+        if insn is not None and insn.flags & insn_sites.SYSCALL and insn.addr + insn.length == pc:
+            gdb.execute(f'x/i {insn.addr:#x}')
+        else:
+            gdb.execute('x/i $pc')
+
+
+class StepToAntiDebug(_StepUntil):
+    '''Single-step until reaching a potential anti-debug instruction (pushf /
+    rdtsc). On pushf, masks the trap flag out of the pushed value.'''
+    name = 'step-to-antidebug'
+    # _matches has to see the instruction after a pushf, so always stepi
+    FAST = False
+
+    def __init__(self):
+        super().__init__('step-to-antidebug', gdb.COMMAND_RUNNING)
+        self._pushf_pending = False
+
+    def _matches(self, insn):
+        if self._pushf_pending:
+            self._pushf_pending = False
+            # the just-executed pushf placed flags at the top of the stack;
+            # clear the trap flag (bit 8) so debugger detection can't see it.
+            sp = int(gdb.selected_frame().read_register('sp'))
+            try:
+                current = int(gdb.parse_and_eval(f'*(unsigned short *){sp}'))
+                gdb.execute(f'set *(unsigned short *){sp} = {current & 0xfeff}',
+                            to_string=True)
+            except gdb.error:
+                pass
+            return True
+        if insn.flags & insn_sites.PUSHF:
+            self._pushf_pending = True
+            return False
+        return bool(insn.flags & insn_sites.RDTSC)
+
+
+# trace-record --until kinds
+_TRACE_UNTIL = {
+    'call': insn_sites.CALL,
+    'branch': insn_sites.BRANCH,
+    'syscall': insn_sites.SYSCALL,
+}
+
+
+class _TraceFile:
+    '''Instruction trace written by trace-record and read by trace-stats.
+
+    A 16-byte header (magic, version, whether flags were recorded) followed
+    by fixed-width records of two native-endian uint64: the pc, and the
+    instruction length | flags register << 8. Records are buffered and
+    written BATCH at a time; reading maps the file instead of parsing it.'''
+
+    HEADER = struct.Struct('<4sHHQ')
+    MAGIC = b'GTRC'
+    VERSION = 1
+    BATCH = 1 << 16
+
+    def __init__(self, path, with_flags):
+        self.path = path
+        self.records = 0
+        self._buffer = array.array('Q')
+        # the file stays open for appends unless the header check fails
+        with contextlib.ExitStack() as stack:
+            self._file = stack.enter_context(open(path, 'ab'))
+            if self._file.tell() == 0:
+                self._file.write(self.HEADER.pack(self.MAGIC, self.VERSION, with_flags, 0))
+            elif self.read_header(path) != with_flags:
+                raise ValueError(f'{path} was recorded {"without" if with_flags else "with"} --flags')
+            stack.pop_all()
+
+    @classmethod
+    def read_header(cls, path):
+        '''Return whether the trace at path has flags; ValueError if it
+        isn't a trace.'''
+        with open(path, 'rb') as file:
+            header = file.read(cls.HEADER.size)
+        if len(header) != cls.HEADER.size:
+            raise ValueError(f'{path} is not a trace file')
+        magic, version, with_flags, _ = cls.HEADER.unpack(header)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError(f'{path} is not a version {cls.VERSION} trace file')
+        return bool(with_flags)
+
+    @classmethod
+    @contextlib.contextmanager
+    def mapped(cls, path):
+        '''Yield the records of path as a flat uint64 memoryview.'''
+        cls.read_header(path)
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            size = (len(mapping) - cls.HEADER.size) // 16 * 16
+            with contextlib.ExitStack() as stack:
+                raw = stack.enter_context(memoryview(mapping))
+                body = stack.enter_context(raw[cls.HEADER.size:cls.HEADER.size + size])
+                yield stack.enter_context(body.cast('Q'))
+
+    def append(self, pc, length, flags=0):
+        self._buffer.extend((pc, length | flags << 8))
+        self.records += 1
+        if len(self._buffer) >= 2 * self.BATCH:
+            self.flush()
+
+    def flush(self):
+        self._buffer.tofile(self._file)
+        del self._buffer[:]
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+class TraceRecord(_StepUntil):
+    '''Single-step, appending every executed pc to a binary trace file
+
+    Usage: trace-record FILE [--count N] [--flags] [--until call|branch|syscall]
+    Steps at most N instructions (default 100000), or until the next
+    instruction of the given kind. --flags also records the flags register
+    that the flags command shows. Summarise the file with trace-stats.'''
+    name = 'trace-record'
+    # every pc is wanted, so this always steps
+    FAST = False
+
+    def __init__(self):
+        super().__init__('trace-record', gdb.COMMAND_RUNNING)
+
+    def invoke(self, argument, from_tty):
+        args = gdb.string_to_argv(argument)
+        path = None
+        with_flags = False
+        self.MATCH = 0
+        self.MAX_STEPS = type(self).MAX_STEPS
+        i = 0
+        while i < len(args):
+            if args[i] == '--count' and i + 1 < len(args):
+                i += 1
+                self.MAX_STEPS = int(args[i], 0)
+            elif args[i] == '--until' and i + 1 < len(args) and args[i + 1] in _TRACE_UNTIL:
+                i += 1
+                self.MATCH = _TRACE_UNTIL[args[i]]
+            elif args[i] == '--flags':
+                with_flags = True
+            else:
+                path = args[i]
+            i += 1
+        if path is None:
+            print('trace-record: expected a trace FILE')
+            return
+
+        self._flags_register = self._find_flags_register() if with_flags else None
+        try:
+            self._trace = _TraceFile(path, with_flags)
+        except (OSError, ValueError) as error:
+            print(f'trace-record: {error}')
+            return
+        self.executed = 0
+        start = time.perf_counter()
+        try:
+            status = self._run_stepi()
+        finally:
+            self._trace.close()
+        elapsed = time.perf_counter() - start
+        if status == 'no-program':
+            print('trace-record: no running program')
+            return
+        if status == 'match':
+            gdb.execute('x/i $pc')
+        rate = self.executed / elapsed if elapsed else 0
+        print(f'trace-record: {self._trace.records} records appended to {path} '
+              f'in {elapsed:.3f}s ({rate:,.0f}/s)')
+
+    def _find_flags_register(self):
+        frame = gdb.selected_frame()
+        for name in ('eflags', 'rflags', 'cpsr'):
+            try:
+                frame.read_register(name)
+            except (ValueError, gdb.error):
+                continue
+            return name
+        return None
+
+    def _matches(self, insn):
+        # the instruction stopped at is not executed, so not recorded
+        if super()._matches(insn):
+            return True
+        flags = 0
+        if self._flags_register is not None:
+            flags = int(gdb.selected_frame().read_register(self._flags_register)) & 0xffffffff
+        self._trace.append(insn.addr, insn.length, flags)
+        return False
+
+
+class TraceStats(Command):
+    '''Summarise a trace-record file: hottest pcs and basic blocks
+
+    Usage: trace-stats FILE [--top N]
+    A basic block starts at every recorded pc that doesn't directly follow
+    the previous record's instruction.'''
+
+    def __init__(self):
+        super().__init__('trace-stats', gdb.COMMAND_STATUS)
+
+    def invoke(self, argument, from_tty):
+        args = gdb.string_to_argv(argument)
+        path = None
+        top = 20
+        i = 0
+        while i < len(args):
+            if args[i] == '--top' and i + 1 < len(args):
+                i += 1
+                top = int(args[i], 0)
+            else:
+                path = args[i]
+            i += 1
+        if path is None:
+            print('trace-stats: expected a trace FILE')
+            return
+
+        try:
+            with _TraceFile.mapped(path) as records, records[0::2] as pcs, records[1::2] as infos:
+                hits = collections.Counter(pcs)
+                blocks = collections.Counter()
+                expected = None
+                for pc, info in zip(pcs, infos):
+                    if pc != expected:
+                        blocks[pc] += 1
+                    expected = pc + (info & 0xff)
+                total = len(pcs)
+        except (OSError, ValueError) as error:
+            print(f'trace-stats: {error}')
+            return
+
+        entries = sum(blocks.values())
+        print(f'{total} instructions, {len(hits)} distinct pcs, {len(blocks)} distinct basic blocks '
+              f'({entries} block entries)')
+        for title, counter, count_total in (('hot pcs', hits, total), ('hot blocks', blocks, entries)):
+            print(f'{title}:')
+            for pc, count in counter.most_common(top):
+                print(f'  {count:>12} {100 * count / count_total:6.2f}%  {pc:#x}  {self._symbol(pc)}')
+
+    def _symbol(self, pc):
+        try:
+            return gdb.execute(f'info symbol {pc:#x}', to_string=True).strip()
+        except gdb.error:
+            return ''
+
+
+class MemSearch(Command):
+    '''Search the inferior's memory for a byte pattern
+
+    Usage: memsearch [--string | --hex | --pointer] PATTERN [--limit N] [--threads N]
+    PATTERN is text (the default), hex bytes (de ad be ef) or, with
+    --pointer, an expression whose value is searched for as a pointer-width
+    integer in target byte order. Quote text with spaces. Every readable mapping (`info proc
+    mappings`, or the load segments of a core file) is read in large chunks.
+    --threads N scans the dumped part of a core file's segments straight
+    from the file on N worker threads, and the rest through gdb. At most N
+    hits are shown (--limit, default 1000).'''
+
+    CHUNK = 16 << 20
+
+    def __init__(self):
+        super().__init__('memsearch', gdb.COMMAND_DATA)
+
+    def invoke(self, argument, from_tty):
+        args = gdb.string_to_argv(argument)
+        kind = '--string'
+        limit = 1000
+        threads = 0
+        words = []
+        i = 0
+        while i < len(args):
+            if args[i] in ('--string', '--hex', '--pointer'):
+                kind = args[i]
+            elif args[i] == '--limit' and i + 1 < len(args):
+                i += 1
+                limit = int(args[i], 0)
+            elif args[i] == '--threads' and i + 1 < len(args):
+                i += 1
+                threads = int(args[i], 0)
+            else:
+                words.append(args[i])
+            i += 1
+        if not words:
+            print('memsearch: expected a PATTERN')
+            return
+        if len(words) > 1 and kind == '--string':
+            print(f'memsearch: expected one PATTERN, got {len(words)}; quote text with spaces')
+            return
+        # hex bytes and expressions may be given unquoted
+        pattern = ' '.join(words)
+
+        try:
+            needle = self._needle(kind, pattern)
+        except (ValueError, gdb.error) as error:
+            print(f'memsearch: bad pattern {pattern!r}: {error}')
+            return
+        if not needle:
+            print('memsearch: empty pattern')
+            return
+
+        start = time.perf_counter()
+        core = self._core_file()
+        if threads and core is None:
+            print('memsearch: --threads needs a core file; reading through gdb instead')
+        try:
+            if threads and core is not None:
+                hits, scanned = self._search_core(core, needle, limit, threads)
+            else:
+                hits, scanned = self._search(self._regions(core is not None), needle, limit)
+        except gdb.error as error:
+            print(f'memsearch: {error}')
+            return
+        elapsed = time.perf_counter() - start
+
+        for address, name, region_start in hits[:limit]:
+            print(f'{address:#x}  {name}+{address - region_start:#x}')
+        more = ' (limit reached)' if len(hits) >= limit else ''
+        print(f'memsearch: {min(len(hits), limit)} hits{more} in {scanned / 1e6:,.1f} MB, {elapsed:.3f}s')
+
+    def _needle(self, kind, pattern):
+        if kind == '--hex':
+            return bytes.fromhex(pattern.replace('0x', '').replace(',', ' '))
+        if kind == '--pointer':
+            value = int(gdb.parse_and_eval(pattern))
+            width = gdb.lookup_type('void').pointer().sizeof
+            order = 'big' if 'big endian' in gdb.execute('show endian', to_string=True) else 'little'
+            return (value & ((1 << 8 * width) - 1)).to_bytes(width, order)
+        return pattern.encode()
+
+    def _core_file(self):
+        match = re.search(r"Local core dump file:\s*`([^']+)'", gdb.execute('info files', to_string=True))
+        return match.group(1) if match else None
+
+    def _regions(self, core):
+        '''Return (start, end, name) of every readable region.'''
+        if core:
+            output = gdb.execute('info files', to_string=True)
+            return [
+                (int(start, 16), int(end, 16), name)
+                for start, end, name in re.findall(r'(0x[0-9a-f]+) - (0x[0-9a-f]+) is (load\w+)', output)
+            ]
+        output = gdb.execute('info proc mappings', to_string=True)
+        regions = []
+        for start, end, perms, name in re.findall(
+            r'^\s*(0x[0-9a-f]+)\s+(0x[0-9a-f]+)\s+0x[0-9a-f]+\s+0x[0-9a-f]+\s*([r-][w-][x-][ps])?\s*(.*)$',
+            output, re.MULTILINE,
+        ):
+            # older gdbs have no Perms column; unreadable chunks are skipped
+            if perms and perms[0] != 'r':
+                continue
+            regions.append((int(start, 16), int(end, 16), name.strip() or '[anon]'))
+        return regions
+
+    def _search(self, regions, needle, limit):
+        inferior = gdb.selected_inferior()
+
+        def read(address, size):
+            return inferior.read_memory(address, size)
+
+        hits = []
+        scanned = 0
+        for start, end, name in regions:
+            found, size = _scan_region(read, start, end, needle, self.CHUNK, limit - len(hits), gdb.error)
+            hits.extend((address, name, start) for address in found)
+            scanned += size
+            if len(hits) >= limit:
+                break
+        return hits, scanned
+
+    def _search_core(self, core, needle, limit, threads):
+        '''Scan the dumped part of the core file's PT_LOAD segments
+        directly, one segment per task, so gdb's memory reads (main thread
+        only) aren't needed for it. The rest of each segment, e.g. read-only
+        code gdb reads from the mapped files, is searched through gdb
+        afterwards.'''
+        segments = _core_segments(core)
+        if segments is None:
+            print('memsearch: not a 64-bit little-endian ELF core; reading through gdb instead')
+            return self._search(self._regions(True), needle, limit)
+
+        fd = os.open(core, os.O_RDONLY)
+        try:
+            def scan(segment):
+                _, start, size, _, offset = segment
+                return _scan_region(
+                    lambda address, count: os.pread(fd, count, offset + address - start),
+                    start, start + size, needle, self.CHUNK, limit, OSError,
+                )
+
+            dumped = [segment for segment in segments if segment[2]]
+            with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+                results = list(executor.map(scan, dumped))
+        finally:
+            os.close(fd)
+        hits = [
+            (address, name, start)
+            for (name, start, _, _, _), (found, _) in zip(dumped, results)
+            for address in found
+        ]
+        scanned = sum(size for _, size in results)
+
+        # a match straddling the end of the dumped part starts in its tail
+        overlap = len(needle) - 1
+        rest = [
+            (max(start, start + filesz - overlap), start + memsz, name)
+            for name, start, filesz, memsz, _ in segments
+            if memsz > filesz
+        ]
+        if rest:
+            starts = {name: start for name, start, _, _, _ in segments}
+            found, size = self._search(rest, needle, limit)
+            hits.extend((address, name, starts[name]) for address, name, _ in found)
+            scanned += size
+        return sorted(hits), scanned
+
+
+def _find_all(data, needle):
+    position = data.find(needle)
+    while position != -1:
+        yield position
+        position = data.find(needle, position + 1)
+
+
+def _scan_region(read, start, end, needle, chunk, limit, errors):
+    '''Return (addresses of up to limit matches of needle in [start, end),
+    bytes read). read(address, size) returns a buffer and raises errors for
+    an unreadable chunk, which is skipped. A match straddling two chunks is
+    found from the tail of the first.'''
+    hits = []
+    scanned = 0
+    overlap = len(needle) - 1
+    tail = b''
+    address = start
+    while address < end and len(hits) < limit:
+        size = min(chunk, end - address)
+        try:
+            data = bytes(read(address, size))
+        except errors:
+            tail = b''
+            address += size
+            continue
+        scanned += len(data)
+        if tail:
+            # only matches that start in the tail; the rest are found below
+            hits.extend(
+                address - len(tail) + position
+                for position in _find_all(tail + data[:overlap], needle)
+                if position < len(tail)
+            )
+        hits.extend(address + position for position in _find_all(data, needle))
+        tail = data[-overlap:] if overlap else b''
+        address += size
+    return hits[:limit], scanned
+
+
+def _core_segments(path):
+    '''Return (name, vaddr, filesz, memsz, offset) of a core file's PT_LOAD
+    segments, named loadN as gdb does, or None for anything but a 64-bit
+    little-endian ELF. Only the first filesz bytes are in the file.'''
+    with open(path, 'rb') as file:
+        header = file.read(64)
+        if len(header) < 64 or header[:4] != b'\x7fELF' or header[4] != 2 or header[5] != 1:
+            return None
+        phoff, = struct.unpack_from('<Q', header, 0x20)
+        phentsize, phnum = struct.unpack_from('<HH', header, 0x36)
+        file.seek(phoff)
+        table = file.read(phentsize * phnum)
+    segments = []
+    loads = 0
+    for index in range(phnum):
+        p_type, _, offset, vaddr, _, filesz, memsz, _ = struct.unpack_from('<IIQQQQQQ', table, index * phentsize)
+        if p_type != 1:
+            continue
+        loads += 1
+        if memsz:
+            segments.append((f'load{loads}', vaddr, filesz, memsz, offset))
+    return segments
+
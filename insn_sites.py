@@ -0,0 +1,372 @@
+'''Control-flow site index shared by gdb_commands.py and lldb_funcs.py.
+
+classify() sorts an instruction into call/branch/syscall/pushf/rdtsc kinds
+with one set of mnemonic tables for both debuggers. SiteIndex covers a
+module's code: one bulk read, one linear decode pass, and sorted arrays of
+the sites that bisect can jump between. Indexes are kept on disk under
+$XDG_CACHE_HOME/insn_sites, keyed by build-id.'''
+
+import array
+import bisect
+import os
+import struct
+
+try:
+    import capstone
+except ImportError:
+    capstone = None
+
+
+CALL = 1 << 0
+BRANCH = 1 << 1
+# any transfer of control (branches plus far/transactional jumps)
+CONTROL = 1 << 2
+CONDITIONAL = 1 << 3
+SYSCALL = 1 << 4
+PUSHF = 1 << 5
+RDTSC = 1 << 6
+
+# longest x86 instruction
+MAX_LENGTH = 15
+
+# Most code a debugger's own disassembler is asked to index in one go.
+# Without capstone every instruction of the pass costs a round trip through
+# gdb or lldb, which for a libc-sized .text blocks the first step command
+# for seconds to minutes; larger code is scanned block by block instead.
+DISASSEMBLE_LIMIT = 1 << 16
+
+# x86: conditional/unconditional jumps, calls, returns, loops. Matched
+# exactly (not by prefix) so mnemonics like bt/bswap/bsr aren't mistaken
+# for branches.
+X86_JCC = (
+    'ja', 'jae', 'jb', 'jbe', 'jc', 'jcxz', 'je', 'jecxz', 'jg', 'jge',
+    'jl', 'jle', 'jmp', 'jna', 'jnae', 'jnb', 'jnbe', 'jnc', 'jne', 'jng',
+    'jnge', 'jnl', 'jnle', 'jno', 'jnp', 'jns', 'jnz', 'jo', 'jp', 'jpe',
+    'jpo', 'jrcxz', 'js', 'jz',
+)
+X86_OTHER = (
+    'call', 'ret', 'retf', 'iret', 'iretd', 'iretq',
+    'loop', 'loope', 'loopne', 'loopnz', 'loopz',
+)
+# far and transactional transfers: not branches for step-to-branch, but
+# nothing can scan past them
+X86_FAR = ('ljmp', 'lcall', 'jmpf', 'callf', 'xbegin')
+# AArch64: B/BL/BR/BLR/RET (and their pointer-authenticating forms),
+# conditional B.cond (b.eq, ...), and the compare/test-and-branch forms
+# cbz/cbnz/tbz/tbnz.
+AARCH64_BRANCH = (
+    'b', 'bl', 'br', 'blr', 'ret', 'cbz', 'cbnz', 'tbz', 'tbnz',
+    'braa', 'brab', 'braaz', 'brabz', 'blraa', 'blrab', 'blraaz', 'blrabz',
+    'retaa', 'retab', 'eret',
+)
+AARCH64_CALL = ('bl', 'blr', 'blraa', 'blrab', 'blraaz', 'blrabz')
+
+# x86 prefixes disassemblers print ahead of the mnemonic ("bnd jmp", ...)
+PREFIXES = ('bnd', 'notrack', 'lock', 'rep', 'repe', 'repz', 'repne', 'repnz', 'data16', 'addr32')
+
+_X86_TRANSFERS = frozenset(X86_JCC + X86_OTHER + X86_FAR)
+
+
+def is_aarch64(arch_name):
+    return 'aarch64' in arch_name or 'arm' in arch_name
+
+
+def split_insn(asm):
+    '''Split disassembly into (mnemonic, operands), skipping x86 prefixes.'''
+    rest = asm or ''
+    while True:
+        parts = rest.split(None, 1)
+        if not parts:
+            return '', ''
+        mnem = parts[0].lower()
+        rest = parts[1] if len(parts) > 1 else ''
+        if mnem not in PREFIXES:
+            return mnem, rest.strip()
+
+
+def direct_target(operands):
+    '''Return the branch target if it's an immediate in the operands (the
+    last one, after dropping a <symbol+off> annotation), else None.'''
+    field = operands.rsplit(',', 1)[-1].split('<', 1)[0].split()
+    if len(field) != 1 or not field[0].startswith('0x'):
+        return None
+    try:
+        return int(field[0], 16)
+    except ValueError:
+        return None
+
+
+def classify(mnem, operands, aarch64):
+    '''Return (flags, direct target or None) for one instruction.'''
+    flags = 0
+    if aarch64:
+        # b.eq, b.ne, ... share the b. prefix
+        if mnem in AARCH64_BRANCH or mnem.startswith('b.'):
+            flags |= BRANCH | CONTROL
+        if mnem in AARCH64_CALL:
+            flags |= CALL
+        if mnem.startswith('b.') or mnem in ('cbz', 'cbnz', 'tbz', 'tbnz'):
+            flags |= CONDITIONAL
+        if mnem == 'svc':
+            flags |= SYSCALL
+    else:
+        # AT&T size suffixes: callq, jmpq, retq, ...
+        if mnem not in _X86_TRANSFERS and mnem[-1:] in ('l', 'q', 'w') and mnem[:-1] in _X86_TRANSFERS:
+            mnem = mnem[:-1]
+        if mnem in X86_JCC or mnem in X86_OTHER:
+            flags |= BRANCH | CONTROL
+        elif mnem in X86_FAR:
+            flags |= CONTROL
+        if mnem == 'call':
+            flags |= CALL
+        # xbegin goes on to the next instruction, or to its abort handler
+        if (mnem in X86_JCC and mnem != 'jmp') or mnem.startswith('loop') or mnem == 'xbegin':
+            flags |= CONDITIONAL
+        # syscall/sysenter/int 0x80
+        if mnem in ('syscall', 'sysenter') or (mnem == 'int' and '0x80' in operands):
+            flags |= SYSCALL
+        if 'pushf' in mnem:
+            flags |= PUSHF
+        if 'rdtsc' in mnem:
+            flags |= RDTSC
+    target = direct_target(operands) if flags & CONTROL else None
+    return flags, target
+
+
+def classify_asm(asm, aarch64):
+    mnem, operands = split_insn(asm)
+    return classify(mnem, operands, aarch64)
+
+
+def _signed(value, bits):
+    return value - (1 << bits) if value >> (bits - 1) & 1 else value
+
+
+def _aarch64_sites(code):
+    '''Yield (offset, flags) for the control-flow words of AArch64 code,
+    decoded from the encoding rather than a disassembler.'''
+    for index, (word,) in enumerate(struct.iter_unpack('<I', code[:len(code) // 4 * 4])):
+        if word & 0x7c000000 == 0x14000000:
+            # B / BL
+            flags = BRANCH | CONTROL | (CALL if word >> 31 else 0)
+        elif word & 0xff000010 == 0x54000000 or word & 0x7c000000 == 0x34000000:
+            # B.cond, CBZ/CBNZ, TBZ/TBNZ
+            flags = BRANCH | CONTROL | CONDITIONAL
+        elif word & 0xfe000000 == 0xd6000000:
+            # BR/BLR/RET/ERET and the pointer-authenticating forms; opc
+            # x001 is a branch with link
+            flags = BRANCH | CONTROL | (CALL if (word >> 21) & 0x7 == 1 else 0)
+        elif word & 0xffe0001f == 0xd4000001:
+            flags = SYSCALL
+        else:
+            continue
+        yield index * 4, flags
+
+
+def _capstone_stream(start, code, arch_name):
+    mode = capstone.CS_MODE_64 if '64' in arch_name else capstone.CS_MODE_32
+    disassembler = capstone.Cs(capstone.CS_ARCH_X86, mode)
+    # carry on over undecodable bytes instead of stopping
+    disassembler.skipdata = True
+    for address, size, mnemonic, op_str in disassembler.disasm_lite(bytes(code), start):
+        yield address, size, f'{mnemonic} {op_str}'
+
+
+class SiteIndex:
+    '''Sorted offsets and flags of the control-flow sites in one code range.
+
+    For variable-length code the offset of every decoded instruction is kept
+    too, so that distance() can count instructions between two of them.'''
+
+    HEADER = struct.Struct('<4sHHQII')
+    MAGIC = b'SITE'
+    VERSION = 1
+
+    def __init__(self, start, size, width, sites, flags, boundaries):
+        self.start = start
+        self.size = size
+        # instruction width for fixed-length code, 0 if variable
+        self.width = width
+        self.sites = sites
+        self.flags = flags
+        self.boundaries = boundaries
+        self._by_mask = {}
+
+    @classmethod
+    def build(cls, start, code, arch_name, disassemble=None):
+        '''Index code, the bytes at start, in one linear pass.
+
+        AArch64 is decoded here; x86 goes through capstone when it's
+        installed, else disassemble(start, code), which yields (address,
+        length, asm) in order, for up to DISASSEMBLE_LIMIT bytes.
+        ValueError if none of these applies.'''
+        sites = array.array('I')
+        flags = array.array('B')
+        boundaries = array.array('I')
+        if 'aarch64' in arch_name or 'arm64' in arch_name:
+            for offset, kind in _aarch64_sites(code):
+                sites.append(offset)
+                flags.append(kind)
+            return cls(start, len(code), 4, sites, flags, boundaries)
+        if is_aarch64(arch_name):
+            raise ValueError(f'no site decoder for {arch_name}')
+
+        if not can_build(arch_name, len(code), disassemble):
+            raise ValueError(f'no disassembler for {len(code)} bytes of {arch_name}')
+        if capstone is not None:
+            stream = _capstone_stream(start, code, arch_name)
+        else:
+            stream = disassemble(start, code)
+        for address, _, asm in stream:
+            offset = address - start
+            boundaries.append(offset)
+            kind, _ = classify_asm(asm, False)
+            if kind:
+                sites.append(offset)
+                flags.append(kind)
+        return cls(start, len(code), 0, sites, flags, boundaries)
+
+    @classmethod
+    def load(cls, path, start):
+        with open(path, 'rb') as file:
+            header = file.read(cls.HEADER.size)
+            if len(header) != cls.HEADER.size:
+                raise ValueError(f'{path} is truncated')
+            magic, version, width, size, site_count, boundary_count = cls.HEADER.unpack(header)
+            if magic != cls.MAGIC or version != cls.VERSION:
+                raise ValueError(f'{path} is not a version {cls.VERSION} site index')
+            sites = array.array('I')
+            boundaries = array.array('I')
+            flags = array.array('B')
+            try:
+                sites.fromfile(file, site_count)
+                boundaries.fromfile(file, boundary_count)
+                flags.fromfile(file, site_count)
+            except EOFError:
+                raise ValueError(f'{path} is truncated')
+        return cls(start, size, width, sites, flags, boundaries)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(self.HEADER.pack(
+                self.MAGIC, self.VERSION, self.width, self.size, len(self.sites), len(self.boundaries),
+            ))
+            self.sites.tofile(file)
+            self.boundaries.tofile(file)
+            self.flags.tofile(file)
+        os.replace(temporary, path)
+
+    def covers(self, address):
+        return self.start <= address < self.start + self.size
+
+    def next_site(self, address, mask):
+        '''Return the first site at or after address with any of mask's
+        flags, or None.'''
+        offsets = self._by_mask.get(mask)
+        if offsets is None:
+            offsets = array.array('I', (offset for offset, kind in zip(self.sites, self.flags) if kind & mask))
+            self._by_mask[mask] = offsets
+        index = bisect.bisect_left(offsets, address - self.start)
+        return self.start + offsets[index] if index < len(offsets) else None
+
+    def ordinal(self, address):
+        '''Return the instruction number of address in the linear decode,
+        or None if the decode has no instruction starting there.'''
+        offset = address - self.start
+        if not 0 <= offset < self.size:
+            return None
+        if self.width:
+            return offset // self.width if offset % self.width == 0 else None
+        index = bisect.bisect_left(self.boundaries, offset)
+        if index < len(self.boundaries) and self.boundaries[index] == offset:
+            return index
+        return None
+
+    def distance(self, start, stop):
+        '''Instructions from start up to (not including) stop, or None.'''
+        first = self.ordinal(start)
+        last = self.ordinal(stop)
+        if first is None or last is None:
+            return None
+        return last - first
+
+
+# (build-id, start, size) -> SiteIndex, or None where one can't be built
+_indexes = {}
+# [start, end) ranges written to since the code was loaded, where the
+# build-id's on-disk index no longer describes memory
+_written = []
+
+
+def cache_path(build_id):
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(root, 'insn_sites', f'{build_id}.sites')
+
+
+def can_build(arch_name, size, disassemble=None):
+    '''Whether SiteIndex.build can index size bytes of arch_name code
+    without an excessive number of debugger round trips.'''
+    if 'aarch64' in arch_name or 'arm64' in arch_name:
+        return True
+    if is_aarch64(arch_name):
+        return False
+    if capstone is not None:
+        return True
+    return disassemble is not None and size <= DISASSEMBLE_LIMIT
+
+
+def load_or_build(build_id, start, size, arch_name, read, disassemble=None):
+    '''Return the SiteIndex of the code at [start, start + size), or None.
+
+    read(start, size) returns the code in one piece; disassemble is passed
+    on to SiteIndex.build. With a build_id the index is loaded from, or
+    saved to, the on-disk cache, unless the code was written to (see
+    forget). Code too large to build an index for (see can_build) only
+    gets one from the disk cache.'''
+    key = (build_id, start, size)
+    if key in _indexes:
+        return _indexes[key]
+
+    index = None
+    path = cache_path(build_id) if build_id else None
+    if any(begin < start + size and start < end for begin, end in _written):
+        path = None
+    if path is not None and os.path.exists(path):
+        try:
+            index = SiteIndex.load(path, start)
+        except (OSError, ValueError):
+            index = None
+        if index is not None and index.size != size:
+            index = None
+    if index is None and can_build(arch_name, size, disassemble):
+        try:
+            index = SiteIndex.build(start, read(start, size), arch_name, disassemble)
+        except ValueError:
+            index = None
+        if index is not None and path is not None:
+            try:
+                index.save(path)
+            except OSError:
+                pass
+    _indexes[key] = index
+    return index
+
+
+def forget(start, size):
+    '''Drop in-memory indexes overlapping [start, start + size) after the
+    code there was written to. Until forget_writes(), indexes of code
+    overlapping the range are rebuilt from memory: the on-disk cache is
+    neither read nor updated for them.'''
+    if not any(begin <= start and start + size <= end for begin, end in _written):
+        _written.append((start, start + size))
+    for key in [key for key in _indexes if key[1] < start + size and start < key[1] + key[2]]:
+        del _indexes[key]
+
+
+def forget_writes():
+    '''Forget the writes recorded by forget(), once the code has been
+    reloaded from its files.'''
+    del _written[:]
+    _indexes.clear()
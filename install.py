@@ -5,15 +5,28 @@
 # <cimarronm@gmail.com>
 
 import argparse
+import contextlib
+import ctypes
+import ctypes.util
+import hashlib
+import json
 import logging
 import os
+import select
+import stat
+import struct
 import subprocess
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 log = logging.getLogger(__name__)
 SCRIPT_DIR = Path(__file__).resolve().parent
-IGNORED_FILES = {".git", ".github", ".gitignore", ".gitmodules", Path(__file__).name}
+IGNORED_FILES = {".git", ".github", ".gitignore", ".gitmodules", "bench", Path(__file__).name}
+STATE_FILE = ".install-state.json"
+DRIFT_CHUNK = 1 << 20
 
 
 def parse_log_level(value):
@@ -26,14 +39,75 @@ def parse_log_level(value):
     raise argparse.ArgumentTypeError(f"Invalid log level: {value}")
 
 
-def create_symlink(source_path, destination_path):
-    relative_target = os.path.relpath(source_path, start=destination_path.parent)
-    destination_path.symlink_to(relative_target)
+class InstallStats:
+    """Per-phase wall time and event counters for one install.
+
+    Phases are "manifest" (loading the previous state), "walk" (scanning the
+    source tree, which includes "gitignore"), "link", "drift" and "save".
+    """
+
+    COUNTERS = (
+        "files_walked",
+        "directories_listed",
+        "directories_reused",
+        "git_processes",
+        "gitignore_queries",
+        "stat_calls",
+        "links_reused",
+        "links_created",
+        "conflicts",
+        "files_hashed",
+    )
+
+    def __init__(self):
+        self.timings = {}
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+
+    def count(self, counter, amount=1):
+        self.counters[counter] += amount
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0) + time.perf_counter() - start
+
+    def merged(self, other):
+        """A copy with the timings and counters of other added in."""
+        merged = InstallStats()
+        for stats in (self, other):
+            for name, seconds in stats.timings.items():
+                merged.timings[name] = merged.timings.get(name, 0) + seconds
+            for counter, amount in stats.counters.items():
+                merged.count(counter, amount)
+        return merged
+
+    def as_dict(self):
+        return {
+            "timings": {name: round(seconds, 6) for name, seconds in self.timings.items()},
+            "counters": dict(self.counters),
+        }
+
+
+def is_within(label, key):
+    """Whether label is directory key or lies below it ("." holds everything)."""
+    return key == "." or label == key or label.startswith(f"{key}/")
+
+
+def mtime_ns(path, stats):
+    stats.count("stat_calls")
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
 
 
 def link_points_to_source(destination_path, source_path):
     if not destination_path.is_symlink():
-        return False
+        # inside a folded directory link the destination is the source itself
+        return destination_path.exists() and destination_path.resolve() == source_path.resolve()
 
     link_target = destination_path.readlink()
     if not link_target.is_absolute():
@@ -41,77 +115,1177 @@ def link_points_to_source(destination_path, source_path):
     return link_target == source_path.resolve()
 
 
-def is_gitignored(path):
-    result = subprocess.run(
-        ["git", "check-ignore", "--quiet", "--no-index", str(path.relative_to(SCRIPT_DIR))],
-        cwd=SCRIPT_DIR,
-        check=False,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-    )
-    return result.returncode == 0
+class GitIgnoreChecker:
+    """Answers gitignore queries through one long-lived `git check-ignore` process.
+
+    Paths are written to `git check-ignore --stdin -z --non-matching -v` in
+    batches, so a whole tree can be classified without a fork/exec per file.
+    Answers are cached by path.
+    """
+
+    COMMAND = ("git", "check-ignore", "--stdin", "-z", "--non-matching", "-v", "--no-index")
+
+    def __init__(self, repo_dir=SCRIPT_DIR, stats=None):
+        self.repo_dir = repo_dir
+        self.stats = stats or InstallStats()
+        self.ignored = {}
+        self._process = None
+        self._pending = b""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._process is None:
+            return
+        with contextlib.suppress(BrokenPipeError):
+            self._process.stdin.close()
+        self._process.stdout.close()
+        self._process.wait()
+        self._process = None
+        self._pending = b""
+
+    def _start(self):
+        self.stats.count("git_processes")
+        self._process = subprocess.Popen(
+            self.COMMAND,
+            cwd=self.repo_dir,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def _read_field(self):
+        while b"\0" not in self._pending:
+            chunk = os.read(self._process.stdout.fileno(), 65536)
+            if not chunk:
+                return None
+            self._pending += chunk
+        field, self._pending = self._pending.split(b"\0", 1)
+        return field
+
+    def check(self, paths):
+        """Classify paths (relative to repo_dir), returning {path: ignored}."""
+        queries = [path for path in dict.fromkeys(paths) if path not in self.ignored]
+        if not queries:
+            return {path: self.ignored[path] for path in paths}
 
+        self.stats.count("gitignore_queries", len(queries))
+        with self.stats.phase("gitignore"):
+            while queries:
+                answered = self._query(queries)
+                if answered == len(queries):
+                    break
+                # git exits on a path it refuses (e.g. one beyond a symbolic
+                # link); like a failing per-path check, count it as not
+                # ignored and go on with a fresh process
+                log.debug("git check-ignore failed on %s", queries[answered])
+                self.ignored[queries[answered]] = False
+                self.close()
+                queries = queries[answered + 1 :]
+        return {path: self.ignored[path] for path in paths}
 
-def install_file(source_path, destination_path, label, installs, installed, conflicts, dryrun):
-    """Install a single symlink from source_path to destination_path."""
-    if link_points_to_source(destination_path, source_path):
-        installed.append(label)
-        log.info("%s is already installed", label)
-        return
+    def _query(self, queries):
+        """Classify queries in one batch, returning how many git answered."""
+        if self._process is None:
+            self._start()
+        process = self._process
+        request = b"".join(os.fsencode(path) + b"\0" for path in queries)
 
-    if destination_path.exists() or destination_path.is_symlink():
-        log.warning("Conflicting file %s", label)
-        conflicts.append(label)
-        return
+        # Feed stdin from a helper thread so a large batch can't deadlock
+        # against git blocking on a full stdout pipe.
+        def write_request():
+            with contextlib.suppress(BrokenPipeError):
+                process.stdin.write(request)
+                process.stdin.flush()
+
+        writer = threading.Thread(target=write_request, daemon=True)
+        writer.start()
+        answered = 0
+        for path in queries:
+            # -v emits <source> <linenum> <pattern> <pathname>; a
+            # non-matching path has an empty pattern and a "!" pattern
+            # re-includes the path.
+            fields = [self._read_field() for _ in range(4)]
+            if None in fields:
+                break
+            pattern = fields[2]
+            self.ignored[path] = bool(pattern) and not pattern.startswith(b"!")
+            answered += 1
+        writer.join()
+        return answered
+
+    def is_ignored(self, path):
+        return self.check([path])[path]
+
+    def forget(self, prefix):
+        """Drop cached answers for prefix and everything below it."""
+        if prefix == ".":
+            self.ignored.clear()
+            return
+        for path in [path for path in self.ignored if path == prefix or path.startswith(f"{prefix}/")]:
+            del self.ignored[path]
+
+
+class DestinationTree:
+    """Directories of an install dir, each opened once and addressed by fd.
+
+    Directories are keyed like manifest entries ("." for the install dir
+    itself) and opened relative to their parent's fd, so files inside them
+    can be examined and linked with dir_fd calls instead of having the kernel
+    re-walk every path component. Only the current directory and its
+    ancestors stay open; sources arrive depth-first, so a directory is never
+    reopened.
+    """
+
+    def __init__(self, install_dir, stats=None):
+        self.install_dir = install_dir
+        self.stats = stats or InstallStats()
+        self._fds = {}
+        self._current = None
+        self._relative_dirs = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for fd in self._fds.values():
+            if fd is not None:
+                os.close(fd)
+        self._fds.clear()
+        self._current = None
+
+    def relative_dir(self, source_dir, key):
+        """Path of source_dir relative to directory key, as a link target prefix."""
+        relative = self._relative_dirs.get((source_dir, key))
+        if relative is None:
+            relative = os.path.relpath(source_dir, start=os.path.join(self.install_dir, key))
+            self._relative_dirs[(source_dir, key)] = relative
+        return relative
+
+    def open(self, key, create=False):
+        """Return an fd for directory key, or None if it does not exist.
+
+        With create, missing directories are made like `mkdir -p`.
+        """
+        if key == self._current:
+            fd = self._fds.get(key)
+            if fd is not None or not create:
+                return fd
+
+        chain = ["."]
+        if key != ".":
+            for part in key.split("/"):
+                chain.append(part if chain[-1] == "." else f"{chain[-1]}/{part}")
+        for cached in [cached for cached in self._fds if cached not in chain]:
+            if self._fds[cached] is not None:
+                os.close(self._fds[cached])
+            del self._fds[cached]
+
+        self._current = key
+        parent = None
+        for index, current in enumerate(chain):
+            fd = self._fds.get(current)
+            if fd is None and (create or current not in self._fds):
+                name = self.install_dir if index == 0 else current.rsplit("/", 1)[-1]
+                fd = self._open_dir(name, parent, create)
+                self._fds[current] = fd
+            if fd is None:
+                # leave the rest of the chain uncached so create can retry it
+                return None
+            parent = fd
+        return parent
+
+    @staticmethod
+    def _open_dir(name, parent, create):
+        flags = os.O_RDONLY | os.O_DIRECTORY | getattr(os, "O_CLOEXEC", 0)
+        try:
+            return os.open(name, flags, dir_fd=parent)
+        except FileNotFoundError:
+            if not create:
+                return None
+        os.mkdir(name, dir_fd=parent)
+        return os.open(name, flags, dir_fd=parent)
+
+
+def install_file(source_path, tree, label, installs, installed, conflicts, dryrun, prefix=""):
+    """Install a single symlink to source_path at label under a DestinationTree.
+
+    Returns True if label is left linked to source_path. Messages about
+    label start with prefix.
+    """
+    key, name = os.path.split(label)
+    key = key or "."
+    relative_target = os.path.join(tree.relative_dir(os.path.dirname(source_path), key), name)
+    parent = tree.open(key)
+    if parent is not None:
+        tree.stats.count("stat_calls")
+        try:
+            status = os.lstat(name, dir_fd=parent)
+        except FileNotFoundError:
+            status = None
+        if status is not None:
+            if (
+                stat.S_ISLNK(status.st_mode) and os.readlink(name, dir_fd=parent) == relative_target
+            ) or link_points_to_source(tree.install_dir / label, source_path):
+                installed.append(label)
+                log.info("%s%s is already installed", prefix, label)
+                return True
+
+            log.warning("%sConflicting file %s", prefix, label)
+            tree.stats.count("conflicts")
+            conflicts.append(label)
+            return False
 
     if dryrun:
-        print(f"{label} would be installed")
-    else:
-        destination_path.parent.mkdir(parents=True, exist_ok=True)
-        create_symlink(source_path, destination_path)
-        print(f"{label} installed")
+        print(f"{prefix}{label} would be installed")
+        installs.append(label)
+        return False
+
+    parent = tree.open(key, create=True)
+    os.symlink(relative_target, name, dir_fd=parent)
+    tree.stats.count("links_created")
+    print(f"{prefix}{label} installed")
     installs.append(label)
+    return True
 
 
-def collect_files(directory):
-    """Recursively yield all files under a directory."""
-    for child in sorted(directory.iterdir(), key=lambda p: p.name):
-        if child.is_dir():
-            yield from collect_files(child)
+def install_directory(key, tree, current, fold, dryrun, installs, installed, prefix=""):
+    """Decide how the files below source directory key are installed.
+
+    Returns "folded" when a single directory link to the source directory
+    covers them, creating that link if fold is set and the destination is
+    absent. A folded link whose source now contains gitignored entries is
+    unfolded into a real directory so those entries don't show through.
+    Returns "expanded" when the files should be linked individually, and
+    "unfolding" when a dry run would have unfolded the link. Messages about
+    key start with prefix.
+    """
+    parent_key, name = os.path.split(key)
+    parent_key = parent_key or "."
+    source_dir = SCRIPT_DIR / key
+    relative_target = os.path.join(tree.relative_dir(str(SCRIPT_DIR / parent_key), parent_key), name)
+    parent = tree.open(parent_key)
+    status = None
+    if parent is not None:
+        tree.stats.count("stat_calls")
+        try:
+            status = os.lstat(name, dir_fd=parent)
+        except FileNotFoundError:
+            pass
+
+    foldable = current.is_foldable(key)
+    if status is None:
+        if not (fold and foldable):
+            return "expanded"
+        if dryrun:
+            print(f"{prefix}{key} would be installed")
+        else:
+            parent = tree.open(parent_key, create=True)
+            os.symlink(relative_target, name, dir_fd=parent)
+            tree.stats.count("links_created")
+            print(f"{prefix}{key} installed")
+            current.record_link(key, source_dir, tree)
+        installs.append(key)
+        return "folded"
+
+    if not (
+        stat.S_ISLNK(status.st_mode)
+        and (os.readlink(name, dir_fd=parent) == relative_target or link_points_to_source(tree.install_dir / key, source_dir))
+    ):
+        return "expanded"
+    if foldable:
+        installed.append(key)
+        log.info("%s%s is already installed", prefix, key)
+        current.record_link(key, source_dir, tree)
+        return "folded"
+
+    if dryrun:
+        print(f"{prefix}{key} would be unfolded")
+        return "unfolding"
+    os.unlink(name, dir_fd=parent)
+    os.mkdir(name, dir_fd=parent)
+    print(f"{prefix}{key} unfolded")
+    return "expanded"
+
+
+class InstallState:
+    """Manifest of a previous install, kept as STATE_FILE in the install dir.
+
+    `dirs` maps each scanned source directory (relative to SCRIPT_DIR) to its
+    mtime, the mtime of its .gitignore, the entries that survived the
+    gitignore check (and which of the directories are symlinks) and whether
+    that was all of them. `links` records the
+    source/destination inode and mtime and the link target of every installed
+    label, and `destination_dirs` the mtimes of the directories those links
+    live in. `hashes` caches the content hash of files compared by
+    --check-drift, keyed by path and checked against inode, size and
+    mtime. A recorded mtime within
+    RACY_WINDOW_NS of when it was recorded is never trusted, since a change
+    in the same timestamp tick would go unnoticed.
+    """
+
+    VERSION = 3
+    RACY_WINDOW_NS = 2_000_000_000
+
+    def __init__(self, path, data=None):
+        data = data or {}
+        self.path = path
+        self.recorded_ns = data.get("recorded_ns", time.time_ns())
+        self.exclude_mtime_ns = data.get("exclude_mtime_ns")
+        self.dirs = data.get("dirs", {})
+        self.links = data.get("links", {})
+        self.destination_dirs = data.get("destination_dirs", {})
+        self.hashes = data.get("hashes", {})
+        # source directories reused from the previous manifest this run
+        self.unchanged_dirs = set()
+        self._foldable = {}
+
+    @classmethod
+    def load(cls, install_dir):
+        path = install_dir / STATE_FILE
+        try:
+            data = json.loads(path.read_text())
+        except FileNotFoundError:
+            return cls(path)
+        except (OSError, ValueError):
+            log.warning("Ignoring unreadable install state %s", path)
+            return cls(path)
+        if data.get("version") != cls.VERSION or data.get("script_dir") != str(SCRIPT_DIR):
+            log.info("Install state %s does not match this checkout, doing a full check", path)
+            return cls(path)
+        return cls(path, data)
+
+    def is_fresh(self, recorded, current):
+        """Whether a recorded mtime still matches and can be trusted."""
+        return recorded is not None and recorded == current and current < self.recorded_ns - self.RACY_WINDOW_NS
+
+    def forget_dirs(self, key):
+        """Drop the records of directory key and everything below it."""
+        for recorded in [recorded for recorded in self.dirs if is_within(recorded, key)]:
+            del self.dirs[recorded]
+        self._foldable.clear()
+
+    def update_entry(self, label, is_dir, present, ignored):
+        """Reflect one added or removed entry in its directory's record."""
+        key, name = os.path.split(label)
+        record = self.dirs.get(key or ".")
+        if record is None:
+            return
+        entries = record["dirs"] if is_dir else record["files"]
+        if name in entries:
+            entries.remove(name)
+        if name in record["linked_dirs"]:
+            record["linked_dirs"].remove(name)
+        if present and not ignored:
+            entries.append(name)
+            entries.sort()
+            if is_dir and (SCRIPT_DIR / label).is_symlink():
+                record["linked_dirs"].append(name)
+        if present and ignored:
+            record["complete"] = False
+        self._foldable.clear()
+
+    def is_foldable(self, key):
+        """Whether nothing below source directory key is gitignored."""
+        if key not in self._foldable:
+            record = self.dirs[key]
+            self._foldable[key] = record["complete"] and all(
+                self.is_foldable(f"{key}/{name}") for name in record["dirs"]
+            )
+        return self._foldable[key]
+
+    def record_link(self, label, source_path, tree):
+        key, name = os.path.split(label)
+        parent = tree.open(key or ".")
+        tree.stats.count("stat_calls", 2)
+        try:
+            source_stat = os.stat(source_path)
+            destination_stat = os.lstat(name, dir_fd=parent)
+            target = os.readlink(name, dir_fd=parent)
+        except OSError:
+            return
+        self.links[label] = {
+            "target": target,
+            "source_ino": source_stat.st_ino,
+            "source_mtime_ns": source_stat.st_mtime_ns,
+            "ino": destination_stat.st_ino,
+            "mtime_ns": destination_stat.st_mtime_ns,
+        }
+
+    def save(self):
+        data = {
+            "version": self.VERSION,
+            "script_dir": str(SCRIPT_DIR),
+            "recorded_ns": self.recorded_ns,
+            "exclude_mtime_ns": self.exclude_mtime_ns,
+            "dirs": self.dirs,
+            "links": self.links,
+            "destination_dirs": self.destination_dirs,
+            "hashes": self.hashes,
+        }
+        text = json.dumps(data)
+        # An existing manifest is rewritten in place: creating and renaming
+        # a temporary file would change the mtime of the install dir, which
+        # the manifest records in destination_dirs. A torn rewrite only
+        # costs a full check, as load() ignores unreadable state.
+        try:
+            with open(self.path, "r+") as manifest:
+                manifest.write(text)
+                manifest.truncate()
+            return
+        except FileNotFoundError:
+            pass
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        temporary.write_text(text)
+        os.replace(temporary, self.path)
+
+
+def collect_sources(checker, previous, current, stats, root="."):
+    """Return (source_path, label) pairs for every file that should be linked.
+
+    The tree is scanned one depth level at a time and every entry found on a
+    level is classified in a single batch, so gitignored subtrees are never
+    walked and git is only started once. A directory whose mtime and
+    governing ignore files match the previous InstallState reuses its
+    recorded entries instead of being re-read and re-classified. root limits
+    the scan to one source directory.
+    """
+    exclude_mtime = mtime_ns(SCRIPT_DIR / ".git" / "info" / "exclude", stats)
+    current.exclude_mtime_ns = exclude_mtime
+    # (directory, whether its ignore rules changed, whether it is or lies
+    # below a symlinked directory)
+    linked = root != "." and Path(os.path.realpath(SCRIPT_DIR / root)) != SCRIPT_DIR / root
+    level = [(root, exclude_mtime != previous.exclude_mtime_ns, linked)]
+    labels = []
+    while level:
+        next_level = []
+        listings = []
+        for key, rules_changed, linked in level:
+            directory = SCRIPT_DIR / key
+            prefix = "" if key == "." else f"{key}/"
+            directory_mtime = mtime_ns(directory, stats)
+            if directory_mtime is None:
+                continue
+            record = previous.dirs.get(key)
+            if record is not None and previous.is_fresh(record["mtime_ns"], directory_mtime):
+                gitignore_mtime = record["gitignore_mtime_ns"]
+                if gitignore_mtime is not None:
+                    gitignore_mtime = mtime_ns(directory / ".gitignore", stats)
+                    rules_changed = rules_changed or not previous.is_fresh(record["gitignore_mtime_ns"], gitignore_mtime)
+                if not rules_changed:
+                    stats.count("directories_reused")
+                    stats.count("files_walked", len(record["files"]))
+                    current.dirs[key] = record
+                    current.unchanged_dirs.add(key)
+                    labels.extend(prefix + name for name in record["files"])
+                    next_level.extend(
+                        (prefix + name, False, linked or name in record["linked_dirs"]) for name in record["dirs"]
+                    )
+                    continue
+
+            gitignore_mtime = mtime_ns(directory / ".gitignore", stats)
+            if record is None or not previous.is_fresh(record["gitignore_mtime_ns"], gitignore_mtime):
+                # a new or edited .gitignore can change anything below it
+                rules_changed = True
+            with os.scandir(directory) as scan:
+                # d_type from the directory read tells dirs apart without a stat
+                entries = [
+                    (entry.name, entry.is_dir(), entry.is_symlink())
+                    for entry in sorted(scan, key=lambda entry: entry.name)
+                    if key != "." or entry.name not in IGNORED_FILES
+                ]
+            stats.count("directories_listed")
+            stats.count("files_walked", len(entries))
+            listings.append((key, prefix, directory_mtime, gitignore_mtime, entries, rules_changed, linked))
+
+        # git refuses paths beyond a symbolic link; those were classified by
+        # the link's own path, which got them walked in the first place
+        ignored = checker.check(
+            [
+                prefix + name
+                for _, prefix, _, _, entries, _, linked in listings
+                if not linked
+                for name, _, _ in entries
+            ]
+        )
+        for key, prefix, directory_mtime, gitignore_mtime, entries, rules_changed, linked in listings:
+            files = []
+            dirs = []
+            linked_dirs = []
+            complete = True
+            for name, is_dir, is_link in entries:
+                if not linked and ignored[prefix + name]:
+                    complete = False
+                    continue
+                if is_dir:
+                    # For directories (e.g. .config/, .ssh/), symlink individual
+                    # files rather than the directory itself.
+                    dirs.append(name)
+                    if is_link:
+                        linked_dirs.append(name)
+                    next_level.append((prefix + name, rules_changed, linked or is_link))
+                else:
+                    files.append(name)
+                    labels.append(prefix + name)
+            current.dirs[key] = {
+                "mtime_ns": directory_mtime,
+                "gitignore_mtime_ns": gitignore_mtime,
+                "files": files,
+                "dirs": dirs,
+                "linked_dirs": linked_dirs,
+                "complete": complete,
+            }
+        level = next_level
+
+    # depth-first, name-sorted order
+    labels.sort(key=lambda label: label.split("/"))
+    return [(SCRIPT_DIR / label, label) for label in labels]
+
+
+def link_is_unchanged(label, install_dir, previous, current, destination_mtimes, stats):
+    """Whether the previous manifest vouches that label is still installed.
+
+    That holds when neither the source directory nor the destination
+    directory has changed since the link was recorded.
+    """
+    key = os.path.dirname(label) or "."
+    if key not in current.unchanged_dirs or label not in previous.links:
+        return False
+    if key not in destination_mtimes:
+        destination_mtimes[key] = mtime_ns(install_dir / key, stats)
+    return previous.is_fresh(previous.destination_dirs.get(key), destination_mtimes[key])
+
+
+def hash_file(path, previous):
+    """Return {ino, size, mtime_ns, digest, binary} for a regular file.
+
+    The file is read in DRIFT_CHUNK pieces. An entry in previous.hashes is
+    reused while its inode, size and mtime still match. Returns None for
+    anything that isn't a readable regular file.
+    """
+    try:
+        status = os.stat(path)
+        if not stat.S_ISREG(status.st_mode):
+            return None
+        cached = previous.hashes.get(str(path))
+        if (
+            cached is not None
+            and cached["ino"] == status.st_ino
+            and cached["size"] == status.st_size
+            and previous.is_fresh(cached["mtime_ns"], status.st_mtime_ns)
+        ):
+            return cached
+
+        digest = hashlib.sha256()
+        binary = False
+        with open(path, "rb") as file:
+            chunk = file.read(DRIFT_CHUNK)
+            # git's heuristic: a NUL early on means binary
+            binary = b"\0" in chunk[:8000]
+            while chunk:
+                digest.update(chunk)
+                chunk = file.read(DRIFT_CHUNK)
+    except OSError:
+        return None
+    return {
+        "ino": status.st_ino,
+        "size": status.st_size,
+        "mtime_ns": status.st_mtime_ns,
+        "digest": digest.hexdigest(),
+        "binary": binary,
+    }
+
+
+def classify_drift(install_dir, labels, previous, current, stats):
+    """Compare conflicting destinations with their sources.
+
+    Every file is hashed on a thread pool. Returns {label: kind}, where kind
+    is "identical", "binary" (differs, and one side is binary) or
+    "differing". A destination that isn't a regular file counts as
+    differing.
+    """
+    paths = sorted({path for label in labels for path in (SCRIPT_DIR / label, install_dir / label)})
+    with ThreadPoolExecutor() as executor:
+        hashes = dict(zip(paths, executor.map(lambda path: hash_file(path, previous), paths)))
+    for path, entry in hashes.items():
+        if entry is not None:
+            if previous.hashes.get(str(path)) is not entry:
+                stats.count("files_hashed")
+            current.hashes[str(path)] = entry
+
+    drift = {}
+    for label in labels:
+        source = hashes[SCRIPT_DIR / label]
+        destination = hashes[install_dir / label]
+        if source is None or destination is None:
+            drift[label] = "differing"
+        elif source["digest"] == destination["digest"]:
+            drift[label] = "identical"
+        elif source["binary"] or destination["binary"]:
+            drift[label] = "binary"
         else:
-            yield child
+            drift[label] = "differing"
+    return drift
 
 
-def do_install(installdir=None, dryrun=False):
+def resolve_install_dir(installdir):
     if installdir is None:
         installdir = Path.home()
     install_dir = Path(installdir).expanduser()
     if not install_dir.is_dir():
         log.error("Cannot install to %s. It is not a directory", install_dir)
         raise RuntimeError("installdir is not directory")
+    return install_dir
+
+
+def install_sources(
+    install_dir,
+    sources,
+    previous,
+    current,
+    dryrun,
+    fold=False,
+    stats=None,
+    save=True,
+    check_drift=False,
+    replace_identical=False,
+    prefix="",
+):
+    """Link every (source_path, label) into install_dir and save the manifest.
 
+    Directories already folded into a single link are recognised in either
+    mode; with fold, absent destination directories are folded too. With
+    check_drift, conflicts are compared with their sources (see
+    classify_drift) and the results carry a "drift" entry; with
+    replace_identical, conflicting files identical to their source are
+    replaced by links. Every message starts with prefix, e.g. the target
+    when several are installed at once.
+    """
+    stats = stats or InstallStats()
+    destination_mtimes = {}
+    directories = {}
     installs = []
     installed = []
     conflicts = []
-    for source_path in sorted(SCRIPT_DIR.iterdir(), key=lambda path: path.name):
-        if source_path.name in IGNORED_FILES or is_gitignored(source_path):
+    with stats.phase("link"), DestinationTree(install_dir, stats) as tree:
+        for source_path, label in sources:
+            if link_is_unchanged(label, install_dir, previous, current, destination_mtimes, stats):
+                stats.count("links_reused")
+                installed.append(label)
+                current.links[label] = previous.links[label]
+                log.info("%s%s is already installed", prefix, label)
+                continue
+
+            placement = "expanded"
+            parts = label.split("/")[:-1]
+            for depth in range(1, len(parts) + 1):
+                key = "/".join(parts[:depth])
+                if key not in directories:
+                    directories[key] = install_directory(
+                        key, tree, current, fold, dryrun, installs, installed, prefix
+                    )
+                placement = directories[key]
+                if placement != "expanded":
+                    break
+            if placement == "folded":
+                continue
+            if placement == "unfolding":
+                print(f"{prefix}{label} would be installed")
+                installs.append(label)
+                continue
+
+            if install_file(source_path, tree, label, installs, installed, conflicts, dryrun, prefix):
+                current.record_link(label, source_path, tree)
+
+        drift = {}
+        if (check_drift or replace_identical) and conflicts:
+            with stats.phase("drift"):
+                drift = classify_drift(install_dir, conflicts, previous, current, stats)
+            for label in conflicts:
+                print(f"{prefix}{label} conflict is {drift[label]}")
+        for label in [label for label in conflicts if drift.get(label) == "identical" and replace_identical]:
+            if dryrun:
+                print(f"{prefix}{label} would be replaced by a link")
+                continue
+            key, name = os.path.split(label)
+            parent = tree.open(key or ".")
+            if not stat.S_ISREG(os.lstat(name, dir_fd=parent).st_mode):
+                continue
+            os.unlink(name, dir_fd=parent)
+            conflicts.remove(label)
+            if install_file(SCRIPT_DIR / label, tree, label, installs, installed, conflicts, dryrun, prefix):
+                current.record_link(label, SCRIPT_DIR / label, tree)
+
+    if save and not dryrun:
+        with stats.phase("save"):
+            # links this run no longer stands for stay recorded until
+            # --prune or --uninstall removes them
+            for label in previous.links.keys() - current.links.keys():
+                if is_source_link(install_dir, label):
+                    current.links[label] = previous.links[label]
+            for label in installs + installed:
+                key = os.path.dirname(label) or "."
+                if key not in current.destination_dirs:
+                    current.destination_dirs[key] = mtime_ns(install_dir / key, stats)
+            try:
+                current.save()
+                # creating the manifest changed the install dir it lives in
+                if "." in current.destination_dirs:
+                    install_dir_mtime = mtime_ns(install_dir, stats)
+                    if install_dir_mtime != current.destination_dirs["."]:
+                        current.destination_dirs["."] = install_dir_mtime
+                        current.save()
+            except OSError as error:
+                log.warning("%sCould not save install state %s: %s", prefix, current.path, error)
+
+    results = {"installs": installs, "installed": installed, "conflicts": conflicts}
+    if check_drift or replace_identical:
+        results["drift"] = drift
+    return results
+
+
+def do_install(
+    installdir=None,
+    dryrun=False,
+    full=False,
+    fold=False,
+    profile=False,
+    check_drift=False,
+    replace_identical=False,
+):
+    """Install into one directory.
+
+    With profile, the results also carry a "profile" entry holding the
+    per-phase timings and counters of InstallStats. check_drift and
+    replace_identical are passed on to install_sources.
+    """
+    install_dir = resolve_install_dir(installdir)
+    stats = InstallStats()
+
+    # --full ignores the manifest, so every directory and link is examined
+    with stats.phase("manifest"):
+        previous = InstallState(install_dir / STATE_FILE) if full else InstallState.load(install_dir)
+    current = InstallState(install_dir / STATE_FILE)
+    with stats.phase("walk"), GitIgnoreChecker(stats=stats) as checker:
+        sources = collect_sources(checker, previous, current, stats)
+    results = install_sources(
+        install_dir,
+        sources,
+        previous,
+        current,
+        dryrun,
+        fold,
+        stats,
+        check_drift=check_drift,
+        replace_identical=replace_identical,
+    )
+    if profile:
+        results["profile"] = stats.as_dict()
+    return results
+
+
+def do_install_many(
+    installdirs,
+    dryrun=False,
+    full=False,
+    jobs=None,
+    fold=False,
+    profile=False,
+    check_drift=False,
+    replace_identical=False,
+):
+    """Install into several directories concurrently.
+
+    The source tree is walked and gitignore-filtered once, then each target is
+    filled by a worker from a pool of `jobs` threads. Returns a dict mapping
+    each install dir to the results do_install would have returned for it. A
+    target that fails gets an "error" entry instead of stopping the others.
+    Profiles include the shared walk in every target's timings and counters.
+    With more than one target, every message starts with the target it is
+    about, since the workers' output interleaves.
+    """
+    installdirs = list(installdirs)
+    scan = InstallState(None)
+    scan_stats = InstallStats()
+    with scan_stats.phase("walk"), GitIgnoreChecker(stats=scan_stats) as checker:
+        sources = collect_sources(checker, InstallState(None), scan, scan_stats)
+
+    def install_target(installdir):
+        install_dir = resolve_install_dir(installdir)
+        stats = InstallStats()
+        with stats.phase("manifest"):
+            previous = InstallState(install_dir / STATE_FILE) if full else InstallState.load(install_dir)
+        current = InstallState(install_dir / STATE_FILE)
+        current.exclude_mtime_ns = scan.exclude_mtime_ns
+        current.dirs = scan.dirs
+        current.unchanged_dirs = {
+            key for key, record in scan.dirs.items()
+            if previous.is_fresh(previous.dirs.get(key, {}).get("mtime_ns"), record["mtime_ns"])
+        }
+        results = install_sources(
+            install_dir,
+            sources,
+            previous,
+            current,
+            dryrun,
+            fold,
+            stats,
+            check_drift=check_drift,
+            replace_identical=replace_identical,
+            prefix=f"{installdir}: " if len(installdirs) > 1 else "",
+        )
+        if profile:
+            results["profile"] = scan_stats.merged(stats).as_dict()
+        return results
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {str(installdir): executor.submit(install_target, installdir) for installdir in installdirs}
+        for target, future in futures.items():
+            try:
+                results[target] = future.result()
+            except Exception as error:
+                log.exception("Install to %s failed", target)
+                results[target] = {"installs": [], "installed": [], "conflicts": [], "error": str(error)}
+    return results
+
+
+class Inotify:
+    """Minimal ctypes binding to Linux inotify."""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        try:
+            self._add_watch = libc.inotify_add_watch
+            inotify_init1 = libc.inotify_init1
+        except AttributeError:
+            raise RuntimeError("watching needs Linux inotify") from None
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def add_watch(self, path, mask):
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), str(path))
+        return wd
+
+    def read(self, timeout=None):
+        """Return the pending (wd, mask, name) events, waiting up to timeout."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 65536)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+
+def is_source_link(install_dir, label):
+    """Whether install_dir/label is our link to SCRIPT_DIR/label.
+
+    A destination reached through a folded directory link lives inside
+    SCRIPT_DIR itself and never counts, so nothing in the checkout can be
+    mistaken for a link to remove.
+    """
+    path = install_dir / label
+    if not path.is_symlink() or Path(os.path.realpath(path.parent)).is_relative_to(SCRIPT_DIR):
+        return False
+    return link_points_to_source(path, SCRIPT_DIR / label)
+
+
+def find_source_links(install_dir, keys):
+    """Yield the labels of our links inside the destination directories keys.
+
+    Only the given directories are listed, so this never walks the whole
+    install dir.
+    """
+    for key in sorted(keys):
+        prefix = "" if key == "." else f"{key}/"
+        try:
+            with os.scandir(install_dir / key) as scan:
+                names = [entry.name for entry in scan if entry.is_symlink()]
+        except OSError:
             continue
+        for name in names:
+            if is_source_link(install_dir, prefix + name):
+                yield prefix + name
 
-        if source_path.is_dir():
-            # For directories (e.g. .config/, .ssh/), symlink individual files
-            # rather than the directory itself, creating parent dirs as needed.
-            for source_file in collect_files(source_path):
-                relative = source_file.relative_to(SCRIPT_DIR)
-                if is_gitignored(source_file):
-                    continue
-                destination_path = install_dir / relative
-                label = str(relative)
-                install_file(source_file, destination_path, label, installs, installed, conflicts, dryrun)
-        else:
-            destination_path = install_dir / source_path.name
-            install_file(source_path, destination_path, source_path.name, installs, installed, conflicts, dryrun)
 
-    return {"installs": installs, "installed": installed, "conflicts": conflicts}
+def stale_links(links, wanted):
+    """The links that no longer stand for a wanted file.
+
+    A folded directory link stays while it still covers wanted files.
+    """
+    wanted_dirs = {os.path.dirname(label) for label in wanted}
+    for label in list(wanted_dirs):
+        while label:
+            label = os.path.dirname(label)
+            wanted_dirs.add(label)
+    return [label for label in links if label not in wanted and label not in wanted_dirs]
+
+
+def remove_links(install_dir, labels, dryrun=False):
+    """Unlink labels in batches, one per destination directory.
+
+    Labels are taken depth-first so each directory is opened once and the
+    unlinks inside it go through its fd.
+    """
+    with DestinationTree(install_dir) as tree:
+        for label in sorted(labels, key=lambda label: label.split("/")):
+            if dryrun:
+                print(f"{label} would be removed")
+                continue
+            key, name = os.path.split(label)
+            os.unlink(name, dir_fd=tree.open(key or "."))
+            print(f"{label} removed")
+
+
+class Watcher:
+    """Keeps an install dir in sync with SCRIPT_DIR from inotify events.
+
+    Every source directory that was installed from is watched. Events are
+    gathered until QUIET_PERIOD passes without one (or MAX_BATCH has
+    elapsed), then applied together: a created or removed file is linked or
+    unlinked on its own, while a created or removed directory, or an edited
+    .gitignore, re-syncs just the subtree below it.
+    """
+
+    MASK = (
+        Inotify.IN_CREATE | Inotify.IN_DELETE | Inotify.IN_MOVED_FROM | Inotify.IN_MOVED_TO
+        | Inotify.IN_CLOSE_WRITE | Inotify.IN_ONLYDIR
+    )
+    QUIET_PERIOD = 0.2
+    MAX_BATCH = 2.0
+    EXCLUDE_KEY = ".git/info"
+
+    def __init__(self, install_dir, fold, checker, inotify, state, stats):
+        self.install_dir = install_dir
+        self.fold = fold
+        self.checker = checker
+        self.inotify = inotify
+        self.state = state
+        self.stats = stats
+        self.keys = {}
+        self.watch_dirs()
+        if (SCRIPT_DIR / self.EXCLUDE_KEY).is_dir():
+            self._add(self.EXCLUDE_KEY)
+
+    def _add(self, key):
+        try:
+            self.keys[self.inotify.add_watch(SCRIPT_DIR / key, self.MASK)] = key
+        except OSError as error:
+            log.warning("Cannot watch %s: %s", key, error)
+
+    def watch_dirs(self):
+        watched = set(self.keys.values())
+        for key in sorted(self.state.dirs):
+            if key not in watched:
+                self._add(key)
+
+    def run(self):
+        while True:
+            events = self.inotify.read()
+            deadline = time.monotonic() + self.MAX_BATCH
+            while time.monotonic() < deadline:
+                more = self.inotify.read(self.QUIET_PERIOD)
+                if not more:
+                    break
+                events.extend(more)
+            self.handle(events)
+
+    def handle(self, events):
+        trees = set()
+        labels = set()
+        rules_changed = False
+        for wd, mask, name in events:
+            if mask & Inotify.IN_Q_OVERFLOW:
+                # events were lost, so nothing short of a full sync is safe
+                trees.add(".")
+                rules_changed = True
+                continue
+            key = self.keys.get(wd)
+            if mask & Inotify.IN_IGNORED:
+                self.keys.pop(wd, None)
+                continue
+            if key is None or not name:
+                continue
+            if key == self.EXCLUDE_KEY:
+                if name == "exclude":
+                    trees.add(".")
+                    rules_changed = True
+                continue
+
+            label = name if key == "." else f"{key}/{name}"
+            if name == ".gitignore":
+                trees.add(key)
+                rules_changed = True
+            elif key == "." and name in IGNORED_FILES:
+                continue
+            elif mask & Inotify.IN_ISDIR:
+                trees.add(label)
+            elif not mask & Inotify.IN_CLOSE_WRITE:
+                labels.add(label)
+
+        if rules_changed:
+            # a running `git check-ignore` keeps the rules it has read
+            self.checker.close()
+        trees = {tree for tree in trees if not any(other != tree and is_within(tree, other) for other in trees)}
+        for key in sorted(trees):
+            self.sync_tree(key)
+        labels = [label for label in sorted(labels) if not any(is_within(label, tree) for tree in trees)]
+        if labels:
+            self.sync_labels(labels)
+
+    def sync_labels(self, labels):
+        """Link or unlink individual files after they were created or removed."""
+        for label in labels:
+            self.checker.forget(label)
+        present = [label for label in labels if (SCRIPT_DIR / label).is_file()]
+        ignored = self.checker.check(present)
+        for label in labels:
+            self.state.update_entry(label, False, label in ignored, ignored.get(label, False))
+
+        for label in present:
+            if ignored[label]:
+                # a newly ignored file may force its folded directory to unfold
+                self.sync_tree(os.path.dirname(label) or ".")
+        wanted = [(SCRIPT_DIR / label, label) for label in present if not ignored[label]]
+        install_sources(
+            self.install_dir, wanted, InstallState(None), self.state, False, self.fold, self.stats, save=False
+        )
+        removed = [label for label in labels if label not in ignored and is_source_link(self.install_dir, label)]
+        remove_links(self.install_dir, removed)
+
+    def sync_tree(self, key):
+        """Bring the links for everything below source directory key up to date."""
+        old_dirs = {recorded for recorded in self.state.dirs if is_within(recorded, key)}
+        self.state.forget_dirs(key)
+        self.checker.forget(key)
+
+        present = key == "." or (SCRIPT_DIR / key).is_dir()
+        ignored = present and key != "." and self.checker.is_ignored(key)
+        if key != ".":
+            self.state.update_entry(key, True, present, ignored)
+        sources = []
+        if present and not ignored:
+            sources = collect_sources(self.checker, InstallState(None), self.state, self.stats, root=key)
+        self.watch_dirs()
+
+        install_sources(
+            self.install_dir, sources, InstallState(None), self.state, False, self.fold, self.stats, save=False
+        )
+        wanted = {label for _, label in sources}
+        new_dirs = {recorded for recorded in self.state.dirs if is_within(recorded, key)}
+        candidates = set(find_source_links(self.install_dir, old_dirs | new_dirs))
+        if key != "." and is_source_link(self.install_dir, key):
+            candidates.add(key)
+        remove_links(self.install_dir, stale_links(candidates, wanted))
+
+
+def watch(installdir=None, fold=False):
+    """Install into installdir, then keep it in sync with SCRIPT_DIR until interrupted."""
+    install_dir = resolve_install_dir(installdir)
+    stats = InstallStats()
+    previous = InstallState.load(install_dir)
+    state = InstallState(install_dir / STATE_FILE)
+    with GitIgnoreChecker(stats=stats) as checker, Inotify() as inotify:
+        sources = collect_sources(checker, previous, state, stats)
+        install_sources(install_dir, sources, previous, state, False, fold, stats)
+        log.info("Watching %s for changes", SCRIPT_DIR)
+        Watcher(install_dir, fold, checker, inotify, state, stats).run()
+
+
+def do_prune(installdir=None, dryrun=False, uninstall=False):
+    """Remove links into SCRIPT_DIR whose source is gone or no longer installed.
+
+    Candidates are the manifest's record of created links, which keeps links
+    an install no longer stands for until they are pruned, plus our links
+    in the destination directories that the manifest recorded or that
+    mirror the current source directories. The install dir is never walked
+    as a whole.
+    With uninstall, every link into SCRIPT_DIR found that way is removed,
+    along with the manifest. Returns {"removed": [labels]}.
+    """
+    install_dir = resolve_install_dir(installdir)
+    stats = InstallStats()
+    previous = InstallState.load(install_dir)
+    current = InstallState(install_dir / STATE_FILE)
+    with GitIgnoreChecker(stats=stats) as checker:
+        sources = collect_sources(checker, previous, current, stats)
+
+    scanned_dirs = set(current.dirs) | set(previous.destination_dirs)
+    candidates = set(previous.links) | set(find_source_links(install_dir, scanned_dirs))
+    links = [label for label in sorted(candidates) if is_source_link(install_dir, label)]
+    removed = links if uninstall else stale_links(links, {label for _, label in sources})
+    remove_links(install_dir, removed, dryrun)
+
+    if not dryrun:
+        if uninstall:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(previous.path)
+        elif previous.links:
+            for label in removed:
+                previous.links.pop(label, None)
+            previous.save()
+    return {"removed": removed}
+
+
+def print_results(target_results, totals):
+    """Print each target's profile, if any, and with totals its link counts."""
+    for target, results in target_results.items():
+        if "profile" in results:
+            profile = results["profile"]
+            timings = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in profile["timings"].items())
+            counters = ", ".join(f"{counter} {amount}" for counter, amount in profile["counters"].items())
+            print(f"{target}: {timings}")
+            print(f"{target}: {counters}")
+        if not totals:
+            continue
+        if "error" in results:
+            print(f"{target}: failed ({results['error']})")
+            continue
+        print(
+            f"{target}: {len(results['installs'])} installed, "
+            f"{len(results['installed'])} already installed, {len(results['conflicts'])} conflicts"
+        )
 
 
 if __name__ == "__main__":
@@ -119,9 +1293,8 @@ if __name__ == "__main__":
     defaultinstall = str(Path.home())
     parser.add_argument(
         "installpath",
-        help=f"Path to install symbolic links (default:{defaultinstall})",
-        default=defaultinstall,
-        nargs="?",
+        help=f"Paths to install symbolic links (default:{defaultinstall})",
+        nargs="*",
         type=Path,
     )
     parser.add_argument("--log", help="log level", default="WARNING", type=parse_log_level)
@@ -131,16 +1304,124 @@ if __name__ == "__main__":
         help="Perform dry run, don't actually do anything",
         action="store_true",
     )
+    parser.add_argument(
+        "--full",
+        help=f"Ignore the {STATE_FILE} manifest and check every file",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--fold",
+        help="Link whole directories when the destination doesn't exist yet and nothing in them is gitignored",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of install paths to fill concurrently (default: one per CPU)",
+        type=int,
+    )
+    parser.add_argument(
+        "--check-drift",
+        help="Compare conflicting files with their source: identical, differing or binary",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--replace-identical",
+        help="Replace conflicting files identical to their source with links (implies --check-drift)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--prune",
+        help="Remove links whose source file was deleted, renamed or gitignored",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--uninstall",
+        help="Remove every link into this checkout",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--watch",
+        help="After installing, keep the links in sync as files are added, removed or gitignored",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--json",
+        help="Print the results as JSON on stdout (progress lines go to stderr)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--profile",
+        help="Report per-phase timings and counters",
+        action="store_true",
+    )
     args = parser.parse_args()
 
     logging.basicConfig(level=args.log)
+    installpaths = args.installpath or [Path(defaultinstall)]
+    failed = False
+    if args.prune or args.uninstall:
+        try:
+            with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+                target_results = {
+                    str(installpath): do_prune(installdir=installpath, dryrun=args.dryrun, uninstall=args.uninstall)
+                    for installpath in installpaths
+                }
+        except Exception:
+            log.exception("Prune failed")
+            sys.exit(1)
+        if args.json:
+            output = target_results if len(installpaths) > 1 else target_results[str(installpaths[0])]
+            json.dump(output, sys.stdout, indent=2)
+            print()
+        sys.exit(0)
+
+    if args.watch:
+        try:
+            watch(installdir=installpaths[0], fold=args.fold)
+        except KeyboardInterrupt:
+            sys.exit(0)
+        except Exception:
+            log.exception("Watch failed")
+            sys.exit(1)
+
     try:
-        results = do_install(installdir=args.installpath, dryrun=args.dryrun)
+        with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+            if len(installpaths) == 1:
+                target_results = {
+                    str(installpaths[0]): do_install(
+                        installdir=installpaths[0],
+                        dryrun=args.dryrun,
+                        full=args.full,
+                        fold=args.fold,
+                        profile=args.profile,
+                        check_drift=args.check_drift,
+                        replace_identical=args.replace_identical,
+                    )
+                }
+            else:
+                target_results = do_install_many(
+                    installpaths,
+                    dryrun=args.dryrun,
+                    full=args.full,
+                    jobs=args.jobs,
+                    fold=args.fold,
+                    profile=args.profile,
+                    check_drift=args.check_drift,
+                    replace_identical=args.replace_identical,
+                )
+        failed = any(results["conflicts"] or "error" in results for results in target_results.values())
+        if args.json:
+            output = target_results if len(installpaths) > 1 else target_results[str(installpaths[0])]
+            json.dump(output, sys.stdout, indent=2)
+            print()
+        else:
+            print_results(target_results, totals=len(installpaths) > 1)
     except Exception:
         log.exception("Install failed")
         errors = True
     else:
         errors = False
 
-    if errors or results["conflicts"]:
+    if errors or failed:
         sys.exit(1)
@@ -1,10 +1,19 @@
 import argparse
+import bisect
 import os.path
 import shlex
 import struct
+import sys
 
 import lldb
 
+# insn_sites.py sits next to this file in the checkout; resolve the symlink
+# in $HOME and append, so the home directory doesn't shadow other modules
+_HERE = os.path.dirname(os.path.realpath(__file__))
+if _HERE not in sys.path:
+    sys.path.append(_HERE)
+import insn_sites
+
 
 def getValue(debugger, valstr):
     target = debugger.GetSelectedTarget()
@@ -41,35 +50,452 @@ def nsviewtree(debugger, command, result, internal_dict):
     # print(result)
 
 
-def dumpselectors(debugger, command, result, internal_dict):
+# Field layouts of the Objective-C runtime structs that Method,
+# objc_property_t and Ivar handles point at, as struct formats for 64-bit
+# little-endian targets and the names of their fields. Apple's objc4 and
+# GNUstep's libobjc2 (v2 ABI) order them differently; an ivar's offset is
+# a pointer to the int32 offset in both.
+_OBJC_LAYOUTS = {
+    "apple": {
+        "method": ("<QQQ", ("name", "types", "imp")),
+        "property": ("<QQ", ("name", "attributes")),
+        "ivar": ("<QQQII", ("offset", "name", "type", "alignment", "size")),
+    },
+    "gnustep": {
+        "method": ("<QQQ", ("imp", "name", "types")),
+        "property": ("<QQ", ("name", "attributes")),
+        "ivar": ("<QQQII", ("name", "type", "offset", "size", "flags")),
+    },
+}
+# objc4's small methods (Method handle with the low bit set) hold three
+# int32 offsets, each relative to its own field: selector reference, types
+# and implementation
+_OBJC_SMALL_METHOD = "<iii"
+# reads of structs or strings closer together than this are merged, as long
+# as the merged read stays under _OBJC_READ_SPAN
+_OBJC_READ_GAP = 4096
+_OBJC_READ_SPAN = 1 << 20
+_OBJC_MAX_STRING = 4096
+
+
+def _objc_runtime(target):
     '''
-    Prints out all selectors defined in an object (does not include superclass
-    methods)
+    Returns which _OBJC_LAYOUTS entry applies to the target
     '''
-    parser = argparse.ArgumentParser(prog=__name__)
-    parser.add_argument("object", help="object to dump selectors on")
-    args = parser.parse_args(shlex.split(command))
+    return "apple" if "apple" in (target.GetTriple() or "") else "gnustep"
+
+
+def _read_memory(process, address, size):
+    error = lldb.SBError()
+    data = process.ReadMemory(address, size, error) if size else b""
+    return data if error.Success() else None
+
+
+def _coalesce(addresses, size):
+    '''
+    Groups sorted addresses of size-byte objects into runs that can be read
+    at once, as [start, end, [address, ...]]
+    '''
+    runs = []
+    for address in addresses:
+        if runs and address - runs[-1][1] <= _OBJC_READ_GAP and address + size - runs[-1][0] <= _OBJC_READ_SPAN:
+            runs[-1][1] = max(runs[-1][1], address + size)
+            runs[-1][2].append(address)
+        else:
+            runs.append([address, address + size, [address]])
+    return runs
+
+
+def _read_structs(process, addresses, size):
+    '''
+    Returns {address: the size bytes there, or None} for every address,
+    reading nearby ones in one go
+    '''
+    found = {}
+    for start, end, members in _coalesce(sorted(set(addresses)), size):
+        block = _read_memory(process, start, end - start)
+        for address in members:
+            if block is not None:
+                found[address] = block[address - start:address - start + size]
+            else:
+                found[address] = _read_memory(process, address, size)
+    return found
+
+
+def _read_cstrings(process, addresses):
+    '''
+    Returns {address: string, or None if unreadable} for every non-null
+    address. Nearby strings (e.g. in __objc_methname) are cut out of one
+    read; only the last of each run needs ReadCStringFromMemory.
+    '''
+    found = {}
 
+    def read_one(address):
+        error = lldb.SBError()
+        text = process.ReadCStringFromMemory(address, _OBJC_MAX_STRING, error)
+        return text if error.Success() else None
+
+    for start, end, members in _coalesce(sorted({a for a in addresses if a}), 1):
+        last = members[-1]
+        block = _read_memory(process, start, last - start)
+        for address in members[:-1]:
+            offset = address - start
+            nul = block.find(b"\0", offset) if block is not None else -1
+            if nul == -1:
+                found[address] = read_one(address)
+            else:
+                found[address] = block[offset:nul].decode("utf-8", "replace")
+        found[last] = read_one(last)
+    return found
+
+
+def _copy_objc_list(debugger, function, cls):
+    '''
+    Calls class_copy<function>List on the class expression cls and returns
+    (list address, handles), reading the handles with one ReadMemory. Pass
+    the list address to _free_objc_list.
+    '''
     target = debugger.GetSelectedTarget()
     process = target.GetProcess()
     error = lldb.SBError()
     count_addr = process.AllocateMemory(4, lldb.ePermissionsReadable | lldb.ePermissionsWritable, error)
-
-    # Using id* as cannot seem to find type Method
+    # Using id* as cannot seem to find types Method/Ivar/objc_property_t
     expr_result = target.EvaluateExpression(
-        f"(id*) class_copyMethodList((Class)[(id){args.object} class], (unsigned int*){count_addr})"
+        f"(id*) class_copy{function}List((Class)({cls}), (unsigned int*){count_addr})"
     )
     ptr = expr_result.GetValueAsUnsigned()
     n = process.ReadUnsignedFromMemory(count_addr, 4, error)
     process.DeallocateMemory(count_addr, error)
 
-    print(f"{n} selectors", file=result)
-    for index in range(n):
-        name = getCstr(debugger, f"method_getName(((id*){ptr})[{index}])")
-        address = getValue(debugger, f"method_getImplementation(((id*){ptr})[{index}])")
-        print(f"{name} (0x{address:016x})", file=result)
+    data = _read_memory(process, ptr, n * 8) if ptr else None
+    handles = list(struct.unpack(f"<{n}Q", data)) if data is not None else []
+    return ptr, handles
+
+
+def _free_objc_list(debugger, ptr):
+    if ptr:
+        debugger.GetSelectedTarget().EvaluateExpression(f"(void) free((void*){ptr})")
+
+
+def _decode_objc_structs(process, handles, layout):
+    '''
+    Returns a dict of fields (or None where unreadable) per handle, per the
+    (format, names) layout, from one read per run of nearby structs
+    '''
+    fmt, names = layout
+    size = struct.calcsize(fmt)
+    raw = _read_structs(process, handles, size)
+    return [
+        dict(zip(names, struct.unpack(fmt, raw[handle]))) if raw.get(handle) is not None else None
+        for handle in handles
+    ]
 
-    target.EvaluateExpression(f"(void) free((void*){ptr})")
+
+def _decode_objc_methods(target, handles):
+    '''
+    Returns (name address, imp) per Method handle, either None where it
+    couldn't be decoded. Apple's small methods are resolved relative to
+    themselves, their selector only when the reference lands in
+    __objc_selrefs: shared-cache methods count from a selector base instead.
+    '''
+    process = target.GetProcess()
+    runtime = _objc_runtime(target)
+    decoded = {}
+
+    small = [handle for handle in handles if runtime == "apple" and handle & 1]
+    big = [handle for handle in handles if not (runtime == "apple" and handle & 1)]
+    for handle, fields in zip(big, _decode_objc_structs(process, big, _OBJC_LAYOUTS[runtime]["method"])):
+        if fields is not None:
+            decoded[handle] = (fields["name"], fields["imp"])
+
+    raw = _read_structs(process, [handle & ~3 for handle in small], struct.calcsize(_OBJC_SMALL_METHOD))
+    selrefs = {}
+    for handle in small:
+        base = handle & ~3
+        if raw.get(base) is None:
+            continue
+        name_offset, _, imp_offset = struct.unpack(_OBJC_SMALL_METHOD, raw[base])
+        decoded[handle] = (None, base + 8 + imp_offset)
+        section = target.ResolveLoadAddress(base + name_offset).GetSection()
+        if section.IsValid() and section.GetName() == "__objc_selrefs":
+            selrefs[handle] = base + name_offset
+    words = _read_structs(process, selrefs.values(), 8)
+    for handle, selref in selrefs.items():
+        if words.get(selref) is not None:
+            decoded[handle] = (struct.unpack("<Q", words[selref])[0], decoded[handle][1])
+
+    if runtime == "gnustep":
+        # a SEL points at a struct objc_selector whose first word is the
+        # name, or a table index once registered (left to sel_getName)
+        words = _read_structs(process, [name for name, _ in decoded.values() if name], 8)
+        for handle, (name, imp) in decoded.items():
+            word = struct.unpack("<Q", words[name])[0] if words.get(name) is not None else 0
+            decoded[handle] = (word if word > 0xffff else None, imp)
+
+    # arm64e signs implementation pointers
+    fix = getattr(process, "FixAddress", None)
+    return [
+        (name, fix(imp) if fix is not None and imp else imp)
+        for name, imp in (decoded.get(handle, (None, None)) for handle in handles)
+    ]
+
+
+# struct formats of the scalar ivar type encodings; pointers ("^", "*", "#",
+# ":") print as addresses and objects ("@") by their description
+_IVAR_SCALARS = {
+    "c": "<b", "C": "<B", "s": "<h", "S": "<H", "i": "<i", "I": "<I", "l": "<i", "L": "<I",
+    "q": "<q", "Q": "<Q", "f": "<f", "d": "<d", "B": "<?",
+}
+
+
+def _format_ivar(target, address, encoding, data):
+    '''
+    Renders the ivar value data, read from address, per its type encoding
+    '''
+    kind = encoding.lstrip("rnNoORV")[:1]
+    if kind in _IVAR_SCALARS and len(data) >= struct.calcsize(_IVAR_SCALARS[kind]):
+        return str(struct.unpack_from(_IVAR_SCALARS[kind], data)[0])
+    if kind in ("@", "^", "*", "#", ":") and len(data) >= 8:
+        pointer = struct.unpack_from("<Q", data)[0]
+        if kind != "@" or not pointer:
+            return f"0x{pointer:x}" if pointer else "nil"
+        value = target.CreateValueFromAddress("ivar", lldb.SBAddress(address, target),
+                                              target.GetBasicType(lldb.eBasicTypeObjCID))
+        return value.GetObjectDescription() or f"0x{pointer:x}"
+    return f"<{encoding}: {data[:32].hex()}>"
+
+
+def _objc_method_list(debugger, cls):
+    '''
+    Returns [(selector name, implementation)] of the methods of class cls
+    '''
+    target = debugger.GetSelectedTarget()
+    ptr, handles = _copy_objc_list(debugger, "Method", cls)
+    decoded = _decode_objc_methods(target, handles)
+    names = _read_cstrings(target.GetProcess(), [name for name, _ in decoded])
+    methods = []
+    for index, (name, address) in enumerate(decoded):
+        name = names.get(name)
+        if name is None:
+            name = (getCstr(debugger, f"method_getName(((id*){ptr})[{index}])") or "").strip('"')
+        if address is None:
+            address = getValue(debugger, f"method_getImplementation(((id*){ptr})[{index}])") or 0
+        methods.append((name, address))
+    _free_objc_list(debugger, ptr)
+    return methods
+
+
+def _objc_property_list(debugger, cls):
+    '''
+    Returns [(name, attributes)] of the properties of class cls
+    '''
+    target = debugger.GetSelectedTarget()
+    process = target.GetProcess()
+    ptr, handles = _copy_objc_list(debugger, "Property", cls)
+    fields = _decode_objc_structs(process, handles, _OBJC_LAYOUTS[_objc_runtime(target)]["property"])
+    strings = _read_cstrings(process, [f[key] for f in fields if f for key in ("name", "attributes")])
+    properties = []
+    for index, f in enumerate(fields):
+        name = strings.get(f["name"]) if f else None
+        attr = strings.get(f["attributes"]) if f else None
+        if name is None:
+            name = (getCstr(debugger, f"property_getName(((id*){ptr})[{index}])") or "").strip('"')
+        if attr is None:
+            attr = (getCstr(debugger, f"property_getAttributes(((id*){ptr})[{index}])") or "").strip('"')
+        properties.append((name, attr))
+    _free_objc_list(debugger, ptr)
+    return properties
+
+
+def _objc_ivar_list(debugger, cls):
+    '''
+    Returns [(name, offset, type encoding, size, Ivar handle)] of the ivars
+    of class cls, offset None for those that couldn't be decoded
+    '''
+    target = debugger.GetSelectedTarget()
+    process = target.GetProcess()
+    ptr, handles = _copy_objc_list(debugger, "Ivar", cls)
+    fields = _decode_objc_structs(process, handles, _OBJC_LAYOUTS[_objc_runtime(target)]["ivar"])
+    offsets = _read_structs(process, [f["offset"] for f in fields if f and f["offset"]], 4)
+    strings = _read_cstrings(process, [f[key] for f in fields if f for key in ("name", "type")])
+    ivars = []
+    for index, (handle, f) in enumerate(zip(handles, fields)):
+        name = strings.get(f["name"]) if f else None
+        encoding = strings.get(f["type"]) if f else None
+        offset = offsets.get(f["offset"]) if f else None
+        if name is None:
+            name = (getCstr(debugger, f"ivar_getName(((id*){ptr})[{index}])") or "").strip('"')
+        if offset is None or encoding is None:
+            ivars.append((name, None, None, None, handle))
+        else:
+            ivars.append((name, struct.unpack("<i", offset)[0], encoding, f["size"] or 8, handle))
+    _free_objc_list(debugger, ptr)
+    return ivars
+
+
+def _objc_ivar_value(debugger, obj, ivar):
+    '''
+    Renders the value of ivar, an _objc_ivar_list entry, in object obj with
+    one memory read, or through object_getIvar if it wasn't decoded
+    '''
+    target = debugger.GetSelectedTarget()
+    _, offset, encoding, size, handle = ivar
+    data = _read_memory(target.GetProcess(), obj + offset, size) if offset is not None else None
+    if data is None:
+        return target.EvaluateExpression(
+            f"object_getIvar((id){obj}, (void*){handle})"
+        ).GetObjectDescription() or ''
+    return _format_ivar(target, obj + offset, encoding, data)
+
+
+class _ObjCClass:
+    '''
+    What the introspection commands have learnt about one class; the lists
+    are filled in on first use
+    '''
+    def __init__(self, name, superclass):
+        self.name = name
+        self.superclass = superclass
+        self.methods = None
+        self.properties = None
+        self.ivars = None
+
+
+class _ModuleWatch:
+    '''
+    Tells whether any target it has been shown has loaded or unloaded
+    modules since the last call, through an SBListener of its own on each
+    target's broadcaster
+    '''
+    MODULE_EVENTS = ("eBroadcastBitModulesLoaded", "eBroadcastBitModulesUnloaded")
+
+    def __init__(self, name):
+        self._name = name
+        self._listener = None
+        self._targets = []
+
+    def changed(self, target):
+        if self._listener is None:
+            self._listener = lldb.SBListener(self._name)
+        if not any(target == watched for watched in self._targets):
+            mask = 0
+            for name in self.MODULE_EVENTS:
+                mask |= getattr(lldb.SBTarget, name, 0)
+            target.GetBroadcaster().AddListener(self._listener, mask)
+            self._targets.append(target)
+        changed = False
+        event = lldb.SBEvent()
+        while self._listener.GetNextEvent(event):
+            changed = True
+        return changed
+
+
+class _ObjCClassCache:
+    '''
+    _ObjCClass records keyed by process and class pointer, shared by
+    dumpselectors, dumpproperties and dumpivars. Any module load or unload
+    (a dlopen'd image, new categories, an unloaded bundle) drops the lot
+    before the next lookup.
+    '''
+    def __init__(self):
+        self._classes = {}
+        self._modules = _ModuleWatch("lldb_funcs.objc_classes")
+
+    def classes(self, target):
+        '''
+        Returns the {class pointer: _ObjCClass} of target's process
+        '''
+        if self._modules.changed(target):
+            self._classes.clear()
+        return self._classes.setdefault(target.GetProcess().GetUniqueID(), {})
+
+_objc_classes = _ObjCClassCache()
+
+
+# masks that take the class pointer out of objc4's non-pointer isa
+_ISA_MASKS = (("arm64e", 0x007ffffffffffff8), ("arm64", 0x0000000ffffffff8), ("x86_64", 0x00007ffffffffff8))
+
+
+def _isa_mask(triple):
+    if "apple" in triple:
+        for arch, mask in _ISA_MASKS:
+            if triple.startswith(arch):
+                return mask
+    return ~7
+
+
+def _objc_object(debugger, expr, classes):
+    '''
+    Returns (object address, class pointer) for the object expression expr.
+    A variable or address needs no expression evaluation, nor does its class
+    when its isa leads to a class already in classes.
+    '''
+    target = debugger.GetSelectedTarget()
+    process = target.GetProcess()
+    try:
+        obj = int(expr, 0)
+    except ValueError:
+        value = process.GetSelectedThread().GetSelectedFrame().GetValueForVariablePath(expr)
+        if value.IsValid() and value.GetError().Success():
+            obj = value.GetValueAsUnsigned()
+        else:
+            obj = getValue(debugger, expr)
+    if not obj:
+        return obj, None
+
+    isa = _read_memory(process, obj, 8) if classes else None
+    if isa is not None:
+        cls = struct.unpack("<Q", isa)[0] & _isa_mask(target.GetTriple() or "")
+        if cls in classes:
+            return obj, cls
+    return obj, getValue(debugger, f"[(id){obj} class]")
+
+
+def _objc_class(debugger, cls, classes):
+    '''
+    Returns the _ObjCClass for class pointer cls, from classes if there
+    '''
+    record = classes.get(cls)
+    if record is None:
+        name = (getCstr(debugger, f"class_getName((Class){cls})") or "").strip('"')
+        # superclass is the second word of both runtimes' struct objc_class
+        word = _read_memory(debugger.GetSelectedTarget().GetProcess(), cls + 8, 8)
+        if word is not None:
+            superclass = struct.unpack("<Q", word)[0]
+        else:
+            superclass = getValue(debugger, f"[(Class){cls} superclass]") or 0
+        record = classes[cls] = _ObjCClass(name, superclass)
+    return record
+
+
+def _objc_parser(description):
+    parser = argparse.ArgumentParser(prog=__name__)
+    parser.add_argument("object", help=f"object to dump {description} on")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="look everything up again instead of using the class cache")
+    return parser
+
+
+def dumpselectors(debugger, command, result, internal_dict):
+    '''
+    Prints out all selectors defined in an object (does not include superclass
+    methods)
+    '''
+    args = _objc_parser("selectors").parse_args(shlex.split(command))
+
+    target = debugger.GetSelectedTarget()
+    classes = {} if args.no_cache else _objc_classes.classes(target)
+    _, cls = _objc_object(debugger, args.object, classes)
+    if not cls:
+        print(f"dumpselectors: cannot find the class of {args.object}", file=result)
+        return
+    record = _objc_class(debugger, cls, classes)
+    if record.methods is None:
+        record.methods = _objc_method_list(debugger, cls)
+
+    print(f"{len(record.methods)} selectors", file=result)
+    for name, address in record.methods:
+        print(f"{name} (0x{address:016x})", file=result)
 
 
 def dumpproperties(debugger, command, result, internal_dict):
@@ -77,71 +503,51 @@ def dumpproperties(debugger, command, result, internal_dict):
     Prints out all properties for an object (does not include superclass
     properties)
     '''
-    parser = argparse.ArgumentParser(prog=__name__)
-    parser.add_argument("object", help="object to dump properties on")
-    args = parser.parse_args(shlex.split(command))
+    args = _objc_parser("properties").parse_args(shlex.split(command))
 
     target = debugger.GetSelectedTarget()
-    process = target.GetProcess()
-    error = lldb.SBError()
-    count_addr = process.AllocateMemory(4, lldb.ePermissionsReadable | lldb.ePermissionsWritable, error)
-
-    expr_result = target.EvaluateExpression(
-        f"(id*) class_copyPropertyList((Class)[{args.object} class], (unsigned int*){count_addr})"
-    )
-    ptr = expr_result.GetValueAsUnsigned()
-    n = process.ReadUnsignedFromMemory(count_addr, 4, error)
-    process.DeallocateMemory(count_addr, error)
+    classes = {} if args.no_cache else _objc_classes.classes(target)
+    _, cls = _objc_object(debugger, args.object, classes)
+    if not cls:
+        print(f"dumpproperties: cannot find the class of {args.object}", file=result)
+        return
+    record = _objc_class(debugger, cls, classes)
+    if record.properties is None:
+        record.properties = _objc_property_list(debugger, cls)
 
-    print(f"{n} properties", file=result)
-    for index in range(n):
-        name = getCstr(debugger, f"property_getName(((id*){ptr})[{index}])")
-        attr = getCstr(debugger, f"property_getAttributes(((id*){ptr})[{index}])")
+    print(f"{len(record.properties)} properties", file=result)
+    for name, attr in record.properties:
+        # the value is whatever the getter returns, so that still runs code
         val = target.EvaluateExpression(f"[{args.object} {name}]").GetObjectDescription() or ''
         print(f"{name} ({attr}) = {val}", file=result)
 
-    target.EvaluateExpression(f"(void) free((void*){ptr})")
-
 
 def dumpivars(debugger, command, result, internal_dict):
     '''
     Prints out all ivars for an object
     '''
-    parser = argparse.ArgumentParser(prog=__name__)
-    parser.add_argument("object", help="object to dump ivars on")
-    args = parser.parse_args(shlex.split(command))
+    args = _objc_parser("ivars").parse_args(shlex.split(command))
 
     target = debugger.GetSelectedTarget()
-    process = target.GetProcess()
-
-    cls = getValue(debugger, f"[{args.object} class]")
+    classes = {} if args.no_cache else _objc_classes.classes(target)
+    obj, cls = _objc_object(debugger, args.object, classes)
+    if not obj:
+        print(f"dumpivars: cannot evaluate {args.object}", file=result)
+        return
     name = args.object
     while cls:
-        clsname = getCstr(debugger, f"class_getName({cls})")
-        name += "." + clsname
+        record = _objc_class(debugger, cls, classes)
+        name += "." + record.name
         print(name, file=result)
+        if record.ivars is None:
+            record.ivars = _objc_ivar_list(debugger, cls)
 
-        error = lldb.SBError()
-        count_addr = process.AllocateMemory(4, lldb.ePermissionsReadable | lldb.ePermissionsWritable, error)
-        # Using id as cannot seem to find type Ivar
-        expr_result = target.EvaluateExpression(
-            f"(id*) class_copyIvarList((Class){cls}, (unsigned int*){count_addr})"
-        )
-        ptr = expr_result.GetValueAsUnsigned()
-        n = process.ReadUnsignedFromMemory(count_addr, 4, error)
-        process.DeallocateMemory(count_addr, error)
-
+        n = len(record.ivars)
         print(f"{n} ivar{'s' if n>1 else ''}", file=result)
-        for index in range(n):
-            ivarname = getCstr(debugger, f"ivar_getName(((id*){ptr})[{index}])")
-            val = target.EvaluateExpression(
-                f"object_getIvar({args.object}, ((id*){ptr})[{index}])"
-            ).GetObjectDescription() or ''
-            print(f"{ivarname} = {val}", file=result)
-
-        target.EvaluateExpression(f"(void) free((void*){ptr})")
+        for ivar in record.ivars:
+            print(f"{ivar[0]} = {_objc_ivar_value(debugger, obj, ivar)}", file=result)
         print(file=result)
-        cls = getValue(debugger, f"[{cls} superclass]")
+        cls = record.superclass
 
 
 def printflags(debugger, command, result, internal_dict):
@@ -186,47 +592,183 @@ def printflags(debugger, command, result, internal_dict):
     result.write(' '.join(rendered_flags) + '\n')
 
 
+# bytes of a std::basic_string object, whatever its character type
+_STDSTRING_SIZE = {"libstdc++": 32, "libc++": 24}
+# a longer length means a garbage header rather than a string
+_STDSTRING_MAX = 1 << 30
+_STDSTRING_ENCODINGS = {1: "utf-8", 2: "utf-16-le", 4: "utf-32-le"}
+_STDSTRING_TYPES = (
+    r"^std::(__1::|__ndk1::|__cxx11::)?basic_string<.+>$",
+    r"^std::(__1::|__ndk1::|__cxx11::)?(string|wstring|u8string|u16string|u32string)$",
+)
+# characters shown by the summary provider; set with stdstringsummary --cap,
+# by default lldb's target.max-string-summary-length
+stdstring_summary_cap = 1024
+
+
+def _detect_stdstring_impl(type_name, address, header):
+    '''
+    Returns the std::string layout: from the type's namespace if it gives it
+    away (libc++'s std::__1, libstdc++'s std::__cxx11), else by checking
+    whether the first word is a plausible data pointer (libstdc++) or an
+    inline SSO byte (libc++)
+    '''
+    if "::__1::" in type_name or "::__ndk1::" in type_name:
+        return "libc++"
+    if "::__cxx11::" in type_name:
+        return "libstdc++"
+    pointer, length, capacity = struct.unpack_from("<QQQ", header)
+    # libstdc++'s _M_p either points into the object's own SSO buffer
+    # (obj+16) or to a separate heap allocation of more than 15 bytes.
+    # libc++'s first word is a length/flags byte plus inline characters, or
+    # an odd capacity for a long string.
+    if pointer == address + 16:
+        return "libstdc++"
+    if pointer > 0x1000 and not pointer & 1 and 15 < length <= capacity < _STDSTRING_MAX:
+        return "libstdc++"
+    return "libc++"
+
+
+def _stdstring_extent(address, header, impl, width):
+    '''
+    Returns (data address, length in characters, inline data or None) of
+    the std::basic_string of width-byte characters at address, whose first
+    bytes are header
+    '''
+    if impl == "libstdc++":
+        # first word points at the data, SSO buffer (obj+16) or heap
+        pointer, length = struct.unpack_from("<QQ", header)
+        inline = header[16:16 + length * width] if pointer == address + 16 else b""
+        return pointer, length, inline if len(inline) == length * width else None
+    # libc++: low bit of the first byte flags a long (heap) string; a short
+    # one keeps length << 1 there and its characters from the next
+    # character-aligned offset on
+    if header[0] & 1:
+        length, pointer = struct.unpack_from("<QQ", header, 8)
+        return pointer, length, None
+    length = header[0] >> 1
+    return address + width, length, header[width:width + length * width]
+
+
+def _stdstring_width(sbtype):
+    '''
+    Returns the character size of a std::basic_string SBType, 1 if unknown
+    '''
+    sbtype = sbtype.GetCanonicalType()
+    if sbtype.IsPointerType() or sbtype.IsReferenceType():
+        sbtype = sbtype.GetPointeeType().GetCanonicalType()
+    argument = sbtype.GetTemplateArgumentType(0)
+    if argument.IsValid() and argument.GetByteSize() in _STDSTRING_ENCODINGS:
+        return argument.GetByteSize()
+    name = sbtype.GetName() or ""
+    for marker, width in (("char16_t", 2), ("char32_t", 4), ("wchar_t", 4)):
+        if f"<{marker}" in name:
+            return width
+    return 1
+
+
+def _read_stdstring(process, address, header, impl, width, cap):
+    '''
+    Returns (text, whether it was cut at cap characters) of the string at
+    address, or None if it can't be read
+    '''
+    pointer, length, inline = _stdstring_extent(address, header, impl, width)
+    if length > _STDSTRING_MAX:
+        return None
+    shown = min(length, cap)
+    data = inline[:shown * width] if inline is not None else _read_memory(process, pointer, shown * width)
+    if data is None:
+        return None
+    return data.decode(_STDSTRING_ENCODINGS[width], "backslashreplace"), shown < length
+
+
+def stdstring_summary(valobj, internal_dict, options=None):
+    '''
+    Summary provider for std::string, std::wstring, std::u16string and
+    std::u32string of libc++ and libstdc++, decoded from the object's bytes
+    without evaluating expressions
+    '''
+    if valobj.GetType().IsPointerType():
+        valobj = valobj.Dereference()
+    sbtype = valobj.GetType().GetCanonicalType()
+    error = lldb.SBError()
+    header = bytes(valobj.GetData().ReadRawData(error, 0, valobj.GetByteSize()) or b"")
+    if not error.Success() or len(header) < _STDSTRING_SIZE["libc++"]:
+        return None
+    address = valobj.GetLoadAddress()
+    impl = _detect_stdstring_impl(sbtype.GetName() or "", address, header)
+    width = _stdstring_width(sbtype)
+    decoded = _read_stdstring(valobj.GetProcess(), address, header, impl, width, stdstring_summary_cap)
+    if decoded is None:
+        return None
+    text, cut = decoded
+    prefix = {1: "", 2: "u", 4: "U"}[width]
+    if width == 4 and "wchar_t" in (sbtype.GetName() or ""):
+        prefix = "L"
+    escaped = text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'{prefix}"{escaped}"{"..." if cut else ""}'
+
+
+def stdstringsummary(debugger, command, result, internal_dict):
+    '''
+    Sets how many characters the std::string summaries show
+    '''
+    global stdstring_summary_cap
+    parser = argparse.ArgumentParser(prog=__name__)
+    parser.add_argument("--cap", type=int, help="characters to show before cutting a string off")
+    args = parser.parse_args(shlex.split(command))
+    if args.cap is not None:
+        stdstring_summary_cap = max(args.cap, 0)
+    print(f"std::string summaries show up to {stdstring_summary_cap} characters", file=result)
+
+
 def printstdstring(debugger, command, result, internal_dict):
     '''
     Prints out a string from std::string object
     '''
-    # todo: add wchar detection
     parser = argparse.ArgumentParser(prog=__name__)
-    parser.add_argument("object", help="std::string object")
+    parser.add_argument("object", help="std::string object, pointer to one or address")
     parser.add_argument("--impl", choices=("libc++", "libstdc++"),
                         help="force a standard-library layout instead of autodetecting")
+    parser.add_argument("--width", type=int, choices=(1, 2, 4),
+                        help="character size for an address (default: from the type, else 1)")
     args = parser.parse_args(shlex.split(command))
 
-    impl = args.impl or _detect_stdstring_impl(debugger, args.object)
-    if impl == "libstdc++":
-        # first word points directly at the character data (SSO or heap)
-        outstring = getCstr(debugger, f"*(char **) ({args.object})")
-    else:
-        # libc++: low bit of the first byte flags a long (heap) string
-        pseudo_length = getValue(debugger, f"*(unsigned char*) {args.object}")
-        if pseudo_length & 1:
-            outstring = getCstr(debugger, f"*(char **) ({args.object}+16)")
+    target = debugger.GetSelectedTarget()
+    process = target.GetProcess()
+    try:
+        address = int(args.object, 0)
+        type_name = ""
+        width = 1
+    except ValueError:
+        value = process.GetSelectedThread().GetSelectedFrame().GetValueForVariablePath(args.object)
+        if not (value.IsValid() and value.GetError().Success()):
+            value = target.EvaluateExpression(args.object)
+        if not (value.IsValid() and value.GetError().Success()):
+            print(f"printstdstring: cannot evaluate {args.object}", file=result)
+            return
+        if value.GetType().GetCanonicalType().GetTypeClass() == lldb.eTypeClassBuiltin:
+            # a register or integer expression holding the address
+            address = value.GetValueAsUnsigned()
+            type_name = ""
+            width = 1
         else:
-            outstring = getCstr(debugger, f"({args.object}+1)")
-
-    print(outstring, file=result)
-
-
-def _detect_stdstring_impl(debugger, obj):
-    '''
-    Guess the std::string layout by checking whether the first word is a
-    plausible data pointer (libstdc++) or an inline SSO byte (libc++).
-    '''
-    first_word = getValue(debugger, f"*(unsigned long *) ({obj})")
-    if first_word is None:
-        return "libc++"
-    # libstdc++'s _M_p either points into the object's own SSO buffer
-    # (obj+16) or to a separate heap allocation; either way it's a real,
-    # non-trivial pointer. libc++'s first word is a length/flags byte.
-    obj_addr = getValue(debugger, f"(unsigned long)({obj})")
-    if first_word == (obj_addr + 16) or first_word > 0x1000:
-        return "libstdc++"
-    return "libc++"
+            if value.GetType().IsPointerType():
+                value = value.Dereference()
+            address = value.GetLoadAddress()
+            type_name = value.GetType().GetCanonicalType().GetName() or ""
+            width = _stdstring_width(value.GetType())
+
+    header = _read_memory(process, address, _STDSTRING_SIZE["libc++"])
+    if header is None:
+        print(f"printstdstring: cannot read memory at 0x{address:x}", file=result)
+        return
+    impl = args.impl or _detect_stdstring_impl(type_name, address, header)
+    decoded = _read_stdstring(process, address, header, impl, args.width or width, _STDSTRING_MAX)
+    if decoded is None:
+        print(f"printstdstring: 0x{address:x} does not look like a {impl} string", file=result)
+        return
+    print(decoded[0], file=result)
 
 
 def fsa(debugger, command, result, internal_dict):
@@ -239,134 +781,336 @@ def fsa(debugger, command, result, internal_dict):
 fscript_framework = '/Library/Frameworks/FScript.framework'
 
 
+def _site_index(target, pc):
+    '''
+    Returns the insn_sites.SiteIndex of the code section holding pc, or None
+    '''
+    sbaddress = target.ResolveLoadAddress(pc)
+    section = sbaddress.GetSection()
+    if not section.IsValid() or section.GetName() not in ('.text', '__text'):
+        return None
+    process = target.GetProcess()
+
+    def read(address, size):
+        error = lldb.SBError()
+        code = process.ReadMemory(address, size, error)
+        if not error.Success():
+            raise ValueError(error.GetCString())
+        return code
+
+    def disassemble(address, code):
+        for instr in target.GetInstructions(lldb.SBAddress(address, target), code):
+            yield address, instr.GetByteSize(), f"{instr.GetMnemonic(target)} {instr.GetOperands(target)}"
+            address += instr.GetByteSize()
+
+    return insn_sites.load_or_build(sbaddress.GetModule().GetUUIDString(), section.GetLoadAddress(target),
+                                    section.GetByteSize(), target.GetTriple() or '', read, disassemble)
+
+
+class _InsnCache:
+    '''
+    insn_sites flags of the instructions the scripted steps have stopped at,
+    per process and load address, with the instruction bytes they were
+    decoded from. lldb has no event for memory writes, so an entry is only
+    used while the bytes at its address still match (one small read, where
+    decoding costs a disassembly); module loads and unloads drop everything.
+    '''
+    def __init__(self):
+        self._processes = {}
+        self._modules = _ModuleWatch("lldb_funcs.insn_cache")
+
+    def table(self, target):
+        '''
+        Returns the {load address: (flags, bytes)} of target's process
+        '''
+        if self._modules.changed(target):
+            self._processes.clear()
+        return self._processes.setdefault(target.GetProcess().GetUniqueID(), {})
+
+_insn_cache = _InsnCache()
+
+
 class ScriptedStepBase:
+    '''
+    Steps until the instruction at the pc has one of the insn_sites flags in
+    MATCH. Inside an indexed code section it runs to the next control-flow or
+    matching site instead of stepping through every instruction.
+    '''
+    MATCH = 0
+    # the run-to-address plan taking us to the next site, if any
+    run_to = None
+    # the SiteIndex the pc was last in
+    index = None
+
     def __init__(self, thread_plan, internal_dict):
         self.thread_plan = thread_plan
-
-    def _is_aarch64(self):
-        target = self.thread_plan.GetThread().GetProcess().GetTarget()
-        triple = target.GetTriple() or ''
+        # a plan lives on one thread of one target, so look these up once
+        self.thread = thread_plan.GetThread()
+        self.process = self.thread.GetProcess()
+        self.target = self.process.GetTarget()
+        triple = self.target.GetTriple() or ''
         arch = triple.split('-', 1)[0]
-        return 'aarch64' in arch or 'arm64' in arch or arch.startswith('arm')
+        self.aarch64 = 'aarch64' in arch or 'arm64' in arch or arch.startswith('arm')
+
+    def _flags(self, pc):
+        table = _insn_cache.table(self.target)
+        cached = table.get(pc)
+        if cached is not None and _read_memory(self.process, pc, len(cached[1])) == cached[1]:
+            return cached[0]
+        instr = self.target.ReadInstructions(lldb.SBAddress(pc, self.target), 1)[0]
+        asm = f"{instr.GetMnemonic(self.target)} {instr.GetOperands(self.target)}"
+        flags = insn_sites.classify_asm(asm, self.aarch64)[0]
+        data = _read_memory(self.process, pc, instr.GetByteSize())
+        if data:
+            table[pc] = (flags, data)
+        return flags
+
+    def _matches(self, flags):
+        return bool(flags & self.MATCH)
 
     def explains_stop(self, event):
         ''' Returns true if this explains why the execution was halted '''
         # We are stepping, so if we stop for any other reason, it isn't
         # because of us.
-        return self.thread_plan.GetThread().GetStopReason() == lldb.eStopReasonTrace
+        return self.thread.GetStopReason() == lldb.eStopReasonTrace
 
     def should_stop(self, event):
-        '''
-        Should debugger stop or continue
-        Notimplemented in base class
-        '''
-        return True
+        ''' Stop only when the instruction at the pc matches '''
+        pc = self.thread.GetFrameAtIndex(0).GetPC()
+        flags = self._flags(pc)
+        if self._matches(flags):
+            self.thread_plan.SetPlanComplete(True)
+            return True
+
+        self.run_to = None
+        if not flags & insn_sites.CONTROL:
+            if self.index is None or not self.index.covers(pc):
+                self.index = _site_index(self.target, pc)
+            # only trust the index from an instruction its decode agrees on
+            if self.index is not None and self.index.ordinal(pc) is not None:
+                stop = self.index.next_site(pc, insn_sites.CONTROL | self.MATCH)
+                if stop is not None and stop != pc:
+                    self.run_to = self.thread_plan.QueueThreadPlanForRunToAddress(
+                        lldb.SBAddress(stop, self.target))
+        return False
 
     def should_step(self):
-        ''' Should be enabled '''
-        return True
+        ''' Step, unless running to the next site '''
+        return self.run_to is None
 
 
 class ScriptedStepToCall(ScriptedStepBase):
-    def should_stop(self, event):
-        ''' Stop only when we have reached a call instruction '''
-        cur_pc = self.thread_plan.GetThread().GetFrameAtIndex(0).GetPCAddress()
-        target = self.thread_plan.GetThread().GetProcess().GetTarget()
-        instr = target.ReadInstructions(cur_pc, 1)[0]
-        mnemonic = instr.GetMnemonic(target)
-        # x86: call; AArch64: bl (branch-with-link) / blr (register form)
-        if self._is_aarch64():
-            is_call = mnemonic in ('bl', 'blr')
-        else:
-            is_call = 'call' in mnemonic
-        if is_call:
-            self.thread_plan.SetPlanComplete(True)
-            return True
-        else:
-            return False
+    ''' Steps to the next call instruction '''
+    MATCH = insn_sites.CALL
 
 
 class ScriptedStepToBranch(ScriptedStepBase):
-    def should_stop(self, event):
-        ''' Stop only when we have reached a branch instruction '''
-        cur_pc = self.thread_plan.GetThread().GetFrameAtIndex(0).GetPCAddress()
-        target = self.thread_plan.GetThread().GetProcess().GetTarget()
-        instr = target.ReadInstructions(cur_pc, 1)[0]
-        if instr.DoesBranch():
-            self.thread_plan.SetPlanComplete(True)
-            return True
-        else:
-            return False
+    ''' Steps to the next branch instruction '''
+    MATCH = insn_sites.BRANCH
 
 
 class ScriptedStepToSyscall(ScriptedStepBase):
-    def should_stop(self, event):
-        ''' Stop only when we have reached a system call instruction '''
-        cur_pc = self.thread_plan.GetThread().GetFrameAtIndex(0).GetPCAddress()
-        target = self.thread_plan.GetThread().GetProcess().GetTarget()
-        instr = target.ReadInstructions(cur_pc, 1)[0]
-        mnemonic = instr.GetMnemonic(target)
-        # x86: syscall/sysenter/int 0x80; AArch64: svc
-        if mnemonic in ('syscall', 'sysenter', 'svc') or \
-                (mnemonic == 'int' and '0x80' in instr.GetOperands(target)):
-            self.thread_plan.SetPlanComplete(True)
-            return True
-        else:
-            return False
+    ''' Steps to the next system call instruction '''
+    MATCH = insn_sites.SYSCALL
 
 
 class ScriptedStepToAntiDebug(ScriptedStepBase):
+    ''' Steps to the next potential anti-debug instruction (pushf / rdtsc) '''
+    MATCH = insn_sites.PUSHF | insn_sites.RDTSC
+
     def __init__(self, thread_plan, internal_dict):
         super().__init__(thread_plan, internal_dict)
         self.pushfSet = False
 
-    def should_stop(self, event):
-        ''' Stop only when we have reached a potential anti-debug instruction '''
-        cur_pc = self.thread_plan.GetThread().GetFrameAtIndex(0).GetPCAddress()
-        process = self.thread_plan.GetThread().GetProcess()
-        target = process.GetTarget()
-        instr = target.ReadInstructions(cur_pc, 1)[0]
+    def _matches(self, flags):
         if self.pushfSet:
             error = lldb.SBError()
-            sp = self.thread_plan.GetThread().GetFrameAtIndex(0).GetSP()
-            flags = process.ReadUnsignedFromMemory(sp, 2, error)
+            sp = self.thread.GetFrameAtIndex(0).GetSP()
+            flags = self.process.ReadUnsignedFromMemory(sp, 2, error)
             flags &= 0xfeff  # mask off the trap flag
             flagbytes = struct.pack('H', flags)
-            process.WriteMemory(sp, flagbytes, error)
+            self.process.WriteMemory(sp, flagbytes, error)
 
             # mask off the trap flag
 #            target.EvaluateExpression('*(unsigned short *)$rsp &= 0xfeff')
             self.pushfSet = False
-            self.thread_plan.SetPlanComplete(True)
             return True
-        if 'pushf' in instr.GetMnemonic(target):
+        if flags & insn_sites.PUSHF:
             self.pushfSet = True
-            self.thread_plan.SetPlanComplete(True)
             return True
-        if 'rdtsc' in instr.GetMnemonic(target):
-            self.thread_plan.SetPlanComplete(True)
-            return True
-        return False
+        return bool(flags & insn_sites.RDTSC)
+
+
+class _RangeIndex:
+    '''
+    Sorted, merged [start, end) address ranges, searched with bisect
+    '''
+    def __init__(self, ranges):
+        merged = []
+        for start, end in sorted(r for r in ranges if r[0] < r[1]):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.starts = [start for start, _ in merged]
+        self.ends = [end for _, end in merged]
+
+    def __contains__(self, address):
+        index = bisect.bisect_right(self.starts, address) - 1
+        return index >= 0 and address < self.ends[index]
+
+    def __len__(self):
+        return len(self.starts)
+
+
+def _walk_sections(module):
+    stack = list(module.section_iter())
+    while stack:
+        section = stack.pop()
+        yield section
+        stack.extend(section.GetSubSectionAtIndex(i) for i in range(section.GetNumSubSections()))
+
+
+def _code_ranges(target, specs):
+    '''
+    Returns ([(start, end)], [module]) of the loaded code that specs name.
+    A spec is MODULE (its code sections), SECTION (of the main executable)
+    or MODULE:SECTION, modules by file name; no specs means the main
+    executable's code.
+    '''
+    modules = {module.GetFileSpec().GetFilename(): module for module in target.module_iter()}
+    main = target.GetModuleAtIndex(0)
+    ranges = []
+    used = []
+    for spec in specs or [main.GetFileSpec().GetFilename()]:
+        module_name, _, section_name = spec.rpartition(':')
+        if not module_name and section_name in modules:
+            module_name, section_name = section_name, ''
+        module = modules.get(module_name) if module_name else main
+        if module is None:
+            raise ValueError(f"no module named {module_name}")
+        for section in _walk_sections(module):
+            if section_name:
+                if section.GetName() != section_name:
+                    continue
+            elif section.GetSectionType() != lldb.eSectionTypeCode:
+                continue
+            start = section.GetLoadAddress(target)
+            if start != lldb.LLDB_INVALID_ADDRESS:
+                ranges.append((start, start + section.GetByteSize()))
+        used.append(module)
+    return ranges, used
 
 
 class ScriptedStepToTarget(ScriptedStepBase):
-    def __init__(self, thread_plan, internal_dict):
-        self.thread_plan = thread_plan
-        target = self.thread_plan.GetThread().GetProcess().GetTarget()
-        module = target.GetModuleAtIndex(0)
-        # __TEXT is the Mach-O code segment; .text the ELF code section
-        text_section = module.FindSection('__TEXT') or module.FindSection('.text')
-        self.start_addr = text_section.GetLoadAddress(target)
-        self.end_addr = self.start_addr + text_section.GetByteSize()
+    '''
+    Steps until the pc is in the code given by the "ranges" argument (see
+    steptotarget), by default the main executable's. Outside it the thread
+    runs at full speed: out to the youngest frame whose return address is
+    inside, or to a one-shot breakpoint on every function entry of the
+    target modules, whichever comes first. So code that calls back into the
+    ranges before returning there is stopped at too.
+    '''
+    # breakpoint name of the entry breakpoints, so a plan discarded without
+    # deleting its own (on a user breakpoint, a signal, an interrupt) can't
+    # leave it behind past the next ct
+    ENTRY_BP_NAME = "lldb_funcs_steptotarget"
+    # one-shot breakpoint on the target modules' entries, while running
+    entry_bp = None
+
+    def __init__(self, thread_plan, args_data, internal_dict):
+        super().__init__(thread_plan, internal_dict)
+        leftovers = lldb.SBBreakpointList(self.target)
+        self.target.FindBreakpointsByName(self.ENTRY_BP_NAME, leftovers)
+        for index in range(leftovers.GetSize()):
+            self.target.BreakpointDelete(leftovers.GetBreakpointAtIndex(index).GetID())
+        ranges = args_data.GetValueForKey("ranges") if args_data is not None else None
+        specs = []
+        if ranges is not None and ranges.IsValid():
+            specs = [spec for spec in ranges.GetStringValue(4096).split(",") if spec]
+        code, self.modules = _code_ranges(self.target, specs)
+        self.ranges = _RangeIndex(code)
+
+    def __del__(self):
+        self._delete_entry_bp()
+
+    def _delete_entry_bp(self):
+        if self.entry_bp is not None:
+            self.target.BreakpointDelete(self.entry_bp.GetID())
+            self.entry_bp = None
+
+    def _arm_entry_bp(self):
+        modules = lldb.SBFileSpecList()
+        for module in self.modules:
+            modules.Append(module.GetFileSpec())
+        self.entry_bp = self.target.BreakpointCreateByRegex(".", modules, lldb.SBFileSpecList())
+        self.entry_bp.AddName(self.ENTRY_BP_NAME)
+        self.entry_bp.SetOneShot(True)
+        self.entry_bp.SetThreadID(self.thread.GetThreadID())
+
+    def explains_stop(self, event):
+        ''' Our steps, and hits of our entry breakpoint '''
+        reason = self.thread.GetStopReason()
+        if reason == lldb.eStopReasonTrace:
+            return True
+        if (reason == lldb.eStopReasonBreakpoint and self.entry_bp is not None
+                and self.thread.GetStopReasonDataAtIndex(0) == self.entry_bp.GetID()):
+            return True
+        # someone else's stop, which usually ends the plan; should it go on,
+        # should_stop sets the breakpoint up again
+        self._delete_entry_bp()
+        return False
 
     def should_stop(self, event):
-        ''' Stop only when we have reached a certain PC range '''
-        cur_pc = self.thread_plan.GetThread().GetFrameAtIndex(0).GetPC()
-        if self.start_addr <= cur_pc < self.end_addr:
+        ''' Stop only when the pc is in the target ranges '''
+        self._delete_entry_bp()
+        if self.run_to is not None and self.run_to.IsValid() and not self.run_to.IsPlanComplete():
+            # the entry breakpoint was hit before the return address
+            self.run_to.SetPlanComplete(False)
+        self.run_to = None
+        if self.thread.GetFrameAtIndex(0).GetPC() in self.ranges:
             self.thread_plan.SetPlanComplete(True)
             return True
+
+        for index in range(1, self.thread.GetNumFrames()):
+            if self.thread.GetFrameAtIndex(index).GetPC() in self.ranges:
+                # break on the return address into frame index: stepping
+                # out would also step past frames without debug info
+                self.run_to = self.thread_plan.QueueThreadPlanForRunToAddress(
+                    self.thread.GetFrameAtIndex(index).GetPCAddress())
+                break
+        self._arm_entry_bp()
         return False
 
+    def should_step(self):
+        ''' Step, unless running out or to an entry breakpoint '''
+        return self.run_to is None and self.entry_bp is None
+
+
+def steptotarget(debugger, command, result, internal_dict):
+    '''
+    Runs the selected thread until it is back in the given modules/sections
+    (default: the main executable), at full speed outside them
+    '''
+    parser = argparse.ArgumentParser(prog=__name__)
+    parser.add_argument("ranges", nargs="*", metavar="MODULE[:SECTION]",
+                        help="module file name, section of the main executable, or module:section")
+    args = parser.parse_args(shlex.split(command))
+
+    target = debugger.GetSelectedTarget()
+    try:
+        ranges, _ = _code_ranges(target, args.ranges)
+    except ValueError as error:
+        print(f"steptotarget: {error}", file=result)
+        return
+    if not ranges:
+        print("steptotarget: none of that code is loaded", file=result)
+        return
+    step = f"thread step-scripted -C {__name__}.ScriptedStepToTarget"
+    if args.ranges:
+        step += f" -k ranges -v {shlex.quote(','.join(args.ranges))}"
+    debugger.GetCommandInterpreter().HandleCommand(step, result)
+
 
 def __lldb_init_module(debugger, internal_dict):
     '''
@@ -385,7 +1129,21 @@ def __lldb_init_module(debugger, internal_dict):
 
     install_function(printflags, 'flags')
 
+    install_function(steptotarget)
+
     install_function(printstdstring)
+    install_function(stdstringsummary)
+
+    # lldb only calls the provider when it renders a matching value
+    setting = lldb.SBDebugger.GetInternalVariableValue("target.max-string-summary-length",
+                                                       debugger.GetInstanceName())
+    if setting.GetSize() and setting.GetStringAtIndex(0).isdigit():
+        global stdstring_summary_cap
+        stdstring_summary_cap = int(setting.GetStringAtIndex(0))
+    for pattern in _STDSTRING_TYPES:
+        debugger.HandleCommand(f"type summary add -w lldb_funcs -F {__name__}.stdstring_summary "
+                               f"-x '{pattern}'")
+    debugger.HandleCommand("type category enable lldb_funcs")
 
     install_function(nsviewtree)
 